@@ -8,6 +8,7 @@ from pathlib import Path
 import fire
 from moulinette.validate_student_data import validate_student_data
 from moulinette.evaluate_retrieval import calculate_recall_at_k_on_dataset
+from moulinette.benchmark_recall import benchmark_recall
 
 def load_json(path: str):
     with open(path, "r", encoding="utf-8") as file:
@@ -61,5 +62,8 @@ class Moulinette:
     def evaluate_student_answers(self, student_answer_path: str):
         pass
 
+    def benchmark_recall(self, n_questions: int = 100000, seed: int = 0):
+        return benchmark_recall(n_questions=n_questions, seed=seed)
+
 if __name__ == "__main__":
     fire.Fire(Moulinette)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import random
+import time
+from typing import List
+from moulinette.models import (
+    AnsweredQuestion,
+    MinimalSearchResults,
+    MinimalSource,
+    RagDataset,
+    StudentSearchResults,
+)
+from moulinette.evaluate_retrieval import (
+    build_eval_objects,
+    recall_at_k_reference,
+    recall_at_k_vectorized,
+)
+
+
+def make_synthetic_dataset(n_questions: int, n_files: int = 2000, k: int = 10, seed: int = 0):
+    """
+    Random questions with 1-3 true sources and k predictions each, 30% of them in a
+    true source's file; about half of the true sources get an overlapping prediction
+    at a random rank.
+    """
+    rng = random.Random(seed)
+    files = [f"data/raw/repo/module_{i}.py" for i in range(n_files)]
+
+    def random_source(file_path: str) -> MinimalSource:
+        start = rng.randrange(0, 50000)
+        return MinimalSource(file_path=file_path, first_character_index=start,
+                             last_character_index=start + rng.randrange(50, 2000))
+
+    questions, results = [], []
+    for i in range(n_questions):
+        true_sources = [random_source(rng.choice(files)) for _ in range(rng.randint(1, 3))]
+        # Retrievers often return other chunks of the right file
+        preds = [
+            random_source(rng.choice(true_sources).file_path if rng.random() < 0.3 else rng.choice(files))
+            for _ in range(k)
+        ]
+        for true in true_sources:
+            if rng.random() < 0.5:
+                shift = rng.randrange(-300, 300)
+                preds[rng.randrange(k)] = MinimalSource(
+                    file_path=true.file_path,
+                    first_character_index=max(0, true.first_character_index + shift),
+                    last_character_index=true.last_character_index + shift,
+                )
+        question_id = f"q{i}"
+        questions.append(AnsweredQuestion(question_id=question_id, question="?", sources=true_sources, answer=""))
+        results.append(MinimalSearchResults(question_id=question_id, retrieved_sources=preds))
+    return StudentSearchResults(search_results=results, k=k), RagDataset(rag_questions=questions)
+
+
+def benchmark_recall(n_questions: int = 100000, k_values: List[int] = [1, 3, 5, 10], seed: int = 0, repeat: int = 3):
+    """Times the reference and vectorized recall@k on a synthetic dataset and checks they agree."""
+    start = time.perf_counter()
+    student_search_results, rag_dataset = make_synthetic_dataset(n_questions, seed=seed)
+    eval_objects = build_eval_objects(student_search_results, rag_dataset)
+    print(f"Built {n_questions} synthetic questions in {time.perf_counter() - start:.2f}s")
+
+    timings = {}
+    outputs = {}
+    for name, func in (("reference", recall_at_k_reference), ("vectorized", recall_at_k_vectorized)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = func(eval_objects, 0.01, k_values)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+
+    identical = outputs["reference"] == outputs["vectorized"]
+    print("=" * 40)
+    print(f"Reference:  {timings['reference']:.3f}s")
+    print(f"Vectorized: {timings['vectorized']:.3f}s ({timings['reference'] / timings['vectorized']:.1f}x)")
+    print(f"Identical per-question scores: {identical}")
+    return identical
@@ -1,4 +1,7 @@
+from itertools import chain
+from operator import attrgetter
 from typing import List, Dict
+import numpy as np
 from moulinette.models import (
     MinimalSource,
     StudentSearchResults,
@@ -70,14 +73,83 @@ class EvalObject(BaseModel):
     true_sources: List[MinimalSource]
     pred_sources: List[MinimalSource]
 
-def calculate_recall_at_k_on_dataset(
-    student_search_results: StudentSearchResults,
-    rag_dataset: RagDataset,
+def recall_at_k_vectorized(
+    eval_objects: Dict[str, EvalObject],
     minimal_iou_threshold: float = 0.05,
     k_values: List[int] = [1, 3, 5, 10],
-) -> float:
+) -> Dict[str, List[float]]:
+    """
+    Same per-question scores as calculate_recall_at_k_for_one_question, for all
+    questions and all k at once.
 
-    total_questions = len(rag_dataset.rag_questions)
+    Only (true, predicted) source pairs of the same question and file are compared.
+    For every true source the rank of the first matching prediction is found, and
+    recall@k counts the true sources whose first hit ranks below k.
+    """
+    # Flatten true and predicted sources, with file paths mapped to integer ids
+    n_questions = len(eval_objects)
+    true_sources = list(chain.from_iterable(e.true_sources for e in eval_objects.values()))
+    pred_sources = list(chain.from_iterable(e.pred_sources for e in eval_objects.values()))
+    n_true = np.fromiter((len(e.true_sources) for e in eval_objects.values()), dtype=np.int64, count=n_questions)
+    n_preds = np.fromiter((len(e.pred_sources) for e in eval_objects.values()), dtype=np.int64, count=n_questions)
+    true_q = np.repeat(np.arange(n_questions), n_true)
+    pred_q = np.repeat(np.arange(n_questions), n_preds)
+    pred_rank = np.arange(len(pred_sources)) - np.repeat(np.cumsum(n_preds) - n_preds, n_preds)
+
+    def column(sources: List[MinimalSource], attribute: str) -> np.ndarray:
+        return np.fromiter(map(attrgetter(attribute), sources), dtype=np.int64, count=len(sources))
+
+    true_start, true_end = column(true_sources, "first_character_index"), column(true_sources, "last_character_index")
+    pred_start, pred_end = column(pred_sources, "first_character_index"), column(pred_sources, "last_character_index")
+    true_files = list(map(attrgetter("file_path"), true_sources))
+    pred_files = list(map(attrgetter("file_path"), pred_sources))
+    path_ids = {path: i for i, path in enumerate(dict.fromkeys(chain(true_files, pred_files)))}
+    true_path = np.fromiter(map(path_ids.__getitem__, true_files), dtype=np.int64, count=len(true_files))
+    pred_path = np.fromiter(map(path_ids.__getitem__, pred_files), dtype=np.int64, count=len(pred_files))
+
+    # Group predictions by (question, file) and find each true source's group
+    n_paths = max(len(path_ids), 1)
+    true_key = true_q * n_paths + true_path
+    pred_key = pred_q * n_paths + pred_path
+    order = np.argsort(pred_key, kind="stable")
+    sorted_keys = pred_key[order]
+    lo = np.searchsorted(sorted_keys, true_key, side="left")
+    hi = np.searchsorted(sorted_keys, true_key, side="right")
+
+    # Expand to one row per (true source, candidate prediction) pair
+    counts = hi - lo
+    pair_true = np.repeat(np.arange(len(true_key)), counts)
+    pair_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_pred = order[np.repeat(lo, counts) + pair_offsets]
+
+    s1, e1 = true_start[pair_true], true_end[pair_true]
+    s2, e2 = pred_start[pair_pred], pred_end[pair_pred]
+    assert not ((s1 == -1) | (e1 == -1) | (s2 == -1) | (e2 == -1)).any()
+    intersection = np.maximum(0, np.minimum(e1, e2) - np.maximum(s1, s2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = intersection / ((e1 - s1) + (e2 - s2) - intersection)
+    hit = iou > minimal_iou_threshold
+
+    # Rank of the first matching prediction of every true source (no match: never found)
+    first_hit = np.full(len(true_key), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_hit, pair_true[hit], pred_rank[pair_pred[hit]])
+
+    results = {}
+    for k in k_values:
+        found = np.bincount(true_q, weights=(first_hit < k), minlength=n_questions)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            recall = found / n_true
+        # No true sources: 1.0; nothing retrieved within k: 0.0
+        recall = np.where(np.minimum(n_preds, max(k, 0)) == 0, 0.0, recall)
+        recall = np.where(n_true == 0, 1.0, recall)
+        results[f"recall@{k}"] = recall.tolist()
+    return results
+
+
+def build_eval_objects(
+    student_search_results: StudentSearchResults,
+    rag_dataset: RagDataset,
+) -> Dict[str, EvalObject]:
     eval_objects: Dict[str, EvalObject] = {}
 
     for question in rag_dataset.rag_questions:
@@ -89,10 +161,15 @@ def calculate_recall_at_k_on_dataset(
     for student_search_result in student_search_results.search_results:
         eval_objects[student_search_result.question_id].pred_sources = student_search_result.retrieved_sources
 
-    print(f"Total number of questions: {total_questions}")
-    print(f"Total number of questions with sources: {len(eval_objects)}")
-    print(f"Total number of questions with student sources: {len([eval_object for eval_object in eval_objects.values() if eval_object.pred_sources])}")
+    return eval_objects
 
+
+def recall_at_k_reference(
+    eval_objects: Dict[str, EvalObject],
+    minimal_iou_threshold: float = 0.05,
+    k_values: List[int] = [1, 3, 5, 10],
+) -> Dict[str, List[float]]:
+    """Per-question scores, one calculate_recall_at_k_for_one_question call per question and k."""
     results = {f"recall@{k}": [] for k in k_values}
     for eval_object in eval_objects.values():
         for k in k_values:
@@ -102,6 +179,28 @@ def calculate_recall_at_k_on_dataset(
                 minimal_iou_threshold
             )
             results[f"recall@{k}"].append(recall)
+    return results
+
+
+def calculate_recall_at_k_on_dataset(
+    student_search_results: StudentSearchResults,
+    rag_dataset: RagDataset,
+    minimal_iou_threshold: float = 0.05,
+    k_values: List[int] = [1, 3, 5, 10],
+    vectorized: bool = True,
+) -> float:
+
+    total_questions = len(rag_dataset.rag_questions)
+    eval_objects = build_eval_objects(student_search_results, rag_dataset)
+
+    print(f"Total number of questions: {total_questions}")
+    print(f"Total number of questions with sources: {len(eval_objects)}")
+    print(f"Total number of questions with student sources: {len([eval_object for eval_object in eval_objects.values() if eval_object.pred_sources])}")
+
+    if vectorized:
+        results = recall_at_k_vectorized(eval_objects, minimal_iou_threshold, k_values)
+    else:
+        results = recall_at_k_reference(eval_objects, minimal_iou_threshold, k_values)
 
     avg_results = {}
     for k in k_values:
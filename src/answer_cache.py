@@ -0,0 +1,93 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+class AnswerCache:
+    """
+    Disk-backed cache of generated answers, stored in SQLite.
+    Keeps at most max_entries answers, evicting the least recently used ones.
+    Safe to share between generation threads.
+    """
+
+    def __init__(self, path: str = "data/cache/answers.db",
+                 max_entries: int = 10000) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1.")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, answer TEXT NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_last_used "
+            "ON answers (last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, options: dict, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        payload = json.dumps(
+            {"model": model_name, "options": options, "prompt": prompt_hash},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE answers SET last_used = ? WHERE key = ?",
+                (time.time(), key)
+            )
+            self._conn.commit()
+            return str(row[0])
+
+    def put(self, key: str, answer: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, last_used) "
+                "VALUES (?, ?, ?)",
+                (key, answer, time.time())
+            )
+            # Evict the least recently used answers above the size bound
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY last_used DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+            return int(row[0])
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (f"Answer cache: {self.hits} hits, {self.misses} misses "
+                f"({rate:.1f}% hit rate), {len(self)} stored")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
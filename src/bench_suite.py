@@ -0,0 +1,257 @@
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata as package_metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from .chunk_store import ChunkStore
+from .chunker import RepositoryChunker
+from .context import ContextPacker
+from .generator import AnswerGenerator
+from .ingest import IngestionPipeline
+from .retriever import BM25Retriever
+from .stub_llm import StubOllamaServer
+
+SUITE_VERSION = 1
+# Words the synthetic files and queries are drawn from
+VOCABULARY = (
+    "scheduler batch request token cache block model layer attention kernel "
+    "tensor worker engine sampler prefix decode prefill memory gpu cpu queue "
+    "stream config parallel shard weight quantize lora adapter server client "
+    "metric latency output input prompt sequence padding rotary embedding "
+    "logits beam spec draft router"
+).split()
+
+
+def make_synthetic_repo(directory: str, n_files: int = 500,
+                        seed: int = 0) -> Path:
+    """
+    Writes a deterministic repository of n_files .py and .md files (3 out of
+    4 are code). The same (n_files, seed) always produces byte-identical
+    files.
+    """
+    rng = random.Random(seed)
+    root = Path(directory)
+    for i in range(n_files):
+        package = root / f"pkg{i % 10}" / f"sub{i % 7}"
+        package.mkdir(parents=True, exist_ok=True)
+        if i % 4:
+            lines = []
+            for f in range(rng.randint(3, 30)):
+                name = "_".join(rng.sample(VOCABULARY, 2))
+                args = ", ".join(rng.sample(VOCABULARY, rng.randint(1, 4)))
+                lines.append(f"def {name}_{f}({args}):")
+                words = rng.choices(VOCABULARY, k=rng.randint(5, 20))
+                lines.append(f'    """{" ".join(words).capitalize()}."""')
+                for _ in range(rng.randint(2, 12)):
+                    target, *operands = rng.sample(VOCABULARY, 3)
+                    lines.append(
+                        f"    {target} = {operands[0]}({operands[1]})"
+                    )
+                lines.append(f"    return {rng.choice(VOCABULARY)}\n\n")
+            (package / f"module_{i}.py").write_text("\n".join(lines),
+                                                    encoding="utf-8")
+        else:
+            sections = []
+            for _ in range(rng.randint(2, 10)):
+                title = " ".join(rng.sample(VOCABULARY, 3)).title()
+                paragraph = " ".join(
+                    rng.choices(VOCABULARY, k=rng.randint(40, 200))
+                )
+                sections.append(f"## {title}\n\n{paragraph}\n")
+            (package / f"doc_{i}.md").write_text("\n".join(sections),
+                                                 encoding="utf-8")
+    return root
+
+
+def make_queries(n_queries: int = 256, seed: int = 0) -> List[str]:
+    rng = random.Random(seed + 1)
+    return [" ".join(rng.sample(VOCABULARY, rng.randint(2, 6)))
+            for _ in range(n_queries)]
+
+
+def machine_info() -> dict:
+    versions: Dict[str, Optional[str]] = {}
+    for package in ("bm25s", "numpy", "scipy", "PyStemmer", "ollama",
+                    "pydantic"):
+        try:
+            versions[package] = package_metadata.version(package)
+        except package_metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "packages": versions,
+    }
+
+
+def _best_of(repeat: int, func: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_suite(
+    n_files: int = 500,
+    seed: int = 0,
+    repeat: int = 3,
+    n_queries: int = 256,
+    k: int = 10,
+    generate_questions: int = 64,
+    generate_workers: int = 4,
+    generate_delay_ms: float = 5.0,
+) -> dict:
+    """
+    Times every stage of the pipeline on a synthetic repository, best of
+    `repeat` runs each. Search and context timings are per query; everything
+    else is for the whole repository.
+    """
+    work_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        repo = make_synthetic_repo(str(Path(work_dir) / "repo"),
+                                   n_files=n_files, seed=seed)
+        index_dir = str(Path(work_dir) / "index")
+        queries = make_queries(n_queries, seed=seed)
+        chunker = RepositoryChunker()
+        pipeline = IngestionPipeline(chunker)
+        stages: Dict[str, float] = {}
+
+        stages["discover_s"] = _best_of(
+            repeat, lambda: list(pipeline.discover(repo))
+        )
+        files = []
+        for file_path, _, _ in pipeline.discover(repo):
+            with open(file_path, "r", encoding="utf-8") as f:
+                files.append((file_path, f.read()))
+
+        def chunk_all() -> List[dict]:
+            return [chunk for path, content in files
+                    for chunk in chunker.chunk_file(path, content)]
+
+        stages["chunk_s"] = _best_of(repeat, chunk_all)
+        chunks = chunk_all()
+        texts = [chunk["content"] for chunk in chunks]
+
+        # A fresh retriever per run, so the vocabulary is built from scratch
+        # every time
+        stages["tokenize_s"] = _best_of(
+            repeat, lambda: BM25Retriever()._tokenize(texts)
+        )
+        retriever = BM25Retriever()
+        retriever.build_index(chunks)
+        stages["index_s"] = _best_of(
+            repeat, lambda: retriever.reindex(retriever.k1, retriever.b)
+        )
+        stages["save_s"] = _best_of(repeat,
+                                    lambda: retriever.save(index_dir))
+        stages["load_s"] = _best_of(repeat,
+                                    lambda: BM25Retriever().load(index_dir))
+
+        loaded = BM25Retriever()
+        loaded.load(index_dir)
+        stages["search_single_ms"] = _best_of(
+            repeat, lambda: [loaded.search(query, k=k) for query in queries]
+        ) * 1000 / n_queries
+        stages["search_batch_ms"] = _best_of(
+            repeat, lambda: loaded.search_batch(queries, k=k)
+        ) * 1000 / n_queries
+
+        results = loaded.search_batch(queries, k=k)
+        store = ChunkStore(index_dir)
+        packer = ContextPacker()
+
+        def assemble() -> None:
+            for query, sources in zip(queries, results):
+                packer.pack(query, [(source, store.get_text(source))
+                                    for source in sources])
+
+        stages["context_ms"] = _best_of(repeat, assemble) * 1000 / n_queries
+
+        server = StubOllamaServer(delay_ms=generate_delay_ms).start()
+        try:
+            generator = AnswerGenerator(host=server.url,
+                                        max_workers=generate_workers)
+            requests = [(f"Question {i}?", [f"Context {i}"])
+                        for i in range(generate_questions)]
+            stages["generate_s"] = _best_of(
+                repeat, lambda: list(generator.generate_answers(requests))
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "version": SUITE_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": machine_info(),
+        "config": {
+            "n_files": n_files,
+            "seed": seed,
+            "repeat": repeat,
+            "n_queries": n_queries,
+            "k": k,
+            "chunk_size": chunker.chunk_size,
+            "chunks": len(chunks),
+            "generate_questions": generate_questions,
+            "generate_workers": generate_workers,
+            "generate_delay_ms": generate_delay_ms,
+        },
+        "stages": stages,
+    }
+
+
+def compare_results(current: dict, baseline: dict,
+                    threshold: float = 0.10) -> List[dict]:
+    """
+    Compares stage timings with a baseline run; a stage regresses when it is
+    more than `threshold` (relative) slower.
+    """
+    rows = []
+    for stage, value in current["stages"].items():
+        previous: Optional[float] = baseline.get("stages", {}).get(stage)
+        ratio = value / previous if previous else None
+        rows.append({
+            "stage": stage,
+            "baseline": previous,
+            "current": value,
+            "ratio": ratio,
+            "regression": ratio is not None and ratio > 1 + threshold,
+        })
+    return rows
+
+
+def config_mismatch(current: dict, baseline: dict) -> List[str]:
+    """
+    Config keys that differ between two runs (results are then not
+    comparable).
+    """
+    baseline_config = baseline.get("config", {})
+    keys = set(current["config"]) | set(baseline_config)
+    return sorted(key for key in keys
+                  if current["config"].get(key) != baseline_config.get(key))
+
+
+def load_results(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        results: dict = json.load(f)
+    return results
+
+
+def save_results(results: dict, path: str) -> None:
+    save_path = Path(path)
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(save_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
@@ -0,0 +1,311 @@
+import json
+import multiprocessing
+import pickle
+import random
+import resource
+import tempfile
+import time
+import bm25s
+import numpy as np
+import Stemmer
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
+from .chunker import LANGUAGES, RepositoryChunker
+from .generator import AnswerGenerator
+from .metadata import ChunkMetadata
+from .retriever import BM25Retriever
+from .splitter import SpanSplitter
+from .stemmer import get_stemmer
+from .stub_llm import StubOllamaServer
+
+
+def legacy_chunk_spans(file_path: str, content: str,
+                       chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    The previous chunking strategy: LangChain split_text, then offsets
+    recovered with content.find(), used as the reference for benchmarks.
+    """
+    language = Language.MARKDOWN
+    if file_path.endswith(".py"):
+        language = Language.PYTHON
+    splitter = RecursiveCharacterTextSplitter.from_language(
+        language=language,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_size // 4
+    )
+    spans = []
+    last_index = 0
+    for chunk_text in splitter.split_text(content):
+        start_index = content.find(chunk_text, last_index)
+        spans.append((start_index, start_index + len(chunk_text)))
+        last_index = start_index + 1
+    return spans
+
+
+def _best_of(repeat: int, func: Callable[..., Any], *args: Any) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_chunker(repo_path: str, top_n: int = 20, repeat: int = 3,
+                      chunk_size: int = 1800) -> List[dict]:
+    """
+    Times legacy vs span-based chunking over the top_n largest .py/.md files
+    of repo_path.
+    """
+    files = [f for f in Path(repo_path).rglob("*")
+             if f.suffix in (".py", ".md") and f.is_file()]
+    files = sorted(files, key=lambda f: f.stat().st_size,
+                   reverse=True)[:top_n]
+    chunker = RepositoryChunker(chunk_size=chunk_size)
+
+    rows = []
+    for file_path in files:
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        path = str(file_path)
+        legacy = legacy_chunk_spans(path, content, chunk_size)
+        split_spans = chunker._get_splitter(path).split_spans
+        spans = split_spans(content)
+        rows.append({
+            "file_path": path,
+            "chars": len(content),
+            "chunks": len(spans),
+            "legacy_s": _best_of(repeat, legacy_chunk_spans, path, content,
+                                 chunk_size),
+            "span_s": _best_of(repeat, split_spans, content),
+            "bad_legacy_offsets": sum(1 for s in legacy if s[0] == -1),
+            "offsets_differ": (sum(1 for a, b in zip(legacy, spans) if a != b)
+                               + abs(len(legacy) - len(spans))),
+        })
+    return rows
+
+
+def _small_files(n_files: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Synthetic (path, content) pairs of a few hundred characters, alternating
+    .py and .md.
+    """
+    rng = random.Random(seed)
+    words = ["def", "return", "config", "scheduler", "running", "runs",
+             "model", "tokens", "cache", "request", "worker", "loading",
+             "loaded", "parallel", "engine", "batch"]
+    files = []
+    for i in range(n_files):
+        lines = [" ".join(rng.choices(words, k=rng.randint(3, 10)))
+                 for _ in range(rng.randint(3, 12))]
+        suffix = ".py" if i % 2 else ".md"
+        files.append((f"pkg/module_{i}{suffix}", "\n".join(lines)))
+    return files
+
+
+def benchmark_small_files(n_files: int = 5000, repeat: int = 3,
+                          chunk_size: int = 1800) -> List[dict]:
+    """
+    Per-file overhead on many small files: a splitter built for every file vs
+    the chunker's pre-built ones, and a new stemmer per tokenize call vs the
+    shared cached one.
+    """
+    files = _small_files(n_files)
+    chunker = RepositoryChunker(chunk_size=chunk_size)
+
+    def split_fresh() -> None:
+        for path, content in files:
+            language = LANGUAGES[Path(path).suffix]
+            splitter = SpanSplitter.from_language(
+                language, chunk_size=chunk_size,
+                chunk_overlap=chunk_size // 4,
+            )
+            splitter.split_spans(content)
+
+    def split_reused() -> None:
+        for path, content in files:
+            chunker._get_splitter(path).split_spans(content)
+
+    def tokenize_fresh() -> None:
+        for _, content in files:
+            bm25s.tokenize([content], stemmer=Stemmer.Stemmer("english"),
+                           return_ids=False, show_progress=False)
+
+    def tokenize_shared() -> None:
+        for _, content in files:
+            bm25s.tokenize([content], stemmer=get_stemmer(),
+                           return_ids=False, show_progress=False)
+
+    rows = []
+    for stage, before, after in (("split", split_fresh, split_reused),
+                                 ("tokenize", tokenize_fresh,
+                                  tokenize_shared)):
+        before_s = _best_of(repeat, before)
+        after_s = _best_of(repeat, after)
+        rows.append({
+            "stage": stage,
+            "files": n_files,
+            "before_s": before_s,
+            "after_s": after_s,
+            "saved_us_per_file": (before_s - after_s) / n_files * 1e6,
+        })
+    return rows
+
+
+def _measure_load(directory: str, mode: str, queue: Any) -> None:
+    """
+    Runs in a fresh process: loads the index in the given mode and reports
+    time and RSS growth.
+    """
+    import bm25s
+
+    before_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    retriever = BM25Retriever()
+    source_objects = 0
+    if mode == "legacy":
+        # Previous behaviour: full corpus in RAM and one MinimalSource object
+        # per chunk
+        retriever.load(directory, mmap=False)
+        retriever.retriever = bm25s.BM25.load(directory, load_corpus=True)
+        sources = [retriever.metadata[i]
+                   for i in range(len(retriever.metadata))]
+        source_objects = len(sources)
+    else:
+        retriever.load(directory, mmap=(mode == "mmap"))
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    retriever.search("how does the scheduler batch requests", k=10)
+    first_search_s = time.perf_counter() - start
+    after_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "mode": mode,
+        "load_s": load_s,
+        "first_search_s": first_search_s,
+        "source_objects": source_objects,
+        "rss_growth_mb": (after_kb - before_kb) / 1024,
+    })
+
+
+def benchmark_load(
+    directory: str,
+    modes: Tuple[str, ...] = ("legacy", "in_memory", "mmap"),
+) -> List[dict]:
+    """
+    Measures index startup time and resident memory of each load mode in its
+    own process.
+    """
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for mode in modes:
+        queue = context.Queue()
+        process = context.Process(target=_measure_load,
+                                  args=(directory, mode, queue))
+        process.start()
+        rows.append(queue.get())
+        process.join()
+    return rows
+
+
+def benchmark_generation(
+    questions: int = 64,
+    workers: Tuple[int, ...] = (1, 2, 4, 8),
+    delay_ms: float = 100.0,
+    fail_first: int = 0,
+) -> List[dict]:
+    """
+    Measures answer throughput for each worker count against a local stub
+    Ollama server that takes delay_ms per request, so no model is needed.
+    """
+    rows = []
+    for max_workers in workers:
+        server = StubOllamaServer(delay_ms=delay_ms,
+                                  fail_first=fail_first).start()
+        generator = AnswerGenerator(host=server.url, max_workers=max_workers,
+                                    backoff=0.01)
+        requests = ((f"Question {i}?", [f"Context {i}"])
+                    for i in range(questions))
+        start = time.perf_counter()
+        results = list(generator.generate_answers(requests))
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+        rows.append({
+            "workers": max_workers,
+            "seconds": elapsed,
+            "questions_per_s": questions / elapsed,
+            "failed": sum(1 for result in results
+                          if result.error is not None),
+        })
+    return rows
+
+
+def _save_legacy_metadata(metadata: ChunkMetadata, directory: Path,
+                          columnar: bool) -> None:
+    """
+    Writes the formats used before metadata.bin: the .npy columns, or a
+    pickled list of MinimalSource.
+    """
+    if not columnar:
+        with open(directory / "metadata.pkl", "wb") as f:
+            pickle.dump([metadata[i] for i in range(len(metadata))], f)
+        return
+    with open(directory / "metadata_paths.json", "w", encoding="utf-8") as f:
+        json.dump(metadata.paths, f)
+    np.save(directory / "metadata_path_ids.npy",
+            np.asarray(metadata.path_ids, dtype=np.int32))
+    np.save(directory / "metadata_starts.npy",
+            np.asarray(metadata.starts, dtype=np.int64))
+    np.save(directory / "metadata_ends.npy",
+            np.asarray(metadata.ends, dtype=np.int64))
+
+
+def benchmark_metadata(directory: str, repeat: int = 5,
+                       lookups: int = 1000) -> List[dict]:
+    """
+    Writes the metadata of an index in every format, then times loading each
+    one (best of repeat) and looking up `lookups` random chunks.
+    """
+    metadata = ChunkMetadata.load(directory, verify=True, legacy=True)
+    rng = random.Random(0)
+    chunk_ids = []
+    if len(metadata):
+        chunk_ids = [rng.randrange(len(metadata)) for _ in range(lookups)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        formats = {name: Path(tmp) / name
+                   for name in ("pickle", "npy", "bin")}
+        for format_dir in formats.values():
+            format_dir.mkdir()
+        _save_legacy_metadata(metadata, formats["pickle"], columnar=False)
+        _save_legacy_metadata(metadata, formats["npy"], columnar=True)
+        metadata.save(str(formats["bin"]))
+
+        cases = [
+            ("pickle", "pickle", {"legacy": True}),
+            ("npy", "npy", {}),
+            ("npy mmap", "npy", {"mmap": True}),
+            ("bin", "bin", {"verify": True}),
+            ("bin mmap", "bin", {"mmap": True, "verify": True}),
+            ("bin mmap no verify", "bin", {"mmap": True}),
+        ]
+        rows = []
+        for label, name, kwargs in cases:
+            path = str(formats[name])
+            loaded = ChunkMetadata.load(path, **kwargs)
+            if loaded != metadata:
+                raise ValueError(f"{label} metadata does not round-trip.")
+            rows.append({
+                "format": label,
+                "bytes": sum(f.stat().st_size
+                             for f in formats[name].iterdir()),
+                "load_s": _best_of(
+                    repeat, lambda: ChunkMetadata.load(path, **kwargs)
+                ),
+                "lookup_s": _best_of(
+                    repeat, lambda: [loaded[i] for i in chunk_ids]
+                ),
+            })
+    return rows
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from bm25s.utils.corpus import JsonlCorpus
+from .metadata import ChunkMetadata
+from .models import MinimalSource
+from .tracing import span
+
+
+class ChunkStore:
+    """
+    Returns the text of retrieved sources for context assembly.
+    Sources that match an indexed chunk span are read from the index corpus
+    (one mmap lookup); anything else is sliced from its file, with the most
+    recently used files kept in memory.
+    """
+
+    def __init__(self, index_directory: Optional[str] = None,
+                 max_files: int = 64) -> None:
+        self.max_files = max_files
+        self._files: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._corpus: Any = None
+        self._metadata: Optional[ChunkMetadata] = None
+        self._span_index: Optional[Dict[Tuple[str, int, int], int]] = None
+        self.index_hits = 0
+        self.file_cache_hits = 0
+        self.file_reads = 0
+
+        if index_directory is not None:
+            corpus_path = Path(index_directory) / "corpus.jsonl"
+            if corpus_path.exists():
+                self._corpus = JsonlCorpus(str(corpus_path),
+                                           show_progress=False)
+                self._metadata = ChunkMetadata.load(index_directory,
+                                                    mmap=True)
+
+    def _chunk_id(self, source: MinimalSource) -> Optional[int]:
+        if self._metadata is None:
+            return None
+        if self._span_index is None:
+            # Built on first use: (file path, start, end) -> chunk id
+            metadata = self._metadata
+            spans = zip(metadata.path_ids, metadata.starts, metadata.ends)
+            self._span_index = {
+                (metadata.paths[path_id], int(start), int(end)): chunk_id
+                for chunk_id, (path_id, start, end) in enumerate(spans)
+            }
+        return self._span_index.get((
+            source.file_path,
+            source.first_character_index,
+            source.last_character_index,
+        ))
+
+    def _read_file(self, file_path: str) -> str:
+        with self._lock:
+            content = self._files.get(file_path)
+            if content is not None:
+                self._files.move_to_end(file_path)
+                self.file_cache_hits += 1
+                return content
+        # Read outside the lock so concurrent misses on different files
+        # overlap; two threads missing on the same file both read it and
+        # the first insert wins
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        with self._lock:
+            self.file_reads += 1
+            cached = self._files.setdefault(file_path, content)
+            self._files.move_to_end(file_path)
+            if len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        return cached
+
+    def get_text(self, source: MinimalSource) -> str:
+        """
+        Text of source; raises OSError if it has to come from an unreadable
+        file.
+        """
+        with span("chunk_store.get_text"):
+            # The corpus reads through one shared mmap position, so index
+            # lookups stay under the lock
+            with self._lock:
+                chunk_id = self._chunk_id(source)
+                if chunk_id is not None:
+                    self.index_hits += 1
+                    return str(self._corpus[chunk_id]["text"])
+            content = self._read_file(source.file_path)
+            start = source.first_character_index
+            return content[start:source.last_character_index]
+
+    def summary(self) -> str:
+        return (f"Context: {self.index_hits} chunks from index, "
+                f"{self.file_cache_hits} from cached files, "
+                f"{self.file_reads} file reads")
@@ -1,57 +1,105 @@
-from typing import List
-from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
+import os
+from typing import Dict, List, Mapping, Optional, Tuple
+from langchain_text_splitters import Language
 from .models import MinimalSource
+from .splitter import SpanSplitter
+
+# Languages with their own separators, by file suffix
+LANGUAGES = {".py": Language.PYTHON, ".md": Language.MARKDOWN}
+# Fallback for other text files
+FALLBACK_SEPARATORS = ["\n\n", "\n", " ", ""]
+MAX_CHUNK_SIZE = 2000
+
+
+def _check_setting(name: str, setting: object) -> Tuple[int, int]:
+    """
+    Normalizes a (chunk_size, chunk_overlap) pair, raising ValueError when
+    it is unusable.
+    """
+    if not isinstance(setting, (tuple, list)) or len(setting) != 2:
+        raise ValueError(f"Chunking for {name} must be a (chunk_size, "
+                         f"chunk_overlap) pair, got {setting!r}.")
+    size, overlap = setting
+    if not isinstance(size, int) or not 0 < size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"chunk_size for {name} must be between "
+                         f"1-{MAX_CHUNK_SIZE}, got {size!r}.")
+    overlap = size // 4 if overlap is None else overlap
+    if not isinstance(overlap, int) or not 0 <= overlap < size:
+        raise ValueError(f"chunk_overlap for {name} must be between 0 and "
+                         f"chunk_size - 1, got {overlap!r}.")
+    return size, overlap
+
 
 class RepositoryChunker:
-    def __init__(self, chunk_size: int = 1800):
-        self.chunk_size = chunk_size
+    """
+    Splits files into chunks with one splitter per language, built once
+    and reused for every file. language_settings overrides (chunk_size,
+    chunk_overlap) per suffix, e.g. {".md": (1500, 300)}; an overlap of
+    None means chunk_size // 4.
+    """
 
-    def chunk_file(self, file_path: str, content: str) -> List[dict]:
-        """Chunks a single file and returns list of dicts with content and metadata."""
+    def __init__(
+        self, chunk_size: int = 1800, chunk_overlap: Optional[int] = None,
+        language_settings: Optional[
+            Mapping[str, Tuple[int, Optional[int]]]
+        ] = None,
+    ) -> None:
+        # Checked here, before any file is read
+        self.chunk_size, self.chunk_overlap = _check_setting(
+            "all files", (chunk_size, chunk_overlap)
+        )
+        self.language_settings: Dict[str, Tuple[int, int]] = {
+            suffix: _check_setting(suffix, setting)
+            for suffix, setting in (language_settings or {}).items()
+        }
+        # "" is the fallback for every other suffix
+        self._splitters: Dict[str, SpanSplitter] = {
+            suffix: self._build_splitter(suffix)
+            for suffix in [*LANGUAGES, *self.language_settings, ""]
+        }
+
+    def settings_for(self, suffix: str) -> Tuple[int, int]:
+        """(chunk_size, chunk_overlap) used for files with this suffix."""
+        return self.language_settings.get(
+            suffix, (self.chunk_size, self.chunk_overlap)
+        )
+
+    def _get_splitter(self, file_path: str) -> SpanSplitter:
+        suffix = os.path.splitext(file_path)[1]
+        if suffix not in LANGUAGES and suffix not in self.language_settings:
+            suffix = ""
+        return self._splitters[suffix]
 
-        if self.chunk_size <= 0 or self.chunk_size > 2000:
-            raise ValueError("chunk_size must be between 1-2000.")
-        
+    def _build_splitter(self, suffix: str) -> SpanSplitter:
+        chunk_size, chunk_overlap = self.settings_for(suffix)
         # Select separators based on file type
-        if file_path.endswith(".py"):
-            splitter = RecursiveCharacterTextSplitter.from_language(
-                language=Language.PYTHON,
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_size // 4  # 40% overlap for code files
-            )
-        elif file_path.endswith(".md"):
-            splitter = RecursiveCharacterTextSplitter.from_language(
-                language=Language.MARKDOWN,
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_size // 4  # 20% overlap for markdown files
-            )
-        else:
-            # Fallback for other text files
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_overlap,
-                separators=["\n\n", "\n", " ", ""]
+        if suffix in LANGUAGES:
+            return SpanSplitter.from_language(
+                LANGUAGES[suffix], chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
             )
+        return SpanSplitter(FALLBACK_SEPARATORS, chunk_size=chunk_size,
+                            chunk_overlap=chunk_overlap)
+
+    def chunk_file(self, file_path: str, content: str) -> List[dict]:
+        """
+        Chunks a single file and returns list of dicts with content and
+        metadata.
+        """
+
+        splitter = self._get_splitter(file_path)
 
-        # We need the character offsets to satisfy the MinimalSource model
-        # LangChain doesn't give offsets by default, so we calculate them manually
+        # The splitter works on spans of the content, so the character offsets
+        # required by MinimalSource are exact by construction
         chunks = []
-        raw_chunks = splitter.split_text(content)
-        
-        last_index = 0
-        for chunk_text in raw_chunks:
-            # Find the actual start index in the original content
-            start_index = content.find(chunk_text, last_index)
-            end_index = start_index + len(chunk_text)
-            
+        for start_index, end_index in splitter.split_spans(content):
             chunks.append({
-                "content": chunk_text,
+                "content": content[start_index:end_index],
                 "metadata": MinimalSource(
                     file_path=file_path,
                     first_character_index=start_index,
                     last_character_index=end_index
                 )
             })
-            last_index = start_index + 1 # Move forward for next search
-            
-        return chunks
\ No newline at end of file
+
+        return chunks
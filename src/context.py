@@ -0,0 +1,175 @@
+import re
+from typing import List, Set, Tuple
+from bm25s.stopwords import STOPWORDS_EN
+from .models import MinimalSource
+from .stemmer import get_stemmer
+from .tracing import span
+
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+# Lines shorter than this (blank lines, "return x", closing brackets...) are
+# never deduplicated
+MIN_DEDUP_LINE = 20
+# Longest run of lines scored as one unit when trimming
+MAX_SEGMENT_LINES = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough LLM token count (~4 characters per token), good enough for
+    budgeting.
+    """
+    return (len(text) + 3) // 4
+
+
+def format_source(file_path: str, text: str) -> str:
+    return f"Source File: {file_path}\nContent:\n{text}\n"
+
+
+class ContextPacker:
+    """
+    Shrinks the retrieved context before it goes into the prompt:
+    1. overlapping or touching spans of the same file are merged into one
+       block,
+    2. long lines already present in an earlier block are dropped,
+    3. if the context is still above max_tokens, the line segments with the
+       lowest density of (stemmed) question terms are cut first.
+    """
+
+    def __init__(self, max_tokens: int = 512):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive.")
+        self.max_tokens = max_tokens
+        self.stopwords = set(STOPWORDS_EN)
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def _terms(self, text: str) -> List[str]:
+        words = [w for w in TOKEN_PATTERN.findall(text.lower())
+                 if w not in self.stopwords]
+        terms: List[str] = get_stemmer().stemWords(words)
+        return terms
+
+    @staticmethod
+    def _merge_spans(
+        pairs: List[Tuple[MinimalSource, str]],
+    ) -> List[Tuple[str, int, int, str]]:
+        """
+        Merges overlapping spans per file; blocks keep the rank of their best
+        source.
+        """
+        # In (path, start) order every span can only extend the current
+        # block, so chains (A overlaps B, B overlaps C) collapse in one pass
+        # whatever their rank order
+        order = sorted(range(len(pairs)),
+                       key=lambda r: (pairs[r][0].file_path,
+                                      pairs[r][0].first_character_index))
+        ranked: List[Tuple[int, Tuple[str, int, int, str]]] = []
+        for rank in order:
+            source, text = pairs[rank]
+            start = source.first_character_index
+            end = source.last_character_index
+            if ranked:
+                best, (path, b_start, b_end, b_text) = ranked[-1]
+                if path == source.file_path and start <= b_end:
+                    if end > b_end:
+                        b_text = b_text + text[len(text) - (end - b_end):]
+                    merged = (path, b_start, max(end, b_end), b_text)
+                    ranked[-1] = (min(best, rank), merged)
+                    continue
+            ranked.append((rank, (source.file_path, start, end, text)))
+        return [block for _, block in sorted(ranked)]
+
+    def _dedup(
+        self, blocks: List[Tuple[str, int, int, str]],
+    ) -> List[Tuple[str, List[str]]]:
+        seen: Set[str] = set()
+        deduped = []
+        for path, _, _, text in blocks:
+            lines = text.split("\n")
+            # Only lines of earlier blocks count: repeats inside one block are
+            # real code
+            kept = [line for line in lines
+                    if len(line.strip()) < MIN_DEDUP_LINE
+                    or line.strip() not in seen]
+            seen.update(line.strip() for line in lines
+                        if len(line.strip()) >= MIN_DEDUP_LINE)
+            deduped.append((path, kept))
+        return deduped
+
+    def _trim(self, question: str,
+              blocks: List[Tuple[str, List[str]]]) -> List[str]:
+        query_terms = set(self._terms(question))
+        budget = self.max_tokens - sum(
+            estimate_tokens(format_source(path, "")) for path, _ in blocks
+        )
+
+        # Segments: runs of lines split at blank lines, at most
+        # MAX_SEGMENT_LINES long:
+        # (block index, first line, last line + 1, tokens, density)
+        segments = []
+        for b, (_, lines) in enumerate(blocks):
+            start = 0
+            for i in range(len(lines) + 1):
+                if (i == len(lines) or not lines[i].strip()
+                        or i - start >= MAX_SEGMENT_LINES):
+                    if i > start:
+                        text = "\n".join(lines[start:i])
+                        tokens = estimate_tokens(text) + 1
+                        hits = sum(1 for term in self._terms(text)
+                                   if term in query_terms)
+                        segments.append((b, start, i, tokens, hits / tokens))
+                    start = i if i < len(lines) and lines[i].strip() else i + 1
+
+        # Densest segments first; ties keep document order
+        order = sorted(range(len(segments)), key=lambda s: -segments[s][4])
+        selected = set()
+        for s in order:
+            if segments[s][3] <= budget:
+                selected.add(s)
+                budget -= segments[s][3]
+
+        texts = []
+        for b, (path, lines) in enumerate(blocks):
+            parts: List[str] = []
+            previous_end = 0
+            for s, (block, start, end, _, _) in enumerate(segments):
+                if block != b or s not in selected:
+                    continue
+                if start > previous_end and parts:
+                    skipped = lines[previous_end:start]
+                    gap = any(line.strip() for line in skipped)
+                    parts.append("..." if gap else "")
+                parts.append("\n".join(lines[start:end]))
+                previous_end = end
+            if parts:
+                texts.append(format_source(path, "\n".join(parts)))
+        return texts
+
+    def pack(self, question: str,
+             pairs: List[Tuple[MinimalSource, str]]) -> List[str]:
+        """
+        Returns the formatted context blocks for (source, text) pairs, in
+        rank order.
+        """
+        with span("context.pack", sources=len(pairs)):
+            return self._pack(question, pairs)
+
+    def _pack(self, question: str,
+              pairs: List[Tuple[MinimalSource, str]]) -> List[str]:
+        before = sum(estimate_tokens(format_source(source.file_path, text))
+                     for source, text in pairs)
+        blocks = self._dedup(self._merge_spans(pairs))
+        texts = [format_source(path, "\n".join(lines))
+                 for path, lines in blocks]
+        if sum(estimate_tokens(text) for text in texts) > self.max_tokens:
+            texts = self._trim(question, blocks)
+        self.tokens_before += before
+        self.tokens_after += sum(estimate_tokens(text) for text in texts)
+        return texts
+
+    def summary(self) -> str:
+        saved = self.tokens_before - self.tokens_after
+        rate = saved / self.tokens_before * 100 if self.tokens_before else 0.0
+        return (f"Context packing: ~{self.tokens_before} -> "
+                f"~{self.tokens_after} prompt tokens "
+                f"(~{saved} saved, {rate:.1f}%)")
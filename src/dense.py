@@ -0,0 +1,355 @@
+import json
+import os
+import re
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Sequence, Tuple, Union
+import numpy as np
+from .metadata import ChunkMetadata
+from .models import MinimalSource
+from .retriever import BM25Retriever
+from .tracing import span
+
+VECTORS_NAME = "dense_vectors.npy"
+SCALES_NAME = "dense_scales.npy"
+CONFIG_NAME = "dense_config.json"
+DTYPES = ("float16", "int8")
+# Constant of reciprocal-rank fusion: 1 / (RRF_K + rank)
+RRF_K = 60
+WORD_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+class HashingEncoder:
+    """
+    Dependency-free stand-in for an embedding model: words and word bigrams
+    are hashed into `dim` signed buckets. Deterministic across processes and
+    runs.
+    """
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def encode(self, texts: Sequence[str],
+               batch_size: int = 64) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = WORD_PATTERN.findall(text.lower())
+            bigrams = [a + " " + b for a, b in zip(words, words[1:])]
+            for feature in words + bigrams:
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        normalized: np.ndarray = vectors / np.maximum(norms, 1e-12)
+        return normalized
+
+
+class SentenceTransformerEncoder:
+    """
+    Embeds on CPU with a sentence-transformers model (a local directory or a
+    cached model name).
+    """
+
+    def __init__(self, model: str, device: str = "cpu") -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model
+        self.model = SentenceTransformer(model, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: Sequence[str],
+               batch_size: int = 64) -> np.ndarray:
+        vectors: np.ndarray = self.model.encode(
+            list(texts), batch_size=batch_size, normalize_embeddings=True,
+            convert_to_numpy=True, show_progress_bar=False,
+        ).astype(np.float32)
+        return vectors
+
+
+Encoder = Union[HashingEncoder, SentenceTransformerEncoder]
+
+
+def make_encoder(spec: str) -> Encoder:
+    """
+    'hashing' or 'hashing:<dim>' for the stand-in, anything else is a
+    sentence-transformers model.
+    """
+    if spec == "hashing":
+        return HashingEncoder()
+    if spec.startswith("hashing:"):
+        return HashingEncoder(int(spec.split(":", 1)[1]))
+    return SentenceTransformerEncoder(spec)
+
+
+def _quantize(vectors: np.ndarray,
+              dtype: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Stored matrix and per-row scales (all ones for float16)."""
+    if dtype == "float16":
+        return (vectors.astype(np.float16),
+                np.ones(len(vectors), dtype=np.float32))
+    # Symmetric per-row int8: row = int8 * scale
+    scales: np.ndarray = np.zeros(0, dtype=np.float32)
+    if len(vectors):
+        scales = np.abs(vectors).max(axis=1) / 127
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+class DenseIndex:
+    """
+    One embedding per chunk, in chunk id order, stored as a float16 or int8
+    matrix that is memory-mapped at load time. version is the fingerprint of
+    the BM25 index whose chunk ids the rows follow (None for indexes saved
+    without one).
+    """
+
+    def __init__(self, encoder: Encoder, vectors: np.ndarray,
+                 scales: np.ndarray, dtype: str = "float16",
+                 version: Optional[str] = None) -> None:
+        self.encoder = encoder
+        self.vectors = vectors
+        self.scales = scales
+        self.dtype = dtype
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return (Path(directory) / CONFIG_NAME).exists()
+
+    @staticmethod
+    def remove(directory: str) -> None:
+        """
+        Deletes the dense index files under directory, e.g. once its chunk
+        ids are out of date.
+        """
+        for name in (CONFIG_NAME, VECTORS_NAME, SCALES_NAME):
+            (Path(directory) / name).unlink(missing_ok=True)
+
+    @classmethod
+    def build(
+        cls,
+        encoder: Encoder,
+        corpus: List[str],
+        segments: Optional[List[Union[range, list]]] = None,
+        previous: Optional["DenseIndex"] = None,
+        dtype: str = "float16",
+        batch_size: int = 64,
+    ) -> "DenseIndex":
+        """
+        Embeds the corpus in batches. With segments (as given to
+        BM25Retriever.rebuild_index) and a previous index of the same encoder
+        and dtype, rows of reused chunk id ranges are copied instead of
+        re-embedded.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}.")
+        if previous is not None and (previous.encoder.name != encoder.name
+                                     or previous.dtype != dtype):
+            previous = None
+        segments = segments if segments is not None else [corpus]
+
+        vector_parts, scale_parts = [], []
+        position = 0
+        pending: List[str] = []
+
+        def flush() -> None:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                vectors, scales = _quantize(encoder.encode(batch, batch_size),
+                                            dtype)
+                vector_parts.append(vectors)
+                scale_parts.append(scales)
+            pending.clear()
+
+        for segment in segments:
+            count = len(segment)
+            if isinstance(segment, range) and previous is not None:
+                flush()
+                reused = slice(segment.start, segment.stop)
+                vector_parts.append(np.asarray(previous.vectors[reused]))
+                scale_parts.append(np.asarray(previous.scales[reused]))
+            else:
+                pending.extend(corpus[position:position + count])
+            position += count
+        flush()
+
+        stored_dtype = np.float16 if dtype == "float16" else np.int8
+        vectors = np.zeros((0, encoder.dim), dtype=stored_dtype)
+        if vector_parts:
+            vectors = np.concatenate(vector_parts)
+        scales = np.zeros(0, dtype=np.float32)
+        if scale_parts:
+            scales = np.concatenate(scale_parts)
+        return cls(encoder, vectors, scales, dtype)
+
+    def save(self, directory: str) -> None:
+        save_path = Path(directory)
+        save_path.mkdir(parents=True, exist_ok=True)
+        # Written next to the target then renamed: the old matrix may still
+        # be memory-mapped
+        for name, array in ((VECTORS_NAME, self.vectors),
+                            (SCALES_NAME, self.scales)):
+            tmp_path = save_path / f"{name}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, save_path / name)
+        with open(save_path / CONFIG_NAME, "w", encoding="utf-8") as f:
+            json.dump({"encoder": self.encoder.name,
+                       "dim": self.encoder.dim, "dtype": self.dtype,
+                       "version": self.version}, f)
+
+    @staticmethod
+    def read_config(directory: str) -> dict:
+        with open(Path(directory) / CONFIG_NAME, "r", encoding="utf-8") as f:
+            config: dict = json.load(f)
+        return config
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True,
+             encoder: Optional[Encoder] = None) -> "DenseIndex":
+        """
+        Loads the matrix (memory-mapped by default) and recreates the encoder
+        it was built with.
+        """
+        load_path = Path(directory)
+        config = cls.read_config(directory)
+        mmap_mode: Optional[Literal["r"]] = "r" if mmap else None
+        return cls(
+            encoder or make_encoder(config["encoder"]),
+            np.load(load_path / VECTORS_NAME, mmap_mode=mmap_mode),
+            np.load(load_path / SCALES_NAME, mmap_mode=mmap_mode),
+            config["dtype"],
+            config.get("version"),
+        )
+
+    def search_batch(
+        self,
+        queries: List[str],
+        k: int = 50,
+        deadline: Optional[float] = None,
+        block_size: int = 16384,
+    ) -> Tuple[List[List[int]], bool]:
+        """
+        Returns the top-k chunk ids of each query by cosine similarity, and
+        whether the whole matrix was scanned. Rows are scored block_size at a
+        time and the scan stops at the first block boundary past `deadline`
+        (a perf_counter time).
+        """
+        query_vectors = self.encoder.encode(queries).T
+        k = min(k, len(self.vectors))
+        best_ids: np.ndarray = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores: np.ndarray = np.zeros((len(queries), 0),
+                                           dtype=np.float32)
+        complete = True
+        for start in range(0, len(self.vectors), block_size):
+            if (deadline is not None and start > 0
+                    and time.perf_counter() > deadline):
+                complete = False
+                break
+            rows = slice(start, start + block_size)
+            block = np.asarray(self.vectors[rows], dtype=np.float32)
+            scores = ((block @ query_vectors).T
+                      * np.asarray(self.scales[rows]))
+            ids = np.broadcast_to(np.arange(start, start + len(block)),
+                                  scores.shape)
+            # Keep the running top-k of each query
+            scores = np.concatenate([best_scores, scores], axis=1)
+            ids = np.concatenate([best_ids, ids], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                ids = np.take_along_axis(ids, top, axis=1)
+            best_scores, best_ids = scores, ids
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_ids, order, axis=1).tolist(), complete
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int,
+                           rrf_k: int = RRF_K) -> List[int]:
+    """
+    Fuses ranked chunk id lists: each list adds 1 / (rrf_k + rank) to the
+    score of its ids.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = (scores.get(chunk_id, 0.0)
+                                + 1.0 / (rrf_k + rank + 1))
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])[:k]
+
+
+class HybridRetriever:
+    """
+    BM25 and dense retrieval fused with reciprocal-rank fusion.
+    Each query gets budget_ms: the dense scan uses whatever BM25 left of it and
+    stops early when it runs out, in which case results lean on BM25 alone.
+    The dense rows must follow the chunk ids of the loaded BM25 index.
+    """
+
+    def __init__(self, bm25: BM25Retriever, dense: DenseIndex,
+                 candidates: int = 50, budget_ms: float = 50.0) -> None:
+        stale = len(dense) != len(bm25.metadata) or (
+            dense.version is not None and bm25.version is not None
+            and dense.version != bm25.version
+        )
+        if stale:
+            raise ValueError(
+                f"The dense index was built for other chunks than the BM25 "
+                f"index ({len(dense)} vectors, {len(bm25.metadata)} chunks). "
+                f"Run index with --dense again."
+            )
+        self.bm25 = bm25
+        self.dense = dense
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.queries = 0
+        self.partial_scans = 0
+        self.skipped_scans = 0
+
+    @property
+    def metadata(self) -> ChunkMetadata:
+        return self.bm25.metadata
+
+    def search(self, query: str, k: int = 5) -> List[MinimalSource]:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(
+        self, queries: List[str], k: int = 5, batch_size: int = 1024,
+        n_threads: int = 0,
+    ) -> List[List[MinimalSource]]:
+        """
+        Same contract as BM25Retriever.search_batch; the budget scales with
+        the number of queries.
+        """
+        depth = max(k, self.candidates)
+        sources = []
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            deadline = (time.perf_counter()
+                        + self.budget_ms * len(batch) / 1000)
+            lexical = self.bm25.search_ids(batch, k=depth,
+                                           n_threads=n_threads)
+            if time.perf_counter() < deadline:
+                with span("dense.search", queries=len(batch)):
+                    dense, complete = self.dense.search_batch(
+                        batch, k=depth, deadline=deadline
+                    )
+                self.partial_scans += 0 if complete else len(batch)
+            else:
+                dense = [[] for _ in batch]
+                self.skipped_scans += len(batch)
+            for lexical_ids, dense_ids in zip(lexical, dense):
+                fused = reciprocal_rank_fusion([lexical_ids, dense_ids], k)
+                sources.append([self.bm25.metadata[i] for i in fused])
+            self.queries += len(batch)
+        return sources
+
+    def summary(self) -> str:
+        return (f"Hybrid retrieval: {self.queries} queries, "
+                f"{self.partial_scans} with a partial dense scan, "
+                f"{self.skipped_scans} BM25 only "
+                f"(budget {self.budget_ms:g} ms/query)")
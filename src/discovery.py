@@ -0,0 +1,324 @@
+import os
+import queue
+import re
+import threading
+from fnmatch import translate
+from pathlib import Path
+from stat import S_ISREG
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+SUFFIXES = (".py", ".md")
+# Never worth descending into, whatever the .gitignore says
+DEFAULT_EXCLUDES = (
+    ".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv",
+    ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".ruff_cache",
+)
+MAX_FILE_SIZE = 2 * 1024 * 1024
+# Same heuristic as git: a NUL byte in the first 8000 bytes means binary
+BINARY_SNIFF_BYTES = 8000
+
+
+def _translate(pattern: str) -> str:
+    """
+    Regex for a gitignore glob: '*' and '?' stay within a path segment,
+    '**' spans segments.
+    """
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif c == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif c == "?":
+            parts.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                parts.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body[0] == "!":
+                    body = "^" + body[1:]
+                parts.append("[" + body + "]")
+                i = end + 1
+        elif c == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return "".join(parts)
+
+
+class GitignoreRules:
+    """
+    The rules of one .gitignore file, matched against paths relative to
+    its directory.
+    """
+
+    def __init__(self, lines: Iterable[str]) -> None:
+        self.rules: List[Tuple[Pattern, bool, bool]] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # A slash anywhere but at the end anchors the pattern
+            # to this directory
+            anchored = "/" in line
+            regex = _translate(line.lstrip("/"))
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + r"\Z"), negate, dir_only))
+
+    @classmethod
+    def read(cls, path: str) -> "GitignoreRules":
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return cls(f)
+
+    def match(self, relative_path: str, is_dir: bool) -> Optional[bool]:
+        """
+        True if ignored, False if re-included by a '!' rule, None if no
+        rule applies. The last matching rule wins.
+        """
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                result = not negate
+        return result
+
+
+# .gitignore rules in effect, with the directory (relative to the root)
+# each file applies to
+Rules = List[Tuple[str, GitignoreRules]]
+
+
+class FileDiscovery:
+    """
+    Walks a repository with os.scandir and yields the files worth indexing.
+    Excluded and git-ignored directories are pruned without being listed;
+    files are filtered by suffix, size and content (binary) in that order,
+    so only the candidates that pass the cheap checks are stat'ed or opened.
+    Skipped files and pruned directories are counted by reason.
+    """
+
+    def __init__(
+        self,
+        suffixes: Tuple[str, ...] = SUFFIXES,
+        exclude: Iterable[str] = (),
+        gitignore: bool = True,
+        max_file_size: int = MAX_FILE_SIZE,
+        skip_binary: bool = True,
+    ) -> None:
+        self.suffixes = tuple(suffixes)
+        self.exclude = tuple(DEFAULT_EXCLUDES) + tuple(exclude)
+        # Plain names are a set lookup; only real globs go through the
+        # (single, combined) regex
+        self._exclude_names = {
+            pattern for pattern in self.exclude
+            if not any(c in pattern for c in "*?[/")
+        }
+        globs = [
+            translate(pattern) for pattern in self.exclude
+            if pattern not in self._exclude_names
+        ]
+        self._exclude_regex = re.compile("|".join(globs)) if globs else None
+        self.gitignore = gitignore
+        self.max_file_size = max_file_size
+        self.skip_binary = skip_binary
+        self.skipped: Dict[str, int] = {}
+        self.pruned: Dict[str, int] = {}
+        self.files_found = 0
+
+    def _count(self, counts: Dict[str, int], reason: str) -> None:
+        counts[reason] = counts.get(reason, 0) + 1
+
+    def _excluded(self, relative_path: str, name: str) -> bool:
+        if name in self._exclude_names:
+            return True
+        regex = self._exclude_regex
+        return regex is not None and (
+            regex.match(name) is not None
+            or regex.match(relative_path) is not None
+        )
+
+    @staticmethod
+    def _ignored(rules: "Rules", relative_path: str, is_dir: bool) -> bool:
+        """
+        Applies every .gitignore from the root down; deeper files override
+        shallower ones.
+        """
+        ignored = False
+        for base, gitignore in rules:
+            decision = gitignore.match(relative_path[len(base):], is_dir)
+            if decision is not None:
+                ignored = decision
+        return ignored
+
+    @staticmethod
+    def _is_binary(path: str) -> bool:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(BINARY_SNIFF_BYTES)
+
+    def walk(self, repo_dir: Path) -> Iterator[Tuple[str, int, int]]:
+        """
+        Lazily yields (path, size, mtime_ns) of indexable files, depth first
+        in name order.
+        """
+        root = str(repo_dir)
+        # (directory, its path relative to root with a trailing slash,
+        # .gitignore rules in effect)
+        stack: List[Tuple[str, str, Rules]] = [(root, "", [])]
+        while stack:
+            directory, relative_dir, rules = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                self._count(self.pruned, "unreadable")
+                continue
+            if self.gitignore and any(
+                entry.name == ".gitignore" for entry in entries
+            ):
+                gitignore_path = os.path.join(directory, ".gitignore")
+                try:
+                    gitignore = GitignoreRules.read(gitignore_path)
+                    rules = rules + [(relative_dir, gitignore)]
+                except OSError:
+                    pass
+
+            subdirectories = []
+            for entry in entries:
+                relative_path = relative_dir + entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if self._excluded(relative_path, entry.name):
+                        self._count(self.pruned, "excluded")
+                    elif rules and self._ignored(rules, relative_path, True):
+                        self._count(self.pruned, "gitignored")
+                    else:
+                        subdirectories.append(
+                            (entry.path, relative_path + "/", rules)
+                        )
+                    continue
+
+                found = self._check_file(entry, relative_path, rules)
+                if found is not None:
+                    self.files_found += 1
+                    yield found
+            # Reversed so that the stack pops them in name order
+            stack.extend(reversed(subdirectories))
+
+    def _check_file(self, entry: "os.DirEntry[str]", relative_path: str,
+                    rules: "Rules") -> Optional[Tuple[str, int, int]]:
+        if not entry.name.endswith(self.suffixes):
+            self._count(self.skipped, "suffix")
+            return None
+        if self._excluded(relative_path, entry.name):
+            self._count(self.skipped, "excluded")
+            return None
+        if rules and self._ignored(rules, relative_path, False):
+            self._count(self.skipped, "gitignored")
+            return None
+        try:
+            st = entry.stat()
+        except OSError:
+            self._count(self.skipped, "unreadable")
+            return None
+        if not S_ISREG(st.st_mode):
+            self._count(self.skipped, "not_regular")
+            return None
+        if self.max_file_size and st.st_size > self.max_file_size:
+            self._count(self.skipped, "too_large")
+            return None
+        if self.skip_binary:
+            try:
+                if self._is_binary(entry.path):
+                    self._count(self.skipped, "binary")
+                    return None
+            except OSError:
+                self._count(self.skipped, "unreadable")
+                return None
+        return entry.path, st.st_size, st.st_mtime_ns
+
+    def prefetch(self, repo_dir: Path,
+                 max_ahead: int = 1024) -> Iterator[Tuple[str, int, int]]:
+        """
+        Same as walk(), but the walk runs in a background thread up to
+        max_ahead files ahead of the consumer, so directory listing and stat
+        calls overlap with reading and chunking.
+        """
+        found: "queue.Queue" = queue.Queue(maxsize=max_ahead)
+        done = object()
+        stop = threading.Event()
+        errors: List[BaseException] = []
+
+        def put(item: object) -> bool:
+            while not stop.is_set():
+                try:
+                    found.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def producer() -> None:
+            try:
+                for item in self.walk(repo_dir):
+                    if not put(item):
+                        return
+            except BaseException as e:
+                errors.append(e)
+            put(done)
+
+        thread = threading.Thread(target=producer, name="file-discovery",
+                                  daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = found.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            # The consumer may stop early; let the producer exit instead of
+            # blocking on a full queue
+            stop.set()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def summary(self) -> str:
+        skipped = ", ".join(
+            f"{count} {reason}"
+            for reason, count in sorted(self.skipped.items())
+        ) or "none"
+        pruned = ", ".join(
+            f"{count} {reason}"
+            for reason, count in sorted(self.pruned.items())
+        ) or "none"
+        return (f"Discovery: {self.files_found} files to index | "
+                f"skipped files: {skipped} | pruned directories: {pruned}")
@@ -1,28 +1,272 @@
-from typing import List
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Any, Callable, Deque, Iterable, Iterator, List, NamedTuple, Optional,
+    Tuple,
+)
+from .answer_cache import AnswerCache
 from .models import MinimalSource, MinimalAnswer
+from .tracing import span
+import httpx
 import ollama
 
+
+class GenerationMetrics(NamedTuple):
+    total_s: float
+    # Time to first token; only measured in streaming mode
+    ttft_s: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Prefill and decode time as reported by Ollama
+    prompt_eval_s: float = 0.0
+    eval_s: float = 0.0
+    cached: bool = False
+
+    @property
+    def tokens_per_s(self) -> float:
+        if self.eval_s <= 0:
+            return 0.0
+        return self.completion_tokens / self.eval_s
+
+
+class GenerationResult(NamedTuple):
+    answer: str
+    error: Optional[str]
+    metrics: Optional[GenerationMetrics]
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def latency_report(metrics: List[GenerationMetrics]) -> str:
+    """
+    Aggregates per-question metrics into a short report (cache hits excluded
+    from latencies).
+    """
+    generated = [m for m in metrics if not m.cached]
+    lines = [f"Generation: {len(generated)} generated, "
+             f"{len(metrics) - len(generated)} from cache"]
+    if not generated:
+        return "\n".join(lines)
+
+    totals = sorted(m.total_s for m in generated)
+    lines.append(f"  latency   p50 {_percentile(totals, 0.5):.3f}s  "
+                 f"p95 {_percentile(totals, 0.95):.3f}s  "
+                 f"max {totals[-1]:.3f}s")
+    ttfts = sorted(m.ttft_s for m in generated if m.ttft_s is not None)
+    if ttfts:
+        lines.append(f"  TTFT      p50 {_percentile(ttfts, 0.5):.3f}s  "
+                     f"p95 {_percentile(ttfts, 0.95):.3f}s")
+    prompt_tokens = sum(m.prompt_tokens for m in generated)
+    completion_tokens = sum(m.completion_tokens for m in generated)
+    prefill = sum(m.prompt_eval_s for m in generated)
+    decode = sum(m.eval_s for m in generated)
+    lines.append(f"  tokens    {prompt_tokens} prompt "
+                 f"({prompt_tokens / len(generated):.0f}/question), "
+                 f"{completion_tokens} completion")
+    if decode > 0:
+        lines.append(f"  prefill   {prefill:.2f}s total | "
+                     f"decode {decode:.2f}s total, "
+                     f"{completion_tokens / decode:.1f} tokens/s")
+    return "\n".join(lines)
+
+
 class AnswerGenerator:
-    def __init__(self, model_name: str = "qwen3:0.6b", max_workers: int = 1):
+    def __init__(
+        self,
+        model_name: str = "qwen3:0.6b",
+        max_workers: int = 1,
+        host: Optional[str] = None,
+        timeout: Optional[float] = 120.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_in_flight: Optional[int] = None,
+        cache: Optional[AnswerCache] = None,
+        stream: bool = False,
+    ):
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1.")
         self.model_name = model_name
         self.max_workers = max_workers
-    
-    def generate_answer(self, question: str, retrieved_sources: List[str]) -> str:
+        # Bound the number of prompts queued on the pool but not yet consumed
+        self.max_in_flight = max_in_flight or max_workers * 2
+        self.retries = retries
+        self.backoff = backoff
+        # The client is shared by the worker threads; timeout applies per
+        # request
+        self.client = ollama.Client(host=host, timeout=timeout)
+        self.options = {
+            "num_thread": 8,
+        }
+        self.cache = cache
+        self.stream = stream
+
+    def _build_prompt(self, question: str,
+                      retrieved_sources: List[str]) -> str:
         context = "\n---\n".join(retrieved_sources)
-        prompt = (
+        return (
             f"<|im_start|>system\nYou are a technical assistant. Use the provided context to answer the question briefly.<|im_end|>\n"
             f"<|im_start|>user\nContext: {context}\n\nQuestion: {question}<|im_end|>\n"
             f"<|im_start|>assistant\n"
         )
-        response = ollama.generate(
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, ollama.ResponseError):
+            return (error.status_code == 429 or error.status_code >= 500
+                    or error.status_code == -1)
+        return isinstance(error, (ConnectionError, httpx.TimeoutException,
+                                  httpx.TransportError))
+
+    def _request(
+        self, prompt: str, on_token: Optional[Callable[[str], None]],
+    ) -> Tuple[str, GenerationMetrics]:
+        """
+        One generate call, streamed when a token callback is given or
+        self.stream is set.
+        """
+        start = time.perf_counter()
+        if on_token is None and not self.stream:
+            response = self.client.generate(
+                model=self.model_name,
+                prompt=prompt,
+                think=False,
+                options=self.options
+                )
+            metrics = self._metrics(response, time.perf_counter() - start)
+            return response.get('response', ""), metrics
+
+        pieces = []
+        ttft = None
+        final = None
+        for part in self.client.generate(
             model=self.model_name,
             prompt=prompt,
             think=False,
-            options={
-                "num_thread": 8,
-                }
+            options=self.options,
+            stream=True
+        ):
+            token = part.get('response', "")
+            if token:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                pieces.append(token)
+                if on_token is not None:
+                    on_token(token)
+            if part.get('done'):
+                final = part
+        metrics = self._metrics(final, time.perf_counter() - start, ttft)
+        return "".join(pieces), metrics
+
+    @staticmethod
+    def _metrics(response: Any, total_s: float,
+                 ttft_s: Optional[float] = None) -> GenerationMetrics:
+        if response is None:
+            return GenerationMetrics(total_s=total_s, ttft_s=ttft_s)
+        # Ollama reports durations in nanoseconds
+        return GenerationMetrics(
+            total_s=total_s,
+            ttft_s=ttft_s,
+            prompt_tokens=response.get('prompt_eval_count') or 0,
+            completion_tokens=response.get('eval_count') or 0,
+            prompt_eval_s=(response.get('prompt_eval_duration') or 0) / 1e9,
+            eval_s=(response.get('eval_duration') or 0) / 1e9,
+        )
+
+    def generate_answer_with_metrics(
+        self,
+        question: str,
+        retrieved_sources: List[str],
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[str, GenerationMetrics]:
+        """
+        Generates an answer and returns it with its timing and token counts.
+        on_token, if given, receives each piece of the answer as it is
+        streamed.
+        """
+        prompt = self._build_prompt(question, retrieved_sources)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = AnswerCache.make_key(self.model_name, self.options,
+                                             prompt)
+            with span("answer_cache.get"):
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                if on_token is not None:
+                    on_token(cached)
+                return cached, GenerationMetrics(total_s=0.0, cached=True)
+
+        attempt = 0
+        while True:
+            streamed: List[str] = []
+
+            def forward(token: str) -> None:
+                streamed.append(token)
+                if on_token is not None:
+                    on_token(token)
+            callback = forward if on_token is not None else None
+            try:
+                with span("llm.request", attempt=attempt):
+                    text, metrics = self._request(prompt, callback)
+                break
+            except Exception as e:
+                # Once tokens reached the caller a retry would repeat them
+                if (streamed or attempt >= self.retries
+                        or not self._is_retryable(e)):
+                    raise
+                # Exponential backoff: backoff, 2 * backoff, 4 * backoff...
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+        answer = text.strip()
+        if self.cache is not None and cache_key is not None and answer:
+            self.cache.put(cache_key, answer)
+
+        return answer, metrics
+
+    def generate_answer(self, question: str,
+                        retrieved_sources: List[str]) -> str:
+        return self.generate_answer_with_metrics(question,
+                                                 retrieved_sources)[0]
+
+    def generate_result(self, question: str,
+                        retrieved_sources: List[str]) -> GenerationResult:
+        """
+        Like generate_answer_with_metrics, but a failure is returned as the
+        result's error.
+        """
+        try:
+            answer, metrics = self.generate_answer_with_metrics(
+                question, retrieved_sources
             )
-        
-        answer = response.get('response', "").strip()
+            return GenerationResult(answer, None, metrics)
+        except Exception as e:
+            return GenerationResult("", str(e), None)
+
+    def generate_answers(
+        self, requests: Iterable[Tuple[str, List[str]]],
+    ) -> Iterator[GenerationResult]:
+        """
+        Generates answers for (question, retrieved_sources) pairs over
+        max_workers threads. Yields a GenerationResult per pair in input
+        order; a failed request has an empty answer and its error message.
+        """
+        if self.max_workers == 1:
+            for question, retrieved_sources in requests:
+                yield self.generate_result(question, retrieved_sources)
+            return
 
-        return answer
\ No newline at end of file
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending: Deque[Future] = deque()
+            for question, retrieved_sources in requests:
+                pending.append(executor.submit(self.generate_result,
+                                               question, retrieved_sources))
+                if len(pending) >= self.max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
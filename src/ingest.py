@@ -0,0 +1,212 @@
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union,
+)
+from .chunker import RepositoryChunker
+from .discovery import FileDiscovery
+from .manifest import ManifestEntry
+from .tracing import span
+
+# Per-process chunker, created once by the pool initializer
+_worker_chunker: Optional[RepositoryChunker] = None
+
+
+class FileResult(NamedTuple):
+    file_path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    # None when the file is unchanged since the last index run
+    chunks: Optional[List[dict]]
+    read_seconds: float = 0.0
+    chunk_seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def _init_worker(chunk_size: int, chunk_overlap: int,
+                 language_settings: Dict[str, Tuple[int, int]]) -> None:
+    global _worker_chunker
+    _worker_chunker = RepositoryChunker(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+        language_settings=language_settings,
+    )
+
+
+def _read_and_chunk(
+    file_path: str,
+    size: int,
+    mtime_ns: int,
+    known_hash: Optional[str] = None,
+    chunker: Optional[RepositoryChunker] = None,
+) -> FileResult:
+    """
+    Reads, hashes and chunks one file.
+    Chunking is skipped when the content hash matches `known_hash`.
+    """
+    chunker = chunker or _worker_chunker
+    assert chunker is not None, "no chunker outside of a pool worker"
+    start = time.perf_counter()
+    try:
+        with span("read"):
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            content_hash = hashlib.sha256(
+                content.encode("utf-8")
+            ).hexdigest()
+    except Exception as e:
+        return FileResult(file_path, size, mtime_ns, "", [],
+                          time.perf_counter() - start, error=str(e))
+    read_seconds = time.perf_counter() - start
+
+    if content_hash == known_hash:
+        return FileResult(file_path, size, mtime_ns, content_hash, None,
+                          read_seconds)
+
+    start = time.perf_counter()
+    try:
+        with span("chunk"):
+            chunks = chunker.chunk_file(file_path, content)
+    except Exception as e:
+        return FileResult(file_path, size, mtime_ns, content_hash, [],
+                          read_seconds, time.perf_counter() - start, str(e))
+    return FileResult(file_path, size, mtime_ns, content_hash, chunks,
+                      read_seconds, time.perf_counter() - start)
+
+
+class IngestionPipeline:
+    """
+    Streams repository files through read -> chunk, either inline or over a
+    process pool. Output order always follows discovery order, whatever the
+    number of workers. Files whose size and mtime match `known` entries are
+    passed through without being read. Discovery runs up to `prefetch` files
+    ahead in a background thread (0 walks inline).
+    """
+
+    def __init__(self, chunker: RepositoryChunker, workers: int = 1,
+                 max_in_flight: Optional[int] = None,
+                 discovery: Optional[FileDiscovery] = None,
+                 prefetch: int = 1024) -> None:
+        if workers < 1:
+            raise ValueError("workers must be >= 1.")
+        self.chunker = chunker
+        self.workers = workers
+        self.discovery = discovery or FileDiscovery()
+        self.prefetch = prefetch
+        # Bound the number of files submitted but not yet consumed
+        self.max_in_flight = max_in_flight or workers * 4
+        self.timings: Dict[str, float] = {}
+        self.files_processed = 0
+        self.files_unchanged = 0
+        self.files_failed = 0
+        self.chunks_produced = 0
+
+    def _add_time(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def discover(self, repo_dir: Path) -> Iterator[Tuple[str, int, int]]:
+        """
+        Lazily yields (path, size, mtime_ns) of indexable files, timing how
+        long the pipeline waits on the walk.
+        """
+        if self.prefetch > 0:
+            walker = self.discovery.prefetch(repo_dir, max_ahead=self.prefetch)
+        else:
+            walker = self.discovery.walk(repo_dir)
+        while True:
+            start = time.perf_counter()
+            try:
+                with span("discover"):
+                    found = next(walker)
+            except StopIteration:
+                self._add_time("discover", time.perf_counter() - start)
+                return
+            self._add_time("discover", time.perf_counter() - start)
+            yield found
+
+    def _collect(self, result: FileResult) -> FileResult:
+        self._add_time("read", result.read_seconds)
+        self._add_time("chunk", result.chunk_seconds)
+        if result.error is not None:
+            self.files_failed += 1
+            print(f"Error processing {result.file_path}: {result.error}")
+        elif result.chunks is None:
+            self.files_unchanged += 1
+        else:
+            self.files_processed += 1
+            self.chunks_produced += len(result.chunks)
+        return result
+
+    def run(
+        self, repo_dir: Path,
+        known: Optional[Dict[str, ManifestEntry]] = None,
+    ) -> Iterator[FileResult]:
+        """
+        Yields a FileResult for every discovered file, in discovery order.
+        """
+        known = known or {}
+        start = time.perf_counter()
+        if self.workers == 1:
+            for file_path, size, mtime_ns in self.discover(repo_dir):
+                entry = known.get(file_path)
+                if (entry is not None and entry.size == size
+                        and entry.mtime_ns == mtime_ns):
+                    yield self._collect(FileResult(
+                        file_path, size, mtime_ns, entry.content_hash, None
+                    ))
+                    continue
+                yield self._collect(_read_and_chunk(
+                    file_path, size, mtime_ns,
+                    entry.content_hash if entry else None, self.chunker,
+                ))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.chunker.chunk_size, self.chunker.chunk_overlap,
+                          self.chunker.language_settings),
+            ) as executor:
+                # Unchanged files are queued as ready results to keep the
+                # ordering
+                pending: Deque[Union[Future, FileResult]] = deque()
+                for file_path, size, mtime_ns in self.discover(repo_dir):
+                    entry = known.get(file_path)
+                    if (entry is not None and entry.size == size
+                            and entry.mtime_ns == mtime_ns):
+                        pending.append(FileResult(
+                            file_path, size, mtime_ns, entry.content_hash,
+                            None,
+                        ))
+                    else:
+                        pending.append(executor.submit(
+                            _read_and_chunk, file_path, size, mtime_ns,
+                            entry.content_hash if entry else None,
+                        ))
+                    if len(pending) >= self.max_in_flight:
+                        yield self._collect(self._next_result(pending))
+                while pending:
+                    yield self._collect(self._next_result(pending))
+        self._add_time("pipeline", time.perf_counter() - start)
+
+    @staticmethod
+    def _next_result(
+        pending: Deque[Union[Future, FileResult]],
+    ) -> FileResult:
+        item = pending.popleft()
+        return item.result() if isinstance(item, Future) else item
+
+    def print_summary(self) -> None:
+        print("=" * 50)
+        print(f"Files: {self.files_processed} chunked, "
+              f"{self.files_unchanged} unchanged, "
+              f"{self.files_failed} failed | "
+              f"Chunks: {self.chunks_produced} new | "
+              f"Workers: {self.workers}")
+        print(self.discovery.summary())
+        for stage, seconds in self.timings.items():
+            print(f"  {stage:<10} {seconds:8.2f}s")
+        if self.workers > 1:
+            print("  (read/chunk are summed across workers)")
@@ -0,0 +1,176 @@
+import json
+import os
+from pathlib import Path
+from typing import (
+    Iterable, Iterator, Optional, Set, TextIO, Tuple, Type, Union,
+)
+from pydantic import BaseModel
+from .models import MinimalAnswer, MinimalSearchResults
+
+HEADER_KEY = "_header"
+# Set on results that failed (e.g. an answer left empty after retries)
+ERROR_KEY = "error"
+
+
+def read_jsonl(path: str) -> Tuple[dict, Iterator[dict]]:
+    """
+    Header and a lazy iterator over the records of a results file.
+    A truncated last line (the process died mid-write) is ignored.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+    try:
+        header = json.loads(first)[HEADER_KEY]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(
+            f"{path} is not a results JSONL file (missing header line)."
+        )
+
+    # The file is only opened once iteration starts, and closed when the
+    # generator finishes or is closed (including on early exit)
+    def records() -> Iterator[dict]:
+        with open(path, "r", encoding="utf-8") as f:
+            f.readline()
+            for line in f:
+                if not line.endswith("\n"):
+                    return
+                yield json.loads(line)
+
+    return header, records()
+
+
+class JsonlResults:
+    """
+    Append-only JSONL file with one result per line, written as each result
+    completes. The first line is a header ({"_header": {"k": ...}}).
+    Reopening an existing file resumes it: a truncated last line is cut off
+    and the question ids already written without an error are returned so
+    they can be skipped; failed ones are retried.
+    """
+
+    def __init__(self, path: Union[str, Path], k: int) -> None:
+        self.path = Path(path)
+        self.k = k
+        self._file: Optional[TextIO] = None
+        self.written = 0
+
+    def open(self) -> Set[str]:
+        """
+        Opens the file for appending and returns the question ids it already
+        holds a successful result for.
+        """
+        done: Set[str] = set()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists() and self.path.stat().st_size > 0:
+            header, records = read_jsonl(str(self.path))
+            if header.get("k") != self.k:
+                raise ValueError(
+                    f"{self.path} was written with k={header.get('k')}; "
+                    f"use the same --k or delete it to start over."
+                )
+            valid_size = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    valid_size += len(line)
+            for record in records:
+                if ERROR_KEY not in record:
+                    done.add(record["question_id"])
+            # Drop a partial line left by an interrupted run
+            if valid_size < self.path.stat().st_size:
+                os.truncate(self.path, valid_size)
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._file.write(json.dumps({HEADER_KEY: {"k": self.k}}) + "\n")
+            self._file.flush()
+        return done
+
+    def write_many(self, results: Iterable[Union[BaseModel, dict]]) -> None:
+        """
+        Appends results and flushes them to the OS, so they survive a crash
+        of this process.
+        """
+        assert self._file is not None, (
+            "JsonlResults.open() must be called before writing."
+        )
+        for result in results:
+            if isinstance(result, BaseModel):
+                line = result.model_dump_json()
+            else:
+                line = json.dumps(result)
+            self._file.write(line + "\n")
+            self.written += 1
+        self._file.flush()
+
+    def write(self, result: Union[BaseModel, dict],
+              error: Optional[str] = None) -> None:
+        """
+        Appends one result; with an error, it is kept for the output but
+        retried on resume.
+        """
+        if error is not None:
+            if isinstance(result, BaseModel):
+                result = result.model_dump()
+            result = {**result, ERROR_KEY: error}
+        self.write_many([result])
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "JsonlResults":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def compact(
+    jsonl_path: str, output_path: str,
+    model: Optional[Type[MinimalSearchResults]] = None,
+) -> Tuple[int, int]:
+    """
+    Writes the records of a results JSONL file as the StudentSearchResults
+    (or StudentSearchResultsAndAnswer) JSON shape, one record in memory at
+    a time. Records are validated with `model` (detected from the first
+    record when None); repeated question ids keep their first successful
+    occurrence, and a failed record is only written when its question never
+    succeeded.
+    Returns the number of records written and how many of them are failed
+    ones.
+    """
+    # First pass: which questions have a successful record, so a failure
+    # retried later is dropped
+    _, records = read_jsonl(jsonl_path)
+    succeeded = {
+        record["question_id"] for record in records
+        if ERROR_KEY not in record
+    }
+
+    header, records = read_jsonl(jsonl_path)
+    save_path = Path(output_path)
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = save_path.with_name(save_path.name + ".tmp")
+    seen: Set[str] = set()
+    failed = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write('{"search_results": [')
+        for record in records:
+            if record["question_id"] in seen:
+                continue
+            if ERROR_KEY in record:
+                if record["question_id"] in succeeded:
+                    continue
+                failed += 1
+            if model is None:
+                model = (MinimalAnswer if "answer" in record
+                         else MinimalSearchResults)
+            result = model.model_validate(record)
+            f.write(("\n" if not seen else ",\n") + result.model_dump_json())
+            seen.add(result.question_id)
+        f.write(f'\n], "k": {json.dumps(header["k"])}}}\n')
+    os.replace(tmp_path, save_path)
+    return len(seen), failed
@@ -1,75 +1,695 @@
-import fire
 import csv
+import itertools
 import json
+import sys
+import time
 from pathlib import Path
-from tqdm import tqdm
-from .chunker import RepositoryChunker
-from .retriever import BM25Retriever
-from .generator import AnswerGenerator
-from .models import StudentSearchResults, MinimalSearchResults, MinimalSource, DatasetRecallAtK, MinimalAnswer, StudentSearchResultsAndAnswer
-from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING, Any, Callable, Iterable, List, Optional, Union,
+)
+from .discovery import MAX_FILE_SIZE
+
+if TYPE_CHECKING:
+    from .chunk_store import ChunkStore
+    from .chunker import RepositoryChunker
+    from .context import ContextPacker
+    from .discovery import FileDiscovery
+    from .generator import GenerationResult
+    from .models import MinimalSource
+    from .query_cache import QueryCache
+    from .retriever import BM25Retriever
+    from .startup import ImportRow
+
+# Commands import what they use when they run: a search should not pay for
+# the text splitters, the Ollama client or the benchmark tooling.
+
 
 class RagCLI:
-    def __init__(self):
-        self.chunker = RepositoryChunker()
-        self.retriever = BM25Retriever()
+    def __init__(self, trace: str = "", profile: str = "") -> None:
+        """
+        --trace PATH records timing spans (file reads, chunking,
+        tokenization, BM25, LLM calls...) as a Chrome trace (chrome://tracing
+        or ui.perfetto.dev) and prints a per-stage table.
+        --profile PATH runs the command under cProfile and dumps the stats to
+        PATH.
+        """
+        self._chunker: Optional["RepositoryChunker"] = None
+        self._retriever: Optional["BM25Retriever"] = None
         self.index_path = Path("data/processed")
+        self.sharded_path = Path("data/sharded")
+        self.chunk_store: Optional["ChunkStore"] = None
+        if trace or profile:
+            self._instrument(trace, profile)
+
+    @staticmethod
+    def _instrument(trace: str, profile: str) -> None:
+        """
+        Starts tracing and/or profiling; the reports are written when the
+        process exits.
+        """
+        import atexit
+
+        start = time.perf_counter()
+        profiler = None
+        if trace:
+            from . import tracing
+
+            tracing.enable()
+        if profile:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        def finish() -> None:
+            wall = time.perf_counter() - start
+            if profiler is not None:
+                import pstats
+
+                profiler.disable()
+                Path(profile).parent.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(profile)
+                print("=" * 50)
+                # Only the main thread is profiled; worker threads and
+                # processes are not
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+                print(f"Saved cProfile stats to {profile} "
+                      f"(python -m pstats {profile})")
+            if trace:
+                tracing.disable()
+                tracing.save_chrome_trace(trace)
+                print("=" * 50)
+                print(tracing.stage_table(wall))
+                print(f"Saved trace to {trace}")
 
-    def __get_text_from_answer(self, retrieved_sources: list[MinimalSource]) -> list[str]:
+        atexit.register(finish)
+
+    @property
+    def chunker(self) -> "RepositoryChunker":
+        if self._chunker is None:
+            from .chunker import RepositoryChunker
+
+            self._chunker = RepositoryChunker()
+        return self._chunker
+
+    @property
+    def retriever(self) -> "BM25Retriever":
+        if self._retriever is None:
+            from .retriever import BM25Retriever
+
+            self._retriever = BM25Retriever()
+        return self._retriever
+
+    def _load_retriever(
+        self,
+        hybrid: bool = False,
+        budget_ms: float = 50.0,
+        candidates: int = 50,
+        cache: Optional["QueryCache"] = None,
+        sharded: bool = False,
+        rerank: bool = False,
+        rerank_pool: int = 50,
+        rerank_budget_ms: float = 20.0,
+        rerank_model: str = "",
+    ) -> Any:
+        """
+        Loads the BM25 index, fused with the dense index when hybrid is set,
+        or the sharded index.
+        With rerank, the first stage fetches rerank_pool candidates that are
+        re-ordered before the top-k is cut.
+        """
+        retriever: Any
+        if sharded:
+            # The query cache and the dense index belong to the single index
+            if hybrid:
+                raise ValueError("--hybrid is not supported with --sharded.")
+            from .sharded import ShardedRetriever
+
+            retriever = ShardedRetriever()
+            retriever.load(str(self.sharded_path))
+        else:
+            self.retriever.load(str(self.index_path))
+            self.retriever.cache = cache
+            retriever = self.retriever
+            if hybrid:
+                from .dense import DenseIndex, HybridRetriever
+
+                if not DenseIndex.exists(str(self.index_path)):
+                    raise FileNotFoundError(
+                        f"No dense index under {self.index_path}. "
+                        "Run index with --dense first."
+                    )
+                retriever = HybridRetriever(
+                    self.retriever, DenseIndex.load(str(self.index_path)),
+                    candidates=candidates, budget_ms=budget_ms,
+                )
+        if not rerank:
+            return retriever
+        from .rerank import Reranker, RerankingRetriever, make_scorer
+
+        return RerankingRetriever(
+            retriever, self._get_chunk_store(),
+            Reranker(make_scorer(rerank_model)),
+            pool=rerank_pool, budget_ms=rerank_budget_ms,
+        )
+
+    @staticmethod
+    def _make_discovery(exclude: tuple, max_file_size: int,
+                        no_gitignore: bool) -> "FileDiscovery":
+        from .discovery import FileDiscovery
+
+        if isinstance(exclude, str):
+            exclude = (exclude,)
+        return FileDiscovery(exclude=exclude, gitignore=not no_gitignore,
+                             max_file_size=max_file_size)
+
+    def _get_chunk_store(self) -> "ChunkStore":
+        from .chunk_store import ChunkStore
+
+        if self.chunk_store is None:
+            self.chunk_store = ChunkStore(
+                str(self.index_path) if self.index_path.exists() else None
+            )
+        return self.chunk_store
+
+    def __get_text_from_answer(
+        self,
+        retrieved_sources: "list[MinimalSource]",
+        packer: Optional["ContextPacker"] = None,
+        question: str = "",
+    ) -> list[str]:
         """
         Helper function to extract text from retrieved sources.
+        With a packer, the texts are merged, deduplicated and trimmed for the
+        question.
         """
-        texts = []
+        from .context import format_source
+
+        chunk_store = self._get_chunk_store()
+        pairs = []
         for source in retrieved_sources:
             try:
-                with open(source.file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                    start = source.first_character_index
-                    end = source.last_character_index
-                    
-                    text_chunk = content[start:end]
-                    formatted = f"Source File: {source.file_path}\nContent:\n{text_chunk}\n"
-                    texts.append(formatted)
+                pairs.append((source, chunk_store.get_text(source)))
             except Exception as e:
                 print(f"Error reading {source.file_path}: {e}")
                 continue
-        return texts
+        if packer is not None:
+            return packer.pack(question, pairs)
+        return [format_source(source.file_path, text_chunk)
+                for source, text_chunk in pairs]
 
-    def index(self, repo_path: str = "data/raw/vllm-0.10.1", max_chunk_size: int = 2000):
+    def index(
+        self,
+        repo_path: str = "data/raw/vllm-0.10.1",
+        max_chunk_size: int = 2000,
+        workers: int = 1,
+        full: bool = False,
+        dense: str = "",
+        dense_dtype: str = "float16",
+        exclude: tuple = (),
+        max_file_size: int = MAX_FILE_SIZE,
+        no_gitignore: bool = False,
+        chunking: Optional[dict] = None,
+    ) -> None:
         """
         Ingest and index the repository files.
+        Use --workers N to read and chunk files over N processes.
+        Only changed files are re-chunked when a manifest from a previous run
+        exists; --full forces a cold build.
+        --dense ENCODER also embeds every chunk ('hashing' or a
+        sentence-transformers model path) for --hybrid search.
+        Discovery skips .gitignore'd paths (unless --no_gitignore), --exclude
+        globs, binary files and files over --max_file_size bytes (0 for no
+        limit).
+        --chunking sets (chunk_size, chunk_overlap) per suffix,
+        e.g. --chunking '{".md": [1500, 300]}'.
         """
+        from tqdm import tqdm
+        from .ingest import IngestionPipeline
+        from .manifest import IndexManifest, ManifestEntry
+
         print(f"Indexing repository at {repo_path}...")
-        all_chunks = []
         repo_dir = Path(repo_path)
-        
-        files = list(repo_dir.rglob("*"))
-        files = [f for f in files if f.suffix in [".py", ".md"]]
-        
-        for file_path in tqdm(files, desc="Processing files"):
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                
-                file_chunks = self.chunker.chunk_file(str(file_path), content)
-                all_chunks.extend(file_chunks)
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
+        if chunking:
+            from .chunker import RepositoryChunker
+            self._chunker = RepositoryChunker(
+                language_settings=chunking
+            )
 
-        self.retriever.build_index(all_chunks)
+        chunker = self.chunker
+        manifest = None if full else IndexManifest.load(
+            str(self.index_path), chunker.chunk_size, chunker.chunk_overlap,
+            chunker.language_settings
+        )
+        known = manifest.files if manifest else {}
+        new_manifest = IndexManifest(
+            chunk_size=chunker.chunk_size,
+            chunk_overlap=chunker.chunk_overlap,
+            language_settings=chunker.language_settings,
+        )
+
+        # Each file contributes either its reused chunk id range or its new
+        # chunks
+        segments: List[Union[range, List[dict]]] = []
+        next_chunk_id = 0
+        discovery = self._make_discovery(exclude, max_file_size, no_gitignore)
+        pipeline = IngestionPipeline(self.chunker, workers=workers,
+                                     discovery=discovery)
+        results = pipeline.run(repo_dir, known=known)
+        for result in tqdm(results, desc="Processing files", unit="file"):
+            if result.error is not None:
+                continue
+            if result.chunks is None:
+                entry = known[result.file_path]
+                segment = range(entry.chunk_start, entry.chunk_end)
+            else:
+                segment = result.chunks
+            segments.append(segment)
+            new_manifest.files[result.file_path] = ManifestEntry(
+                size=result.size,
+                mtime_ns=result.mtime_ns,
+                content_hash=result.content_hash,
+                chunk_start=next_chunk_id,
+                chunk_end=next_chunk_id + len(segment),
+            )
+            next_chunk_id += len(segment)
+
+        removed = len(set(known) - set(new_manifest.files))
+        unchanged = manifest is not None and removed == 0 and all(
+            isinstance(segment, range) and segment.start == entry.chunk_start
+            for segment, entry in zip(segments, new_manifest.files.values())
+        )
+
+        start = time.perf_counter()
+        if unchanged:
+            print("No indexed file changed, keeping the existing index.")
+        else:
+            if manifest is not None:
+                self.retriever.load_for_update(str(self.index_path))
+            self.retriever.rebuild_index(segments)
+        pipeline.timings["index"] = time.perf_counter() - start
+
+        start = time.perf_counter()
         self.index_path.mkdir(parents=True, exist_ok=True)
-        self.retriever.save(str(self.index_path))
-        
+        if not unchanged:
+            self.retriever.save(str(self.index_path))
+        new_manifest.save(str(self.index_path))
+        pipeline.timings["save"] = time.perf_counter() - start
+
+        if dense:
+            start = time.perf_counter()
+            indexed_before = max(
+                (entry.chunk_end for entry in known.values()), default=0
+            )
+            self._index_dense(dense, dense_dtype, segments, unchanged,
+                              indexed_before)
+            pipeline.timings["dense"] = time.perf_counter() - start
+        elif not unchanged:
+            from .dense import DenseIndex
+
+            # Its rows follow the previous chunk ids: hybrid search would
+            # fuse the wrong chunks
+            if DenseIndex.exists(str(self.index_path)):
+                DenseIndex.remove(str(self.index_path))
+                print("Removed the dense index, out of date with the new "
+                      "chunks. Run index with --dense to rebuild it.")
+
+        pipeline.print_summary()
+        if manifest is not None:
+            print(f"Removed files: {removed}")
         print(f"Ingestion complete! Indices saved under {self.index_path}")
 
-    def search(self, query: str, k: int = 10):
+    def _index_dense(self, spec: str, dtype: str, segments: list,
+                     unchanged: bool, indexed_before: int) -> None:
         """
-        Search the indexed repository for a single query.
+        Embeds the chunks, reusing the rows of unchanged files when the dense
+        index on disk matches the encoder, the dtype and the previous chunk
+        ids.
         """
+        from .dense import DenseIndex, make_encoder
+        from .retriever import BM25Retriever
 
-        self.retriever.load(str(self.index_path))
+        directory = str(self.index_path)
+        version = BM25Retriever.read_version(directory)
+        encoder = make_encoder(spec)
+        previous = None
+        if indexed_before and DenseIndex.exists(directory):
+            config = DenseIndex.read_config(directory)
+            if (config["encoder"] == encoder.name
+                    and config["dtype"] == dtype):
+                previous = DenseIndex.load(directory, encoder=encoder)
+                if len(previous) != indexed_before:
+                    previous = None
+        if (unchanged and previous is not None
+                and previous.version == version):
+            return
+        if unchanged:
+            # Nothing was rebuilt, so the chunk texts are not in memory yet
+            self.retriever.load_for_update(directory)
+        dense_index = DenseIndex.build(encoder, self.retriever.corpus,
+                                       segments, previous, dtype=dtype)
+        dense_index.version = version
+        dense_index.save(directory)
+        print(f"Dense index: {len(dense_index)} vectors "
+              f"({encoder.name}, {dtype})")
+
+    def index_sharded(
+        self,
+        repo_paths: tuple = ("data/raw/vllm-0.10.1",),
+        shard_by: str = "chunks",
+        shard_size: int = 50000,
+        workers: int = 1,
+        exclude: tuple = (),
+        max_file_size: int = MAX_FILE_SIZE,
+        no_gitignore: bool = False,
+    ) -> None:
+        """
+        Index one or more repositories into a sharded index under
+        data/sharded.
+        Shards hold --shard_size chunks (--shard_by chunks) or one top-level
+        directory each (--shard_by directory); only one shard is in memory at
+        a time. Search it with --sharded.
+        Discovery options are the same as for index.
+        """
+        from tqdm import tqdm
+        from .ingest import IngestionPipeline
+        from .sharded import ShardedIndexBuilder
+
+        if isinstance(repo_paths, str):
+            repo_paths = (repo_paths,)
+        start = time.perf_counter()
+        builder = ShardedIndexBuilder(
+            str(self.sharded_path), shard_by=shard_by, shard_size=shard_size,
+            k1=self.retriever.k1, b=self.retriever.b,
+        )
+        discovery = self._make_discovery(exclude, max_file_size, no_gitignore)
+        pipeline = IngestionPipeline(self.chunker, workers=workers,
+                                     discovery=discovery)
+        for repo_path in repo_paths:
+            repo_dir = Path(repo_path)
+            print(f"Indexing repository at {repo_path}...")
+            results = pipeline.run(repo_dir)
+            for result in tqdm(results, desc="Processing files", unit="file"):
+                if result.error is not None or not result.chunks:
+                    continue
+                relative = Path(result.file_path).relative_to(repo_dir)
+                parts = relative.parts
+                top_level = parts[0] if len(parts) > 1 else "."
+                builder.add(result.chunks,
+                            key=f"{repo_dir.name}/{top_level}")
+        layout = builder.finish()
+        print(discovery.summary())
+
+        print(f"{layout['n_docs']} chunks in {len(layout['shards'])} shards, "
+              f"{layout['vocab_size']} tokens, "
+              f"{time.perf_counter() - start:.2f}s")
+        print(f"Sharded index saved under {self.sharded_path}")
+
+    def bench_chunker(self, repo_path: str = "data/raw/vllm-0.10.1",
+                      top_n: int = 20, repeat: int = 3) -> None:
+        """
+        Compare legacy (split + find) and span-based chunking on the largest
+        files.
+        """
+        from .benchmarks import benchmark_chunker
+
+        rows = benchmark_chunker(repo_path, top_n=top_n, repeat=repeat,
+                                 chunk_size=self.chunker.chunk_size)
+
+        print(f"{'chars':>9} {'chunks':>7} {'legacy ms':>10} {'span ms':>9} "
+              f"{'speedup':>8} {'diff':>5}  file")
+        for row in rows:
+            print(f"{row['chars']:>9} {row['chunks']:>7} "
+                  f"{row['legacy_s'] * 1000:>10.2f} "
+                  f"{row['span_s'] * 1000:>9.2f} "
+                  f"{row['legacy_s'] / row['span_s']:>7.1f}x "
+                  f"{row['offsets_differ']:>5}  {row['file_path']}")
+        legacy_total = sum(row["legacy_s"] for row in rows)
+        span_total = sum(row["span_s"] for row in rows)
+        speedup = legacy_total / max(span_total, 1e-9)
+        bad_offsets = sum(row["bad_legacy_offsets"] for row in rows)
+        print("=" * 50)
+        print(f"Total: legacy {legacy_total:.3f}s | span {span_total:.3f}s | "
+              f"speedup {speedup:.1f}x")
+        print(f"Legacy chunks with -1 offsets: {bad_offsets}")
+
+    def bench_small_files(self, n_files: int = 5000,
+                          repeat: int = 3) -> None:
+        """
+        Measure the per-file overhead removed by reusing splitters and the
+        shared stemmer.
+        """
+        from .benchmarks import benchmark_small_files
+
+        rows = benchmark_small_files(n_files=n_files, repeat=repeat,
+                                     chunk_size=self.chunker.chunk_size)
+
+        print(f"{'stage':<9} {'files':>6} {'per-file ms':>12} "
+              f"{'reused ms':>10} {'speedup':>8} {'saved us/file':>14}")
+        for row in rows:
+            speedup = row["before_s"] / max(row["after_s"], 1e-9)
+            print(f"{row['stage']:<9} {row['files']:>6} "
+                  f"{row['before_s'] * 1000:>12.1f} "
+                  f"{row['after_s'] * 1000:>10.1f} "
+                  f"{speedup:>7.1f}x {row['saved_us_per_file']:>14.1f}")
+
+    def bench_load(self) -> None:
+        """
+        Compare index startup time and memory of the legacy, in-memory and
+        mmap load modes.
+        """
+        from .benchmarks import benchmark_load
+
+        rows = benchmark_load(str(self.index_path))
+
+        print(f"{'mode':<10} {'load s':>8} {'1st search s':>13} "
+              f"{'source objects':>15} {'RSS growth MB':>14}")
+        for row in rows:
+            print(f"{row['mode']:<10} {row['load_s']:>8.3f} "
+                  f"{row['first_search_s']:>13.3f} "
+                  f"{row['source_objects']:>15} {row['rss_growth_mb']:>14.1f}")
+
+    def bench_metadata(self, repeat: int = 5) -> None:
+        """
+        Compare the size, load time and lookup time of the chunk metadata
+        formats.
+        """
+        from .benchmarks import benchmark_metadata
+
+        rows = benchmark_metadata(str(self.index_path), repeat=repeat)
+
+        print(f"{'format':<20} {'MB':>8} {'load ms':>9} {'1k lookups ms':>14}")
+        for row in rows:
+            print(f"{row['format']:<20} {row['bytes'] / 1e6:>8.2f} "
+                  f"{row['load_s'] * 1000:>9.2f} "
+                  f"{row['lookup_s'] * 1000:>14.2f}")
+
+    def convert_metadata(self, directory: str = "data/processed") -> None:
+        """
+        Convert the chunk metadata of an index (and of every shard of a
+        sharded index) to metadata.bin.
+        """
+        from .metadata import convert_metadata
+
+        directories = [Path(directory)]
+        if (Path(directory) / "shards.json").exists():
+            directories = sorted(Path(directory).glob("shard_*"))
+        for index_dir in directories:
+            try:
+                before, after = convert_metadata(str(index_dir))
+            except FileNotFoundError:
+                print(f"{index_dir}: already converted")
+                continue
+            print(f"{index_dir}: {before / 1e6:.2f} MB -> "
+                  f"{after / 1e6:.2f} MB")
+
+    def bench_generate(self, questions: int = 64,
+                       workers: tuple = (1, 2, 4, 8), delay_ms: float = 100.0,
+                       fail_first: int = 0) -> None:
+        """
+        Measure answer generation throughput per worker count against a stub
+        Ollama server.
+        """
+        from .benchmarks import benchmark_generation
+
+        rows = benchmark_generation(questions=questions,
+                                    workers=tuple(workers), delay_ms=delay_ms,
+                                    fail_first=fail_first)
+
+        print(f"{'workers':>7} {'seconds':>8} {'q/s':>7} {'failed':>6}")
+        for row in rows:
+            print(f"{row['workers']:>7} {row['seconds']:>8.2f} "
+                  f"{row['questions_per_s']:>7.1f} {row['failed']:>6}")
+
+    def bench(
+        self,
+        n_files: int = 500,
+        seed: int = 0,
+        repeat: int = 3,
+        output_path: str = "data/output/bench.json",
+        baseline: Optional[str] = None,
+        threshold: float = 0.10,
+    ) -> None:
+        """
+        Time every pipeline stage on a deterministic synthetic repository and
+        save the results as JSON.
+        With --baseline, compare against a previous results file and exit
+        with status 1 on regressions; a missing baseline file is created from
+        this run instead.
+        """
+        from .bench_suite import (
+            compare_results, config_mismatch, load_results, run_suite,
+            save_results,
+        )
+
+        results = run_suite(n_files=n_files, seed=seed, repeat=repeat)
+        save_results(results, output_path)
+
+        machine = results["machine"]
+        config = results["config"]
+        print(f"{machine['platform']} | {machine['cpu_count']} CPUs | "
+              f"Python {machine['python']}")
+        print(f"{config['n_files']} files, {config['chunks']} chunks, "
+              f"best of {repeat}")
+        if baseline is not None and not Path(baseline).exists():
+            save_results(results, baseline)
+            print(f"No baseline at {baseline}: saved this run as the "
+                  "baseline, nothing to compare yet.")
+            baseline = None
+        if baseline is None:
+            for stage, value in results["stages"].items():
+                print(f"  {stage:<18} {value:>10.4f}")
+            print(f"Saved benchmark results to {output_path}")
+            return
+
+        previous = load_results(baseline)
+        mismatch = config_mismatch(results, previous)
+        if mismatch:
+            print(f"Warning: config differs from the baseline "
+                  f"({', '.join(mismatch)}), timings are not comparable")
+        rows = compare_results(results, previous, threshold=threshold)
+        print(f"  {'stage':<18} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for row in rows:
+            baseline_value = (f"{row['baseline']:>10.4f}"
+                              if row["baseline"] is not None
+                              else f"{'-':>10}")
+            ratio = (f"{row['ratio']:>6.2f}x" if row["ratio"] is not None
+                     else f"{'-':>7}")
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"  {row['stage']:<18} {baseline_value} "
+                  f"{row['current']:>10.4f} {ratio}{flag}")
+        print(f"Saved benchmark results to {output_path}")
+
+        regressions = [row["stage"] for row in rows if row["regression"]]
+        if regressions:
+            print(f"{len(regressions)} stage(s) more than {threshold:.0%} "
+                  f"slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+    def sweep(
+        self,
+        repo_path: str = "data/raw/vllm-0.10.1",
+        dataset_path: str = (
+            "data/datasets/AnsweredQuestions/dataset_docs_public.json"
+        ),
+        chunk_sizes: tuple = (1000, 1500, 2000),
+        overlaps: tuple = (0.0, 0.25),
+        k1s: tuple = (1.2, 1.5),
+        bs: tuple = (0.5, 0.75),
+        workers: int = 0,
+        output_path: str = "data/output/sweep.csv",
+    ) -> None:
+        """
+        Grid search over chunk size, overlap (fraction of the chunk size) and
+        BM25 k1/b.
+        Reports recall@k, index size, build time and query latency per
+        configuration, and picks the fastest one with recall@5 >= 0.75.
+        """
+        from .sweep import (
+            MIN_RECALL_AT_5, format_table, pick_fastest, run_sweep,
+        )
+
+        with open(dataset_path, "r", encoding="utf-8") as f:
+            dataset = json.load(f)
+        # Questions without sources cannot be scored
+        questions = [q for q in dataset.get("rag_questions", [])
+                     if q.get("sources")]
+        if not questions:
+            raise ValueError(
+                f"No answered questions with sources in {dataset_path}"
+            )
+
+        start = time.perf_counter()
+        rows = run_sweep(repo_path, questions, tuple(chunk_sizes),
+                         tuple(overlaps), tuple(k1s), tuple(bs),
+                         workers=workers)
+        best = pick_fastest(rows)
 
-        results = self.retriever.search(query, k=k)
+        print(format_table(rows, best))
+        print("=" * 50)
+        print(f"Sweep of {len(rows)} configurations took "
+              f"{time.perf_counter() - start:.1f}s")
+        if best is None:
+            print(f"No configuration reaches recall@5 >= {MIN_RECALL_AT_5}")
+        else:
+            print(f"Fastest with recall@5 >= {MIN_RECALL_AT_5} (*): "
+                  f"chunk_size={best.chunk_size} "
+                  f"chunk_overlap={best.chunk_overlap} "
+                  f"k1={best.k1} b={best.b}")
+
+        save_path = Path(output_path)
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(save_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            recall_keys = list(rows[0].recall) if rows else []
+            writer.writerow(["chunk_size", "chunk_overlap", "k1", "b",
+                             "chunks", "index_mb", "chunk_s", "build_s",
+                             "query_ms", *recall_keys])
+            for row in rows:
+                writer.writerow([
+                    row.chunk_size, row.chunk_overlap, row.k1, row.b,
+                    row.chunks, f"{row.index_mb:.3f}", f"{row.chunk_s:.3f}",
+                    f"{row.build_s:.3f}", f"{row.query_ms:.4f}",
+                    *(f"{row.recall[key]:.4f}" for key in recall_keys),
+                ])
+        print(f"Saved sweep results to {save_path}")
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        hybrid: bool = False,
+        budget_ms: float = 50.0,
+        no_cache: bool = False,
+        query_cache_path: str = "data/cache/queries.db",
+        sharded: bool = False,
+        rerank: bool = False,
+        rerank_pool: int = 50,
+        rerank_budget_ms: float = 20.0,
+        rerank_model: str = "",
+    ) -> None:
+        """
+        Search the indexed repository for a single query.
+        --hybrid fuses BM25 with the dense index, within --budget_ms per
+        query.
+        BM25 results are cached on disk per index version; --no_cache
+        bypasses the cache.
+        --sharded searches the index built by index_sharded.
+        --rerank re-orders the top --rerank_pool candidates (term proximity,
+        file type) within --rerank_budget_ms; --rerank_model adds 'overlap'
+        (local stand-in) or a cross-encoder model.
+        """
+        cache = None
+        if not no_cache:
+            from .query_cache import QueryCache
+            cache = QueryCache(path=query_cache_path)
+        retriever = self._load_retriever(
+            hybrid, budget_ms, cache=cache, sharded=sharded, rerank=rerank,
+            rerank_pool=rerank_pool, rerank_budget_ms=rerank_budget_ms,
+            rerank_model=rerank_model,
+        )
+
+        results = retriever.search(query, k=k)
 
         print("f\nTop-{k} results for: '{query}'")
         print("="*50)
@@ -78,17 +698,109 @@ class RagCLI:
             print(f"{i}. File: {source.file_path}")
             print(f"   Indices: {source.first_character_index} -> {source.last_character_index}")
             print("-" * 20)
+        if cache is not None:
+            cache.close()
 
-    def search_dataset(self, dataset_path: str, k: int = 10, save_directory: str = "data/output/search_results"):
+    def serve(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        max_batch: int = 64,
+        max_wait_ms: float = 2.0,
+        n_threads: int = 0,
+        answer: bool = False,
+        hybrid: bool = False,
+        budget_ms: float = 50.0,
+        rerank: bool = False,
+        rerank_pool: int = 50,
+        rerank_budget_ms: float = 20.0,
+        rerank_model: str = "",
+        context_sources: int = 2,
+    ) -> None:
         """
-        Process multiple questions and output StudentSearchResults JSON.
+        Load the index once and serve search (and --answer) requests over
+        HTTP.
+        Concurrent queries are batched; latency percentiles are exposed on
+        /metrics.
+        --rerank re-orders a larger candidate pool, so --answer can use fewer
+        --context_sources.
+        """
+        from .generator import AnswerGenerator
+        from .query_cache import QueryCache
+        from .server import RagServer
+
+        # Memory-only: a long-running server sees the same popular questions
+        # again and again
+        query_cache = QueryCache()
+        retriever = self._load_retriever(
+            hybrid, budget_ms, cache=query_cache, rerank=rerank,
+            rerank_pool=rerank_pool, rerank_budget_ms=rerank_budget_ms,
+            rerank_model=rerank_model,
+        )
+
+        answer_fn: Optional[Callable[[str, List["MinimalSource"]], str]] = None
+        if answer:
+            generator = AnswerGenerator()
+
+            def answer_question(question: str,
+                                sources: "list[MinimalSource]") -> str:
+                texts = self.__get_text_from_answer(sources[:context_sources])
+                return generator.generate_answer(question, texts)
+            answer_fn = answer_question
+
+        server = RagServer(
+            (host, port),
+            retriever,
+            answer_fn=answer_fn,
+            max_batch=max_batch,
+            max_wait_ms=max_wait_ms,
+            n_threads=n_threads,
+            query_cache=query_cache,
+        )
+        print(f"Serving {self.index_path} on http://{host}:{port} "
+              f"(endpoints: /search, /answer, /metrics)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def ask(self, question: str, k: int = 10) -> None:
+        """
+        Answer a single question, streaming the answer as it is generated.
+        """
+        from .generator import AnswerGenerator
+
+        self.retriever.load(str(self.index_path))
+        sources = self.retriever.search(question, k=k)
+        generator = AnswerGenerator()
+
+        answer, metrics = generator.generate_answer_with_metrics(
+            question,
+            self.__get_text_from_answer(sources[:2]),
+            on_token=lambda token: print(token, end="", flush=True)
+        )
+        print()
+        print("=" * 50)
+        print(f"TTFT: {metrics.ttft_s or 0.0:.3f}s | "
+              f"total: {metrics.total_s:.3f}s | "
+              f"prompt tokens: {metrics.prompt_tokens} | "
+              f"{metrics.tokens_per_s:.1f} tokens/s")
+        for i, source in enumerate(sources[:2], 1):
+            print(f"{i}. {source.file_path} [{source.first_character_index}:"
+                  f"{source.last_character_index}]")
+
+    @staticmethod
+    def _load_questions(dataset_path: str) -> "list[dict]":
+        """
+        The dataset's rag_questions with a question_id and a question;
+        entries with empty ones are skipped.
         """
         questions = Path(dataset_path)
         if not questions.exists() or not questions.is_file():   
             raise FileNotFoundError(f"File not found: {dataset_path}")
 
-        self.retriever.load(str(self.index_path))
-        questions_output = []
         try:
             with open(questions, "r", encoding="utf-8") as f:
                 dataset = json.load(f)
@@ -97,86 +809,512 @@ class RagCLI:
                 for question in dataset.get("rag_questions", []):
                     if not required_fields.issubset(question.keys()):
                         raise ValueError(f"Must contain the following fields: {required_fields - set(question.keys())}")
-                
-                for question in dataset.get("rag_questions", []):
-                    question_id = question["question_id"]
-                    question_text = question["question"]
 
-                    if not question_id or not question_text:
+                valid_questions = []
+                for question in dataset.get("rag_questions", []):
+                    if not question["question_id"] or not question["question"]:
                         print(f"Skipping invalid entry: {question}")
                         continue
-
-                    sources = self.retriever.search(question_text, k=k)
-
-                    top_k_sources = []
-                    for s in sources:
-                        top_k_sources.append(MinimalSource(
-                            file_path=s.file_path,
-                            first_character_index=s.first_character_index,
-                            last_character_index=s.last_character_index
-                        ))
-                    questions_output.append(
-                            {
-                                "question_id": question_id,
-                                "question": question_text,
-                                "retrieved_sources": [source.dict() for source in top_k_sources]
-                            }
-                        )
+                    valid_questions.append(question)
         except UnicodeDecodeError:
             raise ValueError(f"Error reading: {dataset_path}. Please ensure it is UTF-8 encoded.")
+        return valid_questions
+
+    def search_dataset(
+        self,
+        dataset_path: str,
+        k: int = 10,
+        save_directory: str = "data/output/search_results",
+        n_threads: int = 0,
+        hybrid: bool = False,
+        budget_ms: float = 50.0,
+        no_cache: bool = False,
+        query_cache_path: str = "data/cache/queries.db",
+        query_cache_size: int = 100000,
+        sharded: bool = False,
+        rerank: bool = False,
+        rerank_pool: int = 50,
+        rerank_budget_ms: float = 20.0,
+        rerank_model: str = "",
+        jsonl: bool = False,
+        batch_size: int = 1024,
+    ) -> None:
+        """
+        Process multiple questions and output StudentSearchResults JSON.
+        All questions are retrieved in batches; --n_threads spreads scoring
+        over threads.
+        --hybrid fuses BM25 with the dense index, within --budget_ms per
+        query.
+        BM25 results are cached on disk per index version, so repeated runs
+        skip scoring; --no_cache bypasses the cache.
+        --sharded searches the index built by index_sharded.
+        --rerank re-orders the top --rerank_pool candidates within
+        --rerank_budget_ms per query (--rerank_model: 'overlap' or a
+        cross-encoder model adds a learned score).
+        --jsonl appends each batch of --batch_size results to a .jsonl file
+        as it completes, resumes an interrupted run by skipping the question
+        ids already there, then compacts it to the JSON output.
+        """
+        from tqdm import tqdm
+        from .jsonl_output import JsonlResults, compact
+        from .models import MinimalSearchResults
+        from .query_cache import QueryCache
+
+        valid_questions = self._load_questions(dataset_path)
+        cache = None if no_cache else QueryCache(max_entries=query_cache_size,
+                                                 path=query_cache_path)
+        retriever = self._load_retriever(
+            hybrid, budget_ms, cache=cache, sharded=sharded, rerank=rerank,
+            rerank_pool=rerank_pool, rerank_budget_ms=rerank_budget_ms,
+            rerank_model=rerank_model,
+        )
+        questions_output = []
 
         save_dir = Path(save_directory)
         save_dir.mkdir(parents=True, exist_ok=True)
+        output_path = save_dir / Path(dataset_path).name
+
+        if jsonl:
+            jsonl_path = save_dir / (Path(dataset_path).stem + ".jsonl")
+            results = JsonlResults(jsonl_path, k)
+            done = results.open()
+            pending = [question for question in valid_questions
+                       if question["question_id"] not in done]
+            if done:
+                print(f"Resuming {jsonl_path}: {len(done)} questions done, "
+                      f"{len(pending)} left.")
+            with results:
+                starts = range(0, len(pending), batch_size)
+                for start in tqdm(starts, desc="Searching", unit="batch"):
+                    batch = pending[start:start + batch_size]
+                    batch_sources = retriever.search_batch(
+                        [question["question"] for question in batch],
+                        k=k, n_threads=n_threads,
+                    )
+                    results.write_many(
+                        {
+                            "question_id": question["question_id"],
+                            "question": question["question"],
+                            "retrieved_sources": [
+                                source.model_dump() for source in sources
+                            ]
+                        }
+                        for question, sources in zip(batch, batch_sources)
+                    )
+            all_sources = []
+        else:
+            all_sources = retriever.search_batch(
+                [question["question"] for question in valid_questions],
+                k=k, n_threads=n_threads
+            )
+        if rerank:
+            print(retriever.summary())
+            retriever = retriever.base
+        if hybrid:
+            print(retriever.summary())
+        if cache is not None:
+            print(cache.summary())
+            cache.close()
+        if jsonl:
+            count, _ = compact(str(jsonl_path), str(output_path),
+                               MinimalSearchResults)
+            print(f"Compacted {count} results from {jsonl_path} to "
+                  f"{output_path}")
+            return
+
+        for question, sources in zip(valid_questions, all_sources):
+            questions_output.append(
+                    {
+                        "question_id": question["question_id"],
+                        "question": question["question"],
+                        "retrieved_sources": [
+                            source.model_dump() for source in sources
+                        ]
+                    }
+                )
 
         formatted_output = {
             "search_results": questions_output,
             "k": k
             }
 
-        output_path = save_dir / Path(dataset_path).name
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(formatted_output, f, indent=2)
         
         print(f"Saved student_search_results to {output_path}")
     
-    def answer_dataset(self, student_search_results_path: str, save_directory: str = "data/output/recall@k"):
+    def answer_dataset(
+        self,
+        student_search_results_path: str,
+        save_directory: str = "data/output/recall@k",
+        max_workers: int = 4,
+        max_in_flight: int = 0,
+        timeout: float = 120.0,
+        retries: int = 2,
+        no_cache: bool = False,
+        cache_path: str = "data/cache/answers.db",
+        cache_size: int = 10000,
+        stream: bool = False,
+        context_budget: int = 0,
+        context_sources: int = 2,
+        jsonl: bool = False,
+    ) -> None:
         """
-        Generate answers from search results for an entire dataset.        
+        Generate answers from search results for an entire dataset.
+        Up to --max_workers prompts run concurrently; output keeps the input
+        order.
+        Answers are cached on disk by prompt; --no_cache bypasses the cache.
+        --stream streams tokens from Ollama so time-to-first-token is
+        measured.
+        --context_budget N packs each context into about N tokens (0 keeps
+        the chunks verbatim).
+        --context_sources N uses the first N retrieved sources (fewer suffice
+        on re-ranked results).
+        --jsonl writes each answer to a .jsonl file as it completes, resumes
+        an interrupted run by skipping the question ids already there, then
+        compacts it to the JSON output.
+        A .jsonl input (from search_dataset --jsonl) is read lazily instead
+        of being loaded at once.
         """
-        with open(student_search_results_path, "r") as f:
-            search_data = json.load(f)
-        
-        search_results_obj = StudentSearchResults(**search_data)
+        from tqdm import tqdm
+        from .answer_cache import AnswerCache
+        from .context import ContextPacker
+        from .generator import AnswerGenerator, latency_report
+        from .jsonl_output import JsonlResults, compact, read_jsonl
+        from .models import (
+            MinimalAnswer, MinimalSearchResults, StudentSearchResults,
+            StudentSearchResultsAndAnswer,
+        )
 
-        generator = AnswerGenerator()
+        search_results: Iterable[MinimalSearchResults]
+        if student_search_results_path.endswith(".jsonl"):
+            header, records = read_jsonl(student_search_results_path)
+            search_results = (MinimalSearchResults.model_validate(record)
+                              for record in records)
+            k = header["k"]
+            total = None
+        else:
+            with open(student_search_results_path, "r") as f:
+                search_data = json.load(f)
+
+            search_results_obj = StudentSearchResults(**search_data)
+            search_results = search_results_obj.search_results
+            k = search_results_obj.k
+            total = len(search_results_obj.search_results)
+
+        generator = AnswerGenerator(
+            max_workers=max_workers,
+            max_in_flight=max_in_flight or None,
+            timeout=timeout,
+            retries=retries,
+            cache=(None if no_cache
+                   else AnswerCache(cache_path, max_entries=cache_size)),
+            stream=stream
+        )
+        packer = (ContextPacker(max_tokens=context_budget)
+                  if context_budget > 0 else None)
         answers = []
+        output_name = Path(student_search_results_path).with_suffix(".json")
+        save_path = Path(save_directory) / output_name.name
+        save_path.parent.mkdir(parents=True, exist_ok=True)
 
-        print(f"Loaded {len(search_results_obj.search_results)} questions.")
+        results = None
+        if jsonl:
+            jsonl_path = save_path.with_suffix(".jsonl")
+            results = JsonlResults(jsonl_path, k)
+            done = results.open()
+            if done:
+                print(f"Resuming {jsonl_path}: {len(done)} questions done.")
+                search_results = (result for result in search_results
+                                  if result.question_id not in done)
+                total = None
 
-        for result in tqdm(search_results_obj.search_results, desc="Generating answers"):
-            retrieve_texts = self.__get_text_from_answer(result.retrieved_sources[:2])
-            
-            generate_text = generator.generate_answer(
-                question=result.question,
-                retrieved_sources=retrieve_texts
-            )
+        if total is not None:
+            print(f"Loaded {total} questions.")
 
-            answers.append(MinimalAnswer(
+        # Contexts are read lazily, as the generator pulls new requests; tee
+        # only buffers the results between the one being written and the
+        # newest request
+        search_results, requested = itertools.tee(search_results)
+        requests = (
+            (result.question, self.__get_text_from_answer(
+                result.retrieved_sources[:context_sources], packer,
+                result.question,
+            ))
+            for result in requested
+        )
+        generated = generator.generate_answers(requests)
+        failed = 0
+        metrics = []
+
+        for result, generation in tqdm(zip(search_results, generated),
+                                       total=total,
+                                       desc="Generating answers"):
+            if generation.error is not None:
+                failed += 1
+                print(f"Error generating answer for {result.question_id}: "
+                      f"{generation.error}")
+            elif generation.metrics is not None:
+                metrics.append(generation.metrics)
+
+            answer = MinimalAnswer(
                 question_id=result.question_id,
                 question=result.question,
                 retrieved_sources=result.retrieved_sources,
-                answer=generate_text
-            ))
+                answer=generation.answer
+            )
+            if results is not None:
+                # Failed answers are kept but retried when the run is resumed
+                results.write(answer, error=generation.error)
+            else:
+                answers.append(answer)
+
+        print(latency_report(metrics))
+        if failed:
+            print(f"{failed} answers failed after retries and were left "
+                  "empty.")
+        print(self._get_chunk_store().summary())
+        if packer is not None:
+            print(packer.summary())
+        if generator.cache is not None:
+            print(generator.cache.summary())
+            generator.cache.close()
+
+        if results is not None:
+            results.close()
+            count, left_empty = compact(str(jsonl_path), str(save_path),
+                                        MinimalAnswer)
+            print(f"Compacted {count} answers from {jsonl_path} to "
+                  f"{save_path}")
+            if left_empty:
+                print(f"{left_empty} of them failed and were left empty; "
+                      "run again with --jsonl to retry them.")
+            return
 
         output_dataset = StudentSearchResultsAndAnswer(
             search_results=answers,
-            k=search_results_obj.k
+            k=k
         )
 
-        save_path = Path(save_directory) / Path(student_search_results_path).name
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-
         with open(save_path, "w") as f:
             f.write(output_dataset.model_dump_json(indent=4))
         
         print(f"Saved results to {save_path}")
+
+    def ask_dataset(
+        self,
+        dataset_path: str,
+        k: int = 10,
+        save_directory: str = "data/output/recall@k",
+        batch_size: int = 16,
+        queue_size: int = 32,
+        n_threads: int = 0,
+        max_workers: int = 4,
+        timeout: float = 120.0,
+        retries: int = 2,
+        no_cache: bool = False,
+        query_cache_path: str = "data/cache/queries.db",
+        query_cache_size: int = 100000,
+        cache_path: str = "data/cache/answers.db",
+        cache_size: int = 10000,
+        context_budget: int = 0,
+        context_sources: int = 2,
+        sharded: bool = False,
+        rerank: bool = False,
+        rerank_pool: int = 50,
+        rerank_model: str = "",
+        jsonl: bool = False,
+    ) -> None:
+        """
+        Retrieve and answer every question of a dataset in one pipelined run.
+        Retrieval (in batches of --batch_size), context assembly and
+        generation (--max_workers at once) are concurrent stages joined by
+        queues of --queue_size questions: a slow stage pauses the ones before
+        it, and per-stage throughput is printed at the end.
+        BM25 results are cached in --query_cache_path and answers in
+        --cache_path, as in search_dataset and answer_dataset; --no_cache
+        bypasses both caches.
+        --jsonl writes each answer as it completes and resumes an interrupted
+        run, as in answer_dataset.
+        """
+        from tqdm import tqdm
+        from .answer_cache import AnswerCache
+        from .context import ContextPacker
+        from .generator import AnswerGenerator, latency_report
+        from .jsonl_output import JsonlResults, compact
+        from .models import MinimalAnswer, StudentSearchResultsAndAnswer
+        from .pipeline import AskPipeline
+        from .query_cache import QueryCache
+
+        questions = self._load_questions(dataset_path)
+        query_cache = None if no_cache else QueryCache(
+            max_entries=query_cache_size, path=query_cache_path
+        )
+        retriever = self._load_retriever(
+            cache=query_cache, sharded=sharded, rerank=rerank,
+            rerank_pool=rerank_pool, rerank_model=rerank_model,
+        )
+        generator = AnswerGenerator(
+            max_workers=max_workers,
+            timeout=timeout,
+            retries=retries,
+            cache=(None if no_cache
+                   else AnswerCache(cache_path, max_entries=cache_size)),
+        )
+        packer = (ContextPacker(max_tokens=context_budget)
+                  if context_budget > 0 else None)
+
+        def get_texts(question: str,
+                      sources: "list[MinimalSource]") -> list[str]:
+            return self.__get_text_from_answer(sources[:context_sources],
+                                               packer, question)
+
+        output_name = Path(dataset_path).with_suffix(".json")
+        save_path = Path(save_directory) / output_name.name
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        results = None
+        if jsonl:
+            jsonl_path = save_path.with_suffix(".jsonl")
+            results = JsonlResults(jsonl_path, k)
+            done = results.open()
+            if done:
+                print(f"Resuming {jsonl_path}: {len(done)} questions done.")
+                questions = [question for question in questions
+                             if question["question_id"] not in done]
+        print(f"Loaded {len(questions)} questions.")
+
+        answers = []
+        metrics = []
+        progress = tqdm(total=len(questions), desc="Answering")
+
+        def on_result(question: dict, sources: "list[MinimalSource]",
+                      generation: "GenerationResult") -> None:
+            if generation.error is not None:
+                print("Error generating answer for "
+                      f"{question['question_id']}: {generation.error}")
+            elif generation.metrics is not None:
+                metrics.append(generation.metrics)
+            answer = MinimalAnswer(
+                question_id=question["question_id"],
+                question=question["question"],
+                retrieved_sources=sources,
+                answer=generation.answer
+            )
+            if results is not None:
+                # Failed answers are kept but retried when the run is resumed
+                results.write(answer, error=generation.error)
+            else:
+                answers.append(answer)
+            progress.update()
+
+        pipeline = AskPipeline(retriever, get_texts, generator, k=k,
+                               batch_size=batch_size, queue_size=queue_size,
+                               n_threads=n_threads)
+        try:
+            pipeline.run(questions, on_result)
+        finally:
+            progress.close()
+            if results is not None:
+                results.close()
+
+        print(pipeline.summary())
+        print(latency_report(metrics))
+        if pipeline.failed:
+            print(f"{pipeline.failed} answers failed after retries and were "
+                  "left empty.")
+        print(self._get_chunk_store().summary())
+        if packer is not None:
+            print(packer.summary())
+        for cache in (query_cache, generator.cache):
+            if cache is not None:
+                print(cache.summary())
+                cache.close()
+
+        if results is not None:
+            count, left_empty = compact(str(jsonl_path), str(save_path),
+                                        MinimalAnswer)
+            print(f"Compacted {count} answers from {jsonl_path} to "
+                  f"{save_path}")
+            if left_empty:
+                print(f"{left_empty} of them failed and were left empty; "
+                      "run again with --jsonl to retry them.")
+            return
+
+        output = StudentSearchResultsAndAnswer(search_results=answers, k=k)
+        with open(save_path, "w") as f:
+            f.write(output.model_dump_json(indent=4))
+        print(f"Saved results to {save_path}")
+
+    def compact_results(self, jsonl_path: str,
+                        output_path: Optional[str] = None) -> None:
+        """
+        Convert a .jsonl file from search_dataset/answer_dataset --jsonl
+        (complete or not) to the StudentSearchResults JSON shape; defaults to
+        the same path with a .json suffix.
+        """
+        from .jsonl_output import compact
+
+        output_path = output_path or str(Path(jsonl_path).with_suffix(".json"))
+        count, left_empty = compact(jsonl_path, output_path)
+        print(f"Compacted {count} results from {jsonl_path} to {output_path}")
+        if left_empty:
+            print(f"{left_empty} of them failed and were left empty.")
+
+    def startup_report(
+        self,
+        command: str = "search 'how to configure the scheduler' --k 5",
+        top: int = 15,
+        repeat: int = 3,
+        max_ms: float = 0.0,
+    ) -> None:
+        """
+        Report where a CLI command spends its startup, from
+        `python -X importtime` in fresh interpreters.
+        --command is the subcommand line to measure; the best wall time of
+        --repeat runs is reported.
+        With --max_ms, exits with status 1 when even the best run is slower
+        (a cold-start bound for CI).
+        """
+        import shlex
+        from .startup import format_report, run_command
+
+        if repeat < 1:
+            raise ValueError("--repeat must be at least 1")
+        args = shlex.split(command)
+        best_wall = float("inf")
+        best_rows: List["ImportRow"] = []
+        for _ in range(repeat):
+            wall, rows, returncode, errors = run_command(args)
+            if returncode != 0:
+                print(errors)
+                raise RuntimeError(f"python -m src {command} exited with "
+                                   f"status {returncode}")
+            if wall < best_wall:
+                best_wall, best_rows = wall, rows
+        print(format_report(args, best_wall, best_rows, top=top))
+
+        if max_ms and best_wall * 1000 > max_ms:
+            print(f"Startup took {best_wall * 1000:.0f} ms, over the "
+                  f"{max_ms:g} ms bound")
+            sys.exit(1)
+
+    def startup_check(self) -> None:
+        """
+        Check that importing the CLI and showing search help leave the slow
+        dependencies (text splitters, Ollama client, httpx) unimported.
+        Deterministic and needs no index: exits with status 1 when one of
+        them is imported eagerly again.
+        """
+        import shlex
+        from .startup import LIGHT_COMMANDS, loaded_modules
+
+        failures = 0
+        for args in LIGHT_COMMANDS:
+            label = (f"python -m src {shlex.join(args)}" if args
+                     else "import src.main")
+            loaded = loaded_modules(args)
+            status = "imports " + ", ".join(loaded) if loaded else "ok"
+            print(f"{label}: {status}")
+            failures += bool(loaded)
+        if failures:
+            sys.exit(1)
@@ -0,0 +1,59 @@
+import json
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from pydantic import BaseModel
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+class ManifestEntry(BaseModel):
+    size: int
+    mtime_ns: int
+    content_hash: str
+    chunk_start: int
+    chunk_end: int
+
+
+class IndexManifest(BaseModel):
+    """
+    Records which file produced which chunk ids, so `index` can reuse
+    the chunks (and cached token ids) of files that did not change.
+    """
+    version: int = MANIFEST_VERSION
+    chunk_size: int
+    chunk_overlap: Optional[int] = None
+    # Per-suffix (chunk_size, chunk_overlap) overrides of the chunker
+    language_settings: Dict[str, Tuple[int, int]] = {}
+    files: Dict[str, ManifestEntry] = {}
+
+    def save(self, directory: str) -> None:
+        manifest_path = Path(directory) / MANIFEST_NAME
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            f.write(self.model_dump_json())
+
+    @classmethod
+    def load(
+        cls, directory: str, chunk_size: int, chunk_overlap: int,
+        language_settings: Optional[Dict[str, Tuple[int, int]]] = None,
+    ) -> Optional["IndexManifest"]:
+        """
+        Returns the stored manifest, or None when there is none or it was
+        written for another format/chunker configuration (forcing a full
+        build).
+        """
+        manifest_path = Path(directory) / MANIFEST_NAME
+        if not manifest_path.exists():
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = cls(**json.load(f))
+        except (ValueError, TypeError) as e:
+            print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+            return None
+        if (manifest.version != MANIFEST_VERSION
+                or manifest.chunk_size != chunk_size
+                or manifest.chunk_overlap != chunk_overlap
+                or manifest.language_settings != (language_settings or {})):
+            return None
+        return manifest
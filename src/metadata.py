@@ -0,0 +1,295 @@
+import json
+import pickle
+import struct
+import zlib
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING, Dict, List, Literal, Optional, Sequence, Tuple,
+)
+import numpy as np
+
+if TYPE_CHECKING:
+    from .models import MinimalSource
+
+METADATA_NAME = "metadata.bin"
+# Columnar .npy format, read for indexes saved before metadata.bin
+PATHS_NAME = "metadata_paths.json"
+PATH_IDS_NAME = "metadata_path_ids.npy"
+STARTS_NAME = "metadata_starts.npy"
+ENDS_NAME = "metadata_ends.npy"
+LEGACY_NAME = "metadata.pkl"
+OLD_FORMAT_NAMES = (
+    PATHS_NAME, PATH_IDS_NAME, STARTS_NAME, ENDS_NAME, LEGACY_NAME,
+)
+
+# metadata.bin: a 64-byte header, then 8-byte aligned sections:
+#   path table (UTF-8, NUL-separated) | path ids (uint32, n_chunks)
+#   | starts (n_chunks) | ends (n_chunks)
+# Starts and ends are uint32, or uint64 when a file is beyond 4 GiB.
+# The checksum is the CRC32 of everything after the header.
+MAGIC = b"RAGMETA\0"
+FORMAT_VERSION = 1
+# magic, version, offset width, checksum, n_chunks, n_paths, blob size
+HEADER = struct.Struct("<8sHHIQQQ")
+HEADER_SIZE = 64
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) // 8 * 8
+
+
+def _sections(n_chunks: int, n_paths: int, blob_size: int,
+              offset_width: int) -> List[Tuple[int, int]]:
+    """
+    (offset, size in bytes) of the path table, path ids, starts and ends
+    sections.
+    """
+    sizes = [
+        blob_size, 4 * n_chunks,
+        offset_width * n_chunks, offset_width * n_chunks,
+    ]
+    sections = []
+    position = HEADER_SIZE
+    for size in sizes:
+        sections.append((position, size))
+        position += _aligned(size)
+    return sections
+
+
+def _remove_old_formats(directory: Path) -> None:
+    for name in OLD_FORMAT_NAMES:
+        (directory / name).unlink(missing_ok=True)
+
+
+class ChunkMetadata:
+    """
+    Columnar store of the MinimalSource of every chunk: a table of unique
+    file paths plus one path id / start / end entry per chunk.
+    MinimalSource objects are only created for the chunks that are looked up.
+    """
+
+    def __init__(self, paths: List[str], path_ids: np.ndarray,
+                 starts: np.ndarray, ends: np.ndarray) -> None:
+        self.paths = paths
+        self.path_ids = path_ids
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def empty(cls) -> "ChunkMetadata":
+        return cls([], np.zeros(0, dtype=np.int32),
+                   np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def from_sources(
+        cls, sources: Sequence["MinimalSource"],
+    ) -> "ChunkMetadata":
+        path_table: Dict[str, int] = {}
+        path_ids = np.empty(len(sources), dtype=np.int32)
+        starts = np.empty(len(sources), dtype=np.int64)
+        ends = np.empty(len(sources), dtype=np.int64)
+        for i, source in enumerate(sources):
+            path_ids[i] = path_table.setdefault(source.file_path,
+                                                len(path_table))
+            starts[i] = source.first_character_index
+            ends[i] = source.last_character_index
+        return cls(list(path_table), path_ids, starts, ends)
+
+    @classmethod
+    def concat(cls, parts: List["ChunkMetadata"]) -> "ChunkMetadata":
+        """Joins several stores, merging their path tables."""
+        path_table: Dict[str, int] = {}
+        path_ids = []
+        for part in parts:
+            remap = np.array(
+                [path_table.setdefault(p, len(path_table))
+                 for p in part.paths],
+                dtype=np.int32,
+            )
+            if len(part.path_ids):
+                path_ids.append(remap[part.path_ids])
+            else:
+                path_ids.append(part.path_ids.astype(np.int32))
+        if not parts:
+            return cls.empty()
+        return cls(
+            list(path_table),
+            np.concatenate(path_ids).astype(np.int32),
+            np.concatenate([part.starts for part in parts]).astype(np.int64),
+            np.concatenate([part.ends for part in parts]).astype(np.int64),
+        )
+
+    def select(self, start: int, stop: int) -> "ChunkMetadata":
+        """Chunks start..stop-1, sharing the path table."""
+        return ChunkMetadata(self.paths, self.path_ids[start:stop],
+                             self.starts[start:stop], self.ends[start:stop])
+
+    def __len__(self) -> int:
+        return len(self.path_ids)
+
+    def __getitem__(self, chunk_id: int) -> "MinimalSource":
+        # pydantic is imported on the first lookup, not when the index
+        # is loaded
+        from .models import MinimalSource
+        return MinimalSource(
+            file_path=self.paths[self.path_ids[chunk_id]],
+            first_character_index=int(self.starts[chunk_id]),
+            last_character_index=int(self.ends[chunk_id])
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ChunkMetadata) or len(self) != len(other):
+            return False
+        return (
+            [self.paths[i] for i in self.path_ids]
+            == [other.paths[i] for i in other.path_ids]
+            and np.array_equal(self.starts, other.starts)
+            and np.array_equal(self.ends, other.ends)
+        )
+
+    def save(self, directory: str) -> None:
+        """Writes metadata.bin and removes the files of older formats."""
+        save_path = Path(directory)
+        tmp_path = save_path / (METADATA_NAME + ".tmp")
+        self._write(tmp_path)
+        tmp_path.replace(save_path / METADATA_NAME)
+        _remove_old_formats(save_path)
+
+    def _write(self, path: Path) -> None:
+        """Writes the metadata.bin format to path."""
+        # Paths cannot contain NUL, so it separates them and the table
+        # decodes in one split
+        blob = "\0".join(self.paths).encode("utf-8")
+        largest = 0
+        if len(self):
+            largest = max(int(self.ends.max()), int(self.starts.max()))
+        offset_dtype = np.uint32 if largest < 2 ** 32 else np.uint64
+
+        body = bytearray()
+        for section in (
+            blob,
+            np.asarray(self.path_ids, dtype=np.uint32).tobytes(),
+            np.asarray(self.starts, dtype=offset_dtype).tobytes(),
+            np.asarray(self.ends, dtype=offset_dtype).tobytes(),
+        ):
+            body += section + b"\0" * (_aligned(len(section)) - len(section))
+        header = HEADER.pack(
+            MAGIC, FORMAT_VERSION, np.dtype(offset_dtype).itemsize,
+            zlib.crc32(body), len(self), len(self.paths), len(blob),
+        )
+        with open(path, "wb") as f:
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            f.write(body)
+
+    @classmethod
+    def _load_binary(cls, path: Path, mmap: bool,
+                     verify: bool) -> "ChunkMetadata":
+        data: np.ndarray
+        if mmap:
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            data = np.frombuffer(path.read_bytes(), dtype=np.uint8)
+        if len(data) < HEADER_SIZE:
+            raise ValueError(f"{path} is truncated.")
+        (magic, version, offset_width, checksum,
+         n_chunks, n_paths, blob_size) = HEADER.unpack_from(
+            bytes(data[:HEADER.size])
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk metadata file.")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, "
+                             f"this code reads version {FORMAT_VERSION}.")
+        sections = _sections(n_chunks, n_paths, blob_size, offset_width)
+        if len(data) < sections[-1][0] + sections[-1][1]:
+            raise ValueError(f"{path} is truncated.")
+        if verify and zlib.crc32(data[HEADER_SIZE:].data) != checksum:
+            raise ValueError(f"{path} is corrupted (checksum mismatch).")
+
+        offset_dtype = np.uint32 if offset_width == 4 else np.uint64
+        (blob_at, _), (ids_at, _), (starts_at, _), (ends_at, _) = sections
+        blob = bytes(data[blob_at:blob_at + blob_size])
+        try:
+            paths = blob.decode("utf-8").split("\0") if n_paths else []
+        except UnicodeDecodeError:
+            paths = []
+        if len(paths) != n_paths:
+            raise ValueError(f"{path} is corrupted (path table).")
+        return cls(
+            paths,
+            np.frombuffer(data, dtype=np.uint32, count=n_chunks,
+                          offset=ids_at),
+            np.frombuffer(data, dtype=offset_dtype, count=n_chunks,
+                          offset=starts_at),
+            np.frombuffer(data, dtype=offset_dtype, count=n_chunks,
+                          offset=ends_at),
+        )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False, verify: bool = False,
+             legacy: bool = False) -> "ChunkMetadata":
+        """
+        Loads metadata.bin, memory-mapping it if mmap is set (the path table
+        is always decoded). verify checks the checksum, which reads the
+        whole file once.
+        Indexes saved before metadata.bin are read from the .npy columns;
+        metadata.pkl is only unpickled when legacy is set.
+        """
+        load_path = Path(directory)
+        if (load_path / METADATA_NAME).exists():
+            return cls._load_binary(load_path / METADATA_NAME, mmap, verify)
+        if (not (load_path / PATHS_NAME).exists()
+                and (load_path / LEGACY_NAME).exists()):
+            if not legacy:
+                raise ValueError(
+                    f"{directory} stores its chunk metadata as a pickle; "
+                    f"run `convert_metadata --directory {directory}` to "
+                    f"rewrite it as {METADATA_NAME}."
+                )
+            with open(load_path / LEGACY_NAME, "rb") as f:
+                return cls.from_sources(pickle.load(f))
+
+        mmap_mode: Optional[Literal["r"]] = "r" if mmap else None
+        with open(load_path / PATHS_NAME, "r", encoding="utf-8") as f:
+            paths = json.load(f)
+        return cls(
+            paths,
+            np.load(load_path / PATH_IDS_NAME, mmap_mode=mmap_mode),
+            np.load(load_path / STARTS_NAME, mmap_mode=mmap_mode),
+            np.load(load_path / ENDS_NAME, mmap_mode=mmap_mode),
+        )
+
+
+def convert_metadata(directory: str) -> Tuple[int, int]:
+    """
+    Rewrites the metadata of an index directory saved in an older format as
+    metadata.bin. The new file is checked against the original before the
+    old files are removed.
+    Returns the metadata size in bytes before and after.
+    """
+    load_path = Path(directory)
+    before = sum(
+        (load_path / name).stat().st_size
+        for name in OLD_FORMAT_NAMES if (load_path / name).exists()
+    )
+    if before == 0:
+        raise FileNotFoundError(
+            f"No metadata in an older format under {directory}"
+        )
+    metadata = ChunkMetadata.load(directory, verify=True, legacy=True)
+    tmp_path = load_path / (METADATA_NAME + ".tmp")
+    metadata._write(tmp_path)
+    try:
+        converted = ChunkMetadata._load_binary(tmp_path, mmap=False,
+                                               verify=True)
+        matches = converted == metadata
+    except ValueError:
+        matches = False
+    if not matches:
+        tmp_path.unlink()
+        raise ValueError(
+            f"Converted metadata of {directory} does not match the original."
+        )
+    tmp_path.replace(load_path / METADATA_NAME)
+    _remove_old_formats(load_path)
+    return before, (load_path / METADATA_NAME).stat().st_size
@@ -0,0 +1,258 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from .generator import AnswerGenerator, GenerationResult
+from .models import MinimalSource
+
+# Put on a queue after the last item of a stage
+_DONE = object()
+# Receives each question, its sources and its generation result
+OnResult = Callable[[dict, List[MinimalSource], GenerationResult], None]
+
+
+class StageStats:
+    """
+    Counters of one pipeline stage; times are summed over its workers, in
+    seconds.
+    """
+
+    def __init__(self, name: str, workers: int = 1) -> None:
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        # Running the stage's blocking work (on a thread)
+        self.busy_s = 0.0
+        # Waiting for the previous stage: this stage is starved
+        self.waiting_s = 0.0
+        # Waiting for room in the next queue: backpressure from a slower
+        # stage
+        self.blocked_s = 0.0
+        self.peak_queue = 0
+
+
+class _InOrder:
+    """
+    Delivers results in input order. A result may only be generated while it
+    is less than `window` positions ahead of the oldest undelivered one, so a
+    stalled request holds the other workers back instead of letting them fill
+    the buffer.
+    """
+
+    def __init__(self, on_result: OnResult, window: int) -> None:
+        self.on_result = on_result
+        self.window = window
+        self.ready: Dict[
+            int, Tuple[dict, List[MinimalSource], GenerationResult]
+        ] = {}
+        self.next_index = 0
+        self.changed = asyncio.Condition()
+
+    async def wait_turn(self, index: int) -> None:
+        async with self.changed:
+            await self.changed.wait_for(
+                lambda: index - self.next_index < self.window
+            )
+
+    async def deliver(self, index: int, question: dict,
+                      sources: List[MinimalSource],
+                      result: GenerationResult) -> None:
+        async with self.changed:
+            self.ready[index] = (question, sources, result)
+            while self.next_index in self.ready:
+                self.on_result(*self.ready.pop(self.next_index))
+                self.next_index += 1
+            self.changed.notify_all()
+
+
+class AskPipeline:
+    """
+    Answers questions end to end with three asyncio stages joined by bounded
+    queues: retrieve (batched search) -> context (chunk texts, packed or not)
+    -> generate (LLM). Blocking work runs on threads, so retrieval and context
+    assembly for later questions overlap generation for earlier ones. A full
+    queue pauses the stage feeding it, and results waiting for an earlier one
+    are capped at queue_size, which bounds memory whatever the dataset size.
+    Results are delivered to on_result in input order.
+    """
+
+    def __init__(
+        self,
+        retriever: Any,
+        get_texts: Callable[[str, List[MinimalSource]], List[str]],
+        generator: AnswerGenerator,
+        k: int = 10,
+        batch_size: int = 16,
+        queue_size: int = 32,
+        n_threads: int = 0,
+    ) -> None:
+        if batch_size < 1 or queue_size < 1:
+            raise ValueError("batch_size and queue_size must be >= 1.")
+        self.retriever = retriever
+        self.get_texts = get_texts
+        self.generator = generator
+        self.k = k
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.n_threads = n_threads
+        self.stats: Dict[str, StageStats] = {
+            "retrieve": StageStats("retrieve"),
+            "context": StageStats("context"),
+            "generate": StageStats("generate", generator.max_workers),
+        }
+        self.failed = 0
+        self.wall_s = 0.0
+
+    def run(self, questions: Iterable[dict], on_result: OnResult) -> None:
+        """
+        Runs the pipeline over {"question_id", "question"} dicts, which are
+        read lazily.
+        """
+        start = time.perf_counter()
+        try:
+            asyncio.run(self._run(questions, on_result))
+        finally:
+            self.wall_s = time.perf_counter() - start
+
+    async def _run(self, questions: Iterable[dict],
+                   on_result: OnResult) -> None:
+        # One thread per generation worker, plus one each for retrieval and
+        # context assembly
+        executor = ThreadPoolExecutor(
+            max_workers=self.generator.max_workers + 2
+        )
+        retrieved: asyncio.Queue = asyncio.Queue(self.queue_size)
+        contexts: asyncio.Queue = asyncio.Queue(self.queue_size)
+        in_order = _InOrder(on_result, self.queue_size)
+        tasks = [
+            asyncio.ensure_future(
+                self._retrieve(executor, questions, retrieved)
+            ),
+            asyncio.ensure_future(
+                self._assemble(executor, retrieved, contexts)
+            ),
+            *(asyncio.ensure_future(
+                self._generate(executor, contexts, in_order)
+            ) for _ in range(self.generator.max_workers)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # On error, stop the other stages instead of leaving them blocked
+            # on a queue
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    async def _get(queue: asyncio.Queue, stats: StageStats) -> Any:
+        start = time.perf_counter()
+        item = await queue.get()
+        stats.waiting_s += time.perf_counter() - start
+        return item
+
+    @staticmethod
+    async def _put(queue: asyncio.Queue, item: Any, stats: StageStats) -> None:
+        start = time.perf_counter()
+        await queue.put(item)
+        stats.blocked_s += time.perf_counter() - start
+        stats.peak_queue = max(stats.peak_queue, queue.qsize())
+
+    @staticmethod
+    async def _in_thread(executor: ThreadPoolExecutor, stats: StageStats,
+                         func: Callable[..., Any], *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, func, *args
+            )
+        finally:
+            stats.busy_s += time.perf_counter() - start
+
+    async def _retrieve(self, executor: ThreadPoolExecutor,
+                        questions: Iterable[dict],
+                        output: asyncio.Queue) -> None:
+        stats = self.stats["retrieve"]
+        questions = iter(questions)
+        index = 0
+        while True:
+            batch = list(itertools.islice(questions, self.batch_size))
+            if not batch:
+                break
+            batch_sources = await self._in_thread(
+                executor, stats, lambda: self.retriever.search_batch(
+                    [question["question"] for question in batch], k=self.k,
+                    n_threads=self.n_threads,
+                )
+            )
+            stats.items += len(batch)
+            for question, sources in zip(batch, batch_sources):
+                await self._put(output, (index, question, sources), stats)
+                index += 1
+        await output.put(_DONE)
+
+    async def _assemble(self, executor: ThreadPoolExecutor,
+                        retrieved: asyncio.Queue,
+                        output: asyncio.Queue) -> None:
+        stats = self.stats["context"]
+        while True:
+            item = await self._get(retrieved, stats)
+            if item is _DONE:
+                break
+            index, question, sources = item
+            texts = await self._in_thread(executor, stats, self.get_texts,
+                                          question["question"], sources)
+            stats.items += 1
+            await self._put(output, (index, question, sources, texts), stats)
+        await output.put(_DONE)
+
+    async def _generate(self, executor: ThreadPoolExecutor,
+                        contexts: asyncio.Queue,
+                        in_order: _InOrder) -> None:
+        stats = self.stats["generate"]
+        while True:
+            item = await self._get(contexts, stats)
+            if item is _DONE:
+                # Pass the marker on so the other workers stop too
+                await contexts.put(_DONE)
+                return
+            index, question, sources, texts = item
+            start = time.perf_counter()
+            await in_order.wait_turn(index)
+            stats.blocked_s += time.perf_counter() - start
+            result = await self._in_thread(
+                executor, stats, self.generator.generate_result,
+                question["question"], texts,
+            )
+            stats.items += 1
+            if result.error is not None:
+                self.failed += 1
+            await in_order.deliver(index, question, sources, result)
+
+    def summary(self) -> str:
+        """
+        Per-stage throughput; the stage with the highest busy % is the
+        bottleneck.
+        """
+        wall = max(self.wall_s, 1e-9)
+        questions = self.stats["generate"].items
+        lines = [
+            f"Pipeline: {questions} questions in {self.wall_s:.2f}s "
+            f"({questions / wall:.1f} questions/s)",
+            f"{'stage':<9} {'workers':>7} {'items':>7} {'items/s':>8} "
+            f"{'busy %':>7} {'waiting s':>10} {'blocked s':>10} "
+            f"{'peak queue':>11}",
+        ]
+        for stats in self.stats.values():
+            lines.append(
+                f"{stats.name:<9} {stats.workers:>7} {stats.items:>7} "
+                f"{stats.items / wall:>8.1f} "
+                f"{stats.busy_s / (wall * stats.workers) * 100:>6.1f}% "
+                f"{stats.waiting_s:>10.2f} {stats.blocked_s:>10.2f} "
+                f"{stats.peak_queue:>11}"
+            )
+        lines.append("(waiting: starved by the previous stage; blocked: held "
+                     "back by a full queue to the next, or for generate by "
+                     "results waiting on an earlier one)")
+        return "\n".join(lines)
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+
+class QueryCache:
+    """
+    Cache of search results (top-k chunk ids), keyed on the stemmed query
+    tokens, k and the index version fingerprint.
+    An in-memory LRU sits in front of an optional SQLite tier; entries of
+    any other index version are dropped as soon as a new version is seen.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_entries: int = 10000,
+                 path: Optional[str] = None) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1.")
+        self.max_entries = max_entries
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS queries ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+                "ids TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS queries_last_used "
+                "ON queries (last_used)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(tokens: Sequence[str], k: int) -> str:
+        # BM25 scores do not depend on token order, so neither does the key
+        return f"{k}:" + " ".join(sorted(tokens))
+
+    def set_version(self, version: str) -> None:
+        """
+        Switches to another index version, invalidating every entry of the
+        previous ones.
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute(
+                    "DELETE FROM queries WHERE version != ?", (version,)
+                )
+                self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[int]]]:
+        results: List[Optional[List[int]]] = []
+        from_disk = []
+        with self._lock:
+            for key in keys:
+                ids = self._memory.get(key)
+                if ids is not None:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                elif self._conn is not None:
+                    row = self._conn.execute(
+                        "SELECT ids FROM queries "
+                        "WHERE key = ? AND version = ?",
+                        (key, self.version)
+                    ).fetchone()
+                    if row is not None:
+                        ids = json.loads(row[0])
+                        self._remember(key, ids)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        from_disk.append(key)
+                if ids is None:
+                    self.misses += 1
+                results.append(ids)
+            if from_disk and self._conn is not None:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE queries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in from_disk]
+                )
+                self._conn.commit()
+        return results
+
+    def put_many(self, items: List[Tuple[str, List[int]]]) -> None:
+        with self._lock:
+            for key, ids in items:
+                self._remember(key, ids)
+            if self._conn is None or not items:
+                return
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO queries "
+                "(key, version, ids, last_used) VALUES (?, ?, ?, ?)",
+                [(key, self.version, json.dumps(ids), now)
+                 for key, ids in items]
+            )
+            # Evict the least recently used entries above the size bound
+            self._conn.execute(
+                "DELETE FROM queries WHERE key IN ("
+                "SELECT key FROM queries ORDER BY last_used DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def _remember(self, key: str, ids: List[int]) -> None:
+        self._memory[key] = ids
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> str:
+        return (f"Query cache: {self.hits} hits ({self.disk_hits} from disk), "
+                f"{self.misses} misses ({self.hit_rate * 100:.1f}% hit rate)")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,234 @@
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from bm25s.stopwords import STOPWORDS_EN
+from .chunk_store import ChunkStore
+from .context import TOKEN_PATTERN
+from .models import MinimalSource
+from .stemmer import get_stemmer
+from .tracing import span
+
+# Small bonus per file type; documentation answers most "how do I" questions
+DEFAULT_PRIORS = {".md": 0.05, ".py": 0.0}
+
+Scorer = Callable[[str, List[str]], List[float]]
+
+
+class OverlapScorer:
+    """
+    Local stand-in for a cross-encoder: the share of the query's word bigrams
+    (and words, at half weight) that appear in the chunk.
+    """
+    name = "overlap"
+
+    def __call__(self, query: str, texts: List[str]) -> List[float]:
+        words = TOKEN_PATTERN.findall(query.lower())
+        bigrams = set(zip(words, words[1:]))
+        unigrams = set(words)
+        scores = []
+        for text in texts:
+            text_words = TOKEN_PATTERN.findall(text.lower())
+            text_unigrams = set(text_words)
+            text_bigrams = set(zip(text_words, text_words[1:]))
+            unigram_share = 0.0
+            if unigrams:
+                unigram_share = len(unigrams & text_unigrams) / len(unigrams)
+            bigram_share = unigram_share
+            if bigrams:
+                bigram_share = len(bigrams & text_bigrams) / len(bigrams)
+            scores.append((bigram_share + 0.5 * unigram_share) / 1.5)
+        return scores
+
+
+class CrossEncoderScorer:
+    """
+    Scores (query, chunk) pairs with a sentence-transformers cross-encoder
+    on CPU, squashed to 0..1.
+    """
+
+    def __init__(self, model: str, device: str = "cpu") -> None:
+        from sentence_transformers import CrossEncoder
+
+        self.name = model
+        self.model = CrossEncoder(model, device=device)
+
+    def __call__(self, query: str, texts: List[str]) -> List[float]:
+        logits = self.model.predict([(query, text) for text in texts],
+                                    show_progress_bar=False)
+        return [1 / (1 + math.exp(-float(logit))) for logit in logits]
+
+
+def make_scorer(spec: str) -> Optional[Scorer]:
+    """
+    '' for none, 'overlap' for the local stand-in, anything else is a
+    cross-encoder model.
+    """
+    if not spec:
+        return None
+    if spec == "overlap":
+        return OverlapScorer()
+    return CrossEncoderScorer(spec)
+
+
+class Reranker:
+    """
+    Re-orders BM25 candidates with cheap signals:
+    - the BM25 rank itself,
+    - term proximity: how many distinct query terms the chunk contains and
+      how tight the smallest window holding them is,
+    - a prior per file extension,
+    - optionally a pluggable (query, texts) scorer such as a cross-encoder.
+    """
+
+    def __init__(
+        self,
+        scorer: Optional[Scorer] = None,
+        priors: Optional[Dict[str, float]] = None,
+        rank_weight: float = 1.0,
+        proximity_weight: float = 1.0,
+        scorer_weight: float = 1.0,
+    ) -> None:
+        self.scorer = scorer
+        self.priors = DEFAULT_PRIORS if priors is None else priors
+        self.rank_weight = rank_weight
+        self.proximity_weight = proximity_weight
+        self.scorer_weight = scorer_weight
+        self.stopwords = set(STOPWORDS_EN)
+
+    def _terms(self, text: str) -> List[str]:
+        words = [w for w in TOKEN_PATTERN.findall(text.lower())
+                 if w not in self.stopwords]
+        terms: List[str] = get_stemmer().stemWords(words)
+        return terms
+
+    @staticmethod
+    def _proximity(query_terms: set, terms: List[str]) -> float:
+        """
+        Coverage of the query terms, discounted by the span of the smallest
+        window containing them.
+        """
+        hits = [(position, term) for position, term in enumerate(terms)
+                if term in query_terms]
+        distinct = len({term for _, term in hits})
+        if not distinct:
+            return 0.0
+        # Smallest window holding every distinct matched term
+        counts: Dict[str, int] = {}
+        best = len(terms)
+        left = 0
+        covered = 0
+        for position, term in hits:
+            counts[term] = counts.get(term, 0) + 1
+            if counts[term] == 1:
+                covered += 1
+            while covered == distinct:
+                best = min(best, position - hits[left][0] + 1)
+                left_term = hits[left][1]
+                counts[left_term] -= 1
+                if counts[left_term] == 0:
+                    covered -= 1
+                left += 1
+        coverage = distinct / len(query_terms)
+        # A window exactly as long as the matched terms scores 1; looser
+        # windows decay slowly
+        tightness = distinct / best
+        return coverage * (0.5 + 0.5 * math.sqrt(tightness))
+
+    def _prior(self, file_path: str) -> float:
+        dot = file_path.rfind(".")
+        return self.priors.get(file_path[dot:], 0.0) if dot >= 0 else 0.0
+
+    def rerank(
+        self, query: str, candidates: List[Tuple[MinimalSource, str]],
+        deadline: Optional[float] = None,
+    ) -> Tuple[List[MinimalSource], int]:
+        """
+        Returns the candidates re-ordered, and how many were scored before
+        `deadline` (a perf_counter time). Candidates left unscored keep their
+        BM25 order, after the scored ones.
+        """
+        query_terms = set(self._terms(query))
+        scored = []
+        for rank, (source, text) in enumerate(candidates):
+            if (deadline is not None and rank > 0
+                    and time.perf_counter() > deadline):
+                break
+            score = self.rank_weight / (1 + rank / 10)
+            if query_terms:
+                proximity = self._proximity(query_terms, self._terms(text))
+                score += self.proximity_weight * proximity
+            score += self._prior(source.file_path)
+            scored.append(score)
+
+        count = len(scored)
+        if self.scorer is not None and count and (
+            deadline is None or time.perf_counter() < deadline
+        ):
+            extra = self.scorer(query,
+                                [text for _, text in candidates[:count]])
+            scored = [score + self.scorer_weight * value
+                      for score, value in zip(scored, extra)]
+
+        order = sorted(range(count), key=lambda i: -scored[i])
+        reranked = [candidates[i][0] for i in order]
+        return reranked + [source for source, _ in candidates[count:]], count
+
+
+class RerankingRetriever:
+    """
+    Two-stage search: the base retriever fetches `pool` candidates, the
+    reranker re-orders them within budget_ms per query, and the first k are
+    returned. Same search/search_batch contract as BM25Retriever.
+    """
+
+    def __init__(self, base: Any, store: ChunkStore, reranker: Reranker,
+                 pool: int = 50, budget_ms: float = 20.0) -> None:
+        self.base = base
+        self.store = store
+        self.reranker = reranker
+        self.pool = pool
+        self.budget_ms = budget_ms
+        self.queries = 0
+        self.truncated = 0
+        self.rerank_s = 0.0
+
+    def _text(self, source: MinimalSource) -> str:
+        try:
+            return self.store.get_text(source)
+        except OSError:
+            # An unreadable file only loses its text features, not its place
+            # in the pool
+            return ""
+
+    def search(self, query: str, k: int = 5) -> List[MinimalSource]:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(
+        self, queries: Sequence[str], k: int = 5, batch_size: int = 1024,
+        n_threads: int = 0,
+    ) -> List[List[MinimalSource]]:
+        pool = max(k, self.pool)
+        candidates = self.base.search_batch(list(queries), k=pool,
+                                            batch_size=batch_size,
+                                            n_threads=n_threads)
+        results = []
+        for query, sources in zip(queries, candidates):
+            start = time.perf_counter()
+            with span("rerank", candidates=len(sources)):
+                pairs = [(source, self._text(source)) for source in sources]
+                reranked, scored = self.reranker.rerank(
+                    query, pairs, deadline=start + self.budget_ms / 1000
+                )
+            self.rerank_s += time.perf_counter() - start
+            self.truncated += scored < len(sources)
+            self.queries += 1
+            results.append(reranked[:k])
+        return results
+
+    def summary(self) -> str:
+        mean_ms = 0.0
+        if self.queries:
+            mean_ms = self.rerank_s / self.queries * 1000
+        return (f"Re-ranking: {self.queries} queries, pool {self.pool}, "
+                f"{mean_ms:.2f} ms/query, {self.truncated} cut short by the "
+                f"{self.budget_ms:g} ms budget")
@@ -1,62 +1,316 @@
 import bm25s
-import Stemmer
-import pickle
-from typing import List, Dict
-from .models import MinimalSource, MinimalSearchResults
+import hashlib
+import json
+import numpy as np
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Union
+from .metadata import ChunkMetadata
+from .stemmer import get_stemmer
+from .tracing import span
 from pathlib import Path
 
+if TYPE_CHECKING:
+    import Stemmer
+    from .models import MinimalSource
+    from .query_cache import QueryCache
+
+VERSION_NAME = "index_version.json"
+
 class BM25Retriever:
-    def __init__(self):
-        self.retriever = None
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.retriever: Optional[bm25s.BM25] = None
+        self.k1 = k1
+        self.b = b
         self.corpus = [] # This will store the actual text of chunks
-        self.metadata = [] # This will store the MinimalSource for each chunk
+        # This will store the MinimalSource for each chunk
+        self.metadata = ChunkMetadata.empty()
+        # Token ids of every chunk, flattened (chunk i is
+        # token_ids[token_offsets[i]:token_offsets[i + 1]])
+        self.token_ids: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.token_offsets: np.ndarray = np.zeros(1, dtype=np.int64)
+        self.vocab: Dict[str, int] = {}
+        # Fingerprint of the indexed content and BM25 parameters; None for
+        # indexes saved without one
+        self.version: Optional[str] = None
+        self.cache: Optional["QueryCache"] = None
+
+    @property
+    def stemmer(self) -> "Stemmer.Stemmer":
+        # Using a stemmer helps "running" match with "run"; shared and
+        # memoised, see stemmer.py
+        return get_stemmer()
+
+    def _tokenize(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tokenizes texts into ids of self.vocab, extending it with unseen
+        tokens. Returns the flat id array and the per-text lengths.
+        """
+        with span("tokenize", texts=len(texts)):
+            tokenized = bm25s.tokenize(texts, stemmer=self.stemmer)
+
+        local_to_global = np.zeros(len(tokenized.vocab), dtype=np.int32)
+        for token, local_id in tokenized.vocab.items():
+            local_to_global[local_id] = self.vocab.setdefault(
+                token, len(self.vocab)
+            )
+
+        lengths = np.array([len(ids) for ids in tokenized.ids],
+                           dtype=np.int64)
+        if not tokenized.ids:
+            return np.zeros(0, dtype=np.int32), lengths
+        flat = np.concatenate([np.asarray(ids, dtype=np.int32)
+                               for ids in tokenized.ids])
+        return local_to_global[flat], lengths
+
+    def _index_tokens(self) -> None:
+        """Creates the BM25 model from the cached token ids."""
+        # Drop tokens no chunk uses any more (e.g. from deleted files) so the
+        # vocab stays compact
+        used, remapped = np.unique(self.token_ids, return_inverse=True)
+        tokens = np.empty(len(self.vocab), dtype=object)
+        for token, token_id in self.vocab.items():
+            tokens[token_id] = token
+        self.vocab = {token: i for i, token in enumerate(tokens[used])}
+        self.token_ids = remapped.astype(np.int32).reshape(-1)
+
+        corpus_ids = np.split(self.token_ids, self.token_offsets[1:-1])
+        model = bm25s.BM25(k1=self.k1, b=self.b)
+        with span("bm25.index", chunks=len(corpus_ids)):
+            model.index((corpus_ids, dict(self.vocab)))
+        self.retriever = model
+        self.version = self._fingerprint()
 
-    def build_index(self, chunk_data: List[Dict]):
+    def _fingerprint(self) -> str:
+        """
+        Hash of everything search results depend on: tokens, vocab, chunk
+        spans and BM25 parameters.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        params = [self.k1, self.b, list(self.vocab), self.metadata.paths]
+        digest.update(json.dumps(params).encode("utf-8"))
+        for array in (self.token_ids, self.token_offsets):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        # Fixed dtype: the metadata arrays are int64 when built and packed
+        # when loaded
+        for array in (self.metadata.path_ids, self.metadata.starts,
+                      self.metadata.ends):
+            digest.update(
+                np.ascontiguousarray(array, dtype=np.int64).tobytes()
+            )
+        return digest.hexdigest()
+
+    def reindex(self, k1: float, b: float) -> None:
+        """
+        Rebuilds the BM25 matrices with new parameters, reusing the cached
+        token ids.
+        """
+        self.k1 = k1
+        self.b = b
+        self._index_tokens()
+
+    def build_index(self, chunk_data: List[Dict]) -> None:
         """
         Processes chunks and builds the BM25 index.
-        chunk_data is a list of dicts: {'content': str, 'metadata': MinimalSource}
-        """
-        self.corpus = [c['content'] for c in chunk_data]
-        self.metadata = [c['metadata'] for c in chunk_data]
-        
-        # Tokenize the corpus
-        # Using a stemmer helps "running" match with "run"
-        stemmer = Stemmer.Stemmer("english")
-        corpus_tokens = bm25s.tokenize(self.corpus, stemmer=stemmer)
-        
-        # Create and index the BM25 model
-        self.retriever = bm25s.BM25()
-        self.retriever.index(corpus_tokens)
-
-    def save(self, path: str):
+        chunk_data is a list of dicts:
+        {'content': str, 'metadata': MinimalSource}
+        """
+        self.rebuild_index([chunk_data])
+
+    def rebuild_index(self, segments: List[Union[range, List[Dict]]]) -> None:
+        """
+        Builds the BM25 index from a mix of previously indexed and new
+        chunks. Each segment is either a range of chunk ids of the loaded
+        index, reused with their cached token ids, or a list of new chunk
+        dicts, which get tokenized.
+        """
+        new_chunks = [c for segment in segments
+                      if not isinstance(segment, range) for c in segment]
+        new_ids, new_lengths = self._tokenize(
+            [c['content'] for c in new_chunks]
+        )
+        new_offsets = np.concatenate([[0], np.cumsum(new_lengths)])
+
+        corpus, metadata, id_parts, lengths = [], [], [], []
+        new_pos = 0
+        for segment in segments:
+            if isinstance(segment, range):
+                if not segment:
+                    continue
+                corpus.extend(self.corpus[segment.start:segment.stop])
+                metadata.append(self.metadata.select(segment.start,
+                                                     segment.stop))
+                start = self.token_offsets[segment.start]
+                end = self.token_offsets[segment.stop]
+                id_parts.append(self.token_ids[start:end])
+                lengths.append(np.diff(
+                    self.token_offsets[segment.start:segment.stop + 1]
+                ))
+            else:
+                count = len(segment)
+                corpus.extend(c['content'] for c in segment)
+                metadata.append(ChunkMetadata.from_sources(
+                    [c['metadata'] for c in segment]
+                ))
+                new_start = new_offsets[new_pos]
+                new_end = new_offsets[new_pos + count]
+                id_parts.append(new_ids[new_start:new_end])
+                lengths.append(new_lengths[new_pos:new_pos + count])
+                new_pos += count
+
+        self.corpus = corpus
+        self.metadata = ChunkMetadata.concat(metadata)
+        self.token_ids = np.zeros(0, dtype=np.int32)
+        if id_parts:
+            self.token_ids = np.concatenate(id_parts)
+        all_lengths = np.zeros(0, dtype=np.int64)
+        if lengths:
+            all_lengths = np.concatenate(lengths)
+        self.token_offsets = np.concatenate(
+            [[0], np.cumsum(all_lengths)]
+        ).astype(np.int64)
+        self._index_tokens()
+
+    def save(self, path: str) -> None:
         """Saves the index to disk for fast loading."""
         save_path = Path(path)
         save_path.mkdir(parents=True, exist_ok=True)
 
-        self.retriever.save(str(save_path), corpus=self.corpus)
-        metadata_path = save_path / "metadata.pkl"
-        with open(metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        if self.retriever is None:
+            raise ValueError("BM25 index not built. Call build_index() "
+                             "first.")
+        with span("bm25.save"):
+            self.retriever.save(str(save_path), corpus=self.corpus)
+        with span("metadata.save"):
+            self.metadata.save(str(save_path))
+
+        # Token ids are kept so an incremental index run can skip
+        # re-tokenizing unchanged files
+        np.save(save_path / "token_ids.npy", self.token_ids)
+        np.save(save_path / "token_offsets.npy", self.token_offsets)
+        with open(save_path / "token_vocab.json", "w", encoding="utf-8") as f:
+            json.dump(list(self.vocab), f)
+        with open(save_path / VERSION_NAME, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version}, f)
+
+    def load_for_update(self, directory: str) -> None:
+        """
+        Loads the chunks, metadata and cached token ids of a saved index,
+        without the BM25 matrices, ready for rebuild_index().
+        """
+        load_path = Path(directory)
+        with open(load_path / "corpus.jsonl", "r", encoding="utf-8") as f:
+            self.corpus = [json.loads(line)["text"] for line in f]
+        self.metadata = ChunkMetadata.load(directory)
+        self.token_ids = np.load(load_path / "token_ids.npy")
+        self.token_offsets = np.load(load_path / "token_offsets.npy")
+        with open(load_path / "token_vocab.json", "r", encoding="utf-8") as f:
+            self.vocab = {token: i for i, token in enumerate(json.load(f))}
 
-    def load(self, directory: str):
+    def load(self, directory: str, mmap: bool = True) -> None:
         """
-        Loads the index and metadata from disk
+        Loads the index and metadata from disk.
+        The chunk texts are not loaded (search only needs chunk ids), and with
+        mmap the score matrices and metadata arrays are memory-mapped instead
+        of read.
         """
 
-        self.retriever = bm25s.BM25.load(directory, load_corpus=True)
+        with span("bm25.load"):
+            self.retriever = bm25s.BM25.load(directory, load_corpus=False,
+                                             mmap=mmap)
+        with span("metadata.load"):
+            self.metadata = ChunkMetadata.load(directory, mmap=mmap)
+        self.version = self.read_version(directory)
 
-        metadata_path = Path(directory) / "metadata.pkl"
-        with open(metadata_path, "rb") as f:
-            self.metadata = pickle.load(f)
+    @staticmethod
+    def read_version(directory: str) -> Optional[str]:
+        """
+        Fingerprint of the index saved under directory; None for indexes
+        saved without one.
+        """
+        version_path = Path(directory) / VERSION_NAME
+        if not version_path.exists():
+            return None
+        with open(version_path, "r", encoding="utf-8") as f:
+            version: Optional[str] = json.load(f)["version"]
+        return version
 
-    def search(self, query: str, k: int = 5) -> List[MinimalSource]:
+    def search(self, query: str, k: int = 5) -> List["MinimalSource"]:
         """Performs search and returns the top-k sources."""
+        return self.search_batch([query], k=k)[0]
+
+    def search_ids(self, queries: List[str], k: int = 5,
+                   batch_size: int = 1024,
+                   n_threads: int = 0) -> List[List[int]]:
+        """
+        Searches many queries at once and returns the top-k chunk ids of
+        each, in order. Queries are tokenized and scored batch_size at a time,
+        optionally over n_threads threads.
+        """
         if not self.retriever:
-            raise ValueError("BM25 index not built or loaded. Call build_index() or load() first.")
-        stemmer = Stemmer.Stemmer("english")
-        query_tokens = bm25s.tokenize(query, stemmer=stemmer)
-        
-        # Get the top k results
-        results, _ = self.retriever.retrieve(query_tokens, k=k)
+            raise ValueError("BM25 index not built or loaded. "
+                             "Call build_index() or load() first.")
+        # Plain chunk ids are enough: looking up the stored corpus text of
+        # every hit is wasted work
+        chunk_ids = np.arange(len(self.metadata))
+        k = min(k, len(chunk_ids))
+
+        ids = []
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            with span("tokenize.query", queries=len(batch)):
+                query_tokens = bm25s.tokenize(
+                    batch, stemmer=self.stemmer, return_ids=False,
+                    show_progress=False,
+                )
+            ids.extend(self._retrieve_cached(query_tokens, chunk_ids, k,
+                                             n_threads))
+        return ids
+
+    def _retrieve_cached(self, query_tokens: List[List[str]],
+                         chunk_ids: np.ndarray, k: int,
+                         n_threads: int) -> List[List[int]]:
+        """
+        Scores only the queries missing from the cache (all of them without a
+        cache or a version). Only called once search_ids has checked that an
+        index is loaded.
+        """
+        assert self.retriever is not None
+        if self.cache is None or self.version is None:
+            with span("bm25.retrieve", queries=len(query_tokens)):
+                results, _ = self.retriever.retrieve(
+                    query_tokens, corpus=chunk_ids, k=k, n_threads=n_threads,
+                    show_progress=False,
+                )
+            all_ids: List[List[int]] = results.tolist()
+            return all_ids
+
+        self.cache.set_version(self.version)
+        keys = [self.cache.make_key(tokens, k) for tokens in query_tokens]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, ids in enumerate(cached) if ids is None]
+        scored: List[List[int]] = []
+        if missing:
+            with span("bm25.retrieve", queries=len(missing)):
+                results, _ = self.retriever.retrieve(
+                    [query_tokens[i] for i in missing], corpus=chunk_ids,
+                    k=k, n_threads=n_threads, show_progress=False,
+                )
+            scored = results.tolist()
+            self.cache.put_many([(keys[i], ids)
+                                 for i, ids in zip(missing, scored)])
+        # The misses are filled in order from the freshly scored results
+        fresh = iter(scored)
+        return [ids if ids is not None else next(fresh) for ids in cached]
+
+    def search_batch(
+        self, queries: List[str], k: int = 5, batch_size: int = 1024,
+        n_threads: int = 0,
+    ) -> List[List["MinimalSource"]]:
+        """
+        Searches many queries at once and returns the top-k sources of each,
+        in order.
+        """
+        ids = self.search_ids(queries, k=k, batch_size=batch_size,
+                              n_threads=n_threads)
         # Map the indices of the results back to our metadata
-        return [self.metadata[r["id"]] for r in results[0]]
\ No newline at end of file
+        with span("metadata.map", queries=len(ids)):
+            return [[self.metadata[i] for i in row] for row in ids]
@@ -0,0 +1,261 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from .models import MinimalSource
+from .query_cache import QueryCache
+from .retriever import BM25Retriever
+
+
+class LatencyStats:
+    """
+    Keeps the most recent latencies of each endpoint for percentile
+    reporting.
+    """
+
+    def __init__(self, window: int = 10000) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float,
+               error: bool = False) -> None:
+        """Failed requests count towards the latencies as well."""
+        with self._lock:
+            latencies = self._latencies.setdefault(
+                endpoint, deque(maxlen=self.window)
+            )
+            latencies.append(seconds)
+            self._counts[endpoint] = self._counts.get(endpoint, 0) + 1
+            if error:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            latencies = {endpoint: sorted(values)
+                         for endpoint, values in self._latencies.items()}
+            counts = dict(self._counts)
+            errors = dict(self._errors)
+        report = {}
+        for endpoint, values in latencies.items():
+            report[endpoint] = {
+                "count": counts[endpoint],
+                "errors": errors.get(endpoint, 0),
+                "p50_ms": _percentile(values, 0.50) * 1000,
+                "p99_ms": _percentile(values, 0.99) * 1000,
+                "mean_ms": sum(values) / len(values) * 1000,
+            }
+        return report
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+class _PendingQuery:
+    def __init__(self, query: str, k: int) -> None:
+        self.query = query
+        self.k = k
+        self.done = threading.Event()
+        self.sources: List[MinimalSource] = []
+        self.error: Optional[Exception] = None
+
+
+class QueryBatcher:
+    """
+    Collects queries arriving at the same time and scores them with one
+    search_batch call. A batch is closed after max_batch queries or
+    max_wait_ms after its first query.
+    """
+
+    def __init__(self, retriever: BM25Retriever, max_batch: int = 64,
+                 max_wait_ms: float = 2.0, n_threads: int = 0) -> None:
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.n_threads = n_threads
+        self.batches = 0
+        self.batched_queries = 0
+        self._queue: "queue.Queue[_PendingQuery]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def search(self, query: str, k: int) -> List[MinimalSource]:
+        pending = _PendingQuery(query, k)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.sources
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._search(batch)
+
+    def _search(self, batch: List[_PendingQuery]) -> None:
+        # Score once with the largest k, then trim each answer to its own k
+        max_k = max(pending.k for pending in batch)
+        try:
+            results = self.retriever.search_batch(
+                [pending.query for pending in batch], k=max_k,
+                n_threads=self.n_threads,
+            )
+            for pending, sources in zip(batch, results):
+                pending.sources = sources[:pending.k]
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        self.batches += 1
+        self.batched_queries += len(batch)
+        for pending in batch:
+            pending.done.set()
+
+
+class RagRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /search?query=...&k=10
+    POST /search  {"query": "...", "k": 10}
+    POST /answer  {"query": "...", "k": 10}
+    GET  /metrics
+    """
+    server: "RagServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._send_json(200, self.server.metrics())
+        elif url.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif url.path == "/search":
+            params = {key: values[0]
+                      for key, values in parse_qs(url.query).items()}
+            self._handle("search", params)
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {url.path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path not in ("/search", "/answer"):
+            self._send_json(404, {"error": f"Unknown endpoint: {url.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON body: {e}"})
+            return
+        if not isinstance(params, dict):
+            self._send_json(400, {"error": "JSON body must be an object"})
+            return
+        self._handle(url.path.lstrip("/"), params)
+
+    def _handle(self, endpoint: str, params: dict) -> None:
+        start = time.perf_counter()
+        answer_fn = self.server.answer_fn
+        if endpoint == "answer" and answer_fn is None:
+            self._send_json(404,
+                            {"error": "Answering is disabled on this server."})
+            return
+        try:
+            query = params.get("query")
+            if not query or not isinstance(query, str):
+                raise ValueError("Missing 'query'.")
+            k = int(params.get("k", 10))
+            if k <= 0:
+                raise ValueError("k must be positive.")
+        except (TypeError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            sources = self.server.batcher.search(query, k)
+            payload = {
+                "query": query,
+                "k": k,
+                "retrieved_sources": [source.model_dump()
+                                      for source in sources],
+            }
+            if endpoint == "answer" and answer_fn is not None:
+                payload["answer"] = answer_fn(query, sources)
+        except Exception as e:
+            self.server.stats.record(endpoint, time.perf_counter() - start,
+                                     error=True)
+            self._send_json(500, {"error": str(e)})
+            return
+        self.server.stats.record(endpoint, time.perf_counter() - start)
+        self._send_json(200, payload)
+
+
+class RagServer(ThreadingHTTPServer):
+    """
+    HTTP server answering search (and optionally answer) requests from a warm
+    retriever.
+    """
+    daemon_threads = True
+    # socketserver's default backlog of 5 refuses bursts of concurrent
+    # clients before their queries reach the batcher
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        retriever: BM25Retriever,
+        answer_fn: Optional[Callable[[str, List[MinimalSource]], str]] = None,
+        max_batch: int = 64,
+        max_wait_ms: float = 2.0,
+        n_threads: int = 0,
+        query_cache: Optional[QueryCache] = None,
+    ) -> None:
+        super().__init__(address, RagRequestHandler)
+        self.batcher = QueryBatcher(retriever, max_batch=max_batch,
+                                    max_wait_ms=max_wait_ms,
+                                    n_threads=n_threads)
+        self.answer_fn = answer_fn
+        self.query_cache = query_cache
+        self.stats = LatencyStats()
+
+    def metrics(self) -> dict:
+        batches = self.batcher.batches
+        metrics = {
+            "endpoints": self.stats.snapshot(),
+            "batches": batches,
+            "mean_batch_size": (self.batcher.batched_queries / batches
+                                if batches else 0.0),
+        }
+        if self.query_cache is not None:
+            metrics["query_cache"] = {
+                "hits": self.query_cache.hits,
+                "misses": self.query_cache.misses,
+                "hit_rate": self.query_cache.hit_rate,
+            }
+        return metrics
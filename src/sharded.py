@@ -0,0 +1,412 @@
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import bm25s
+import numpy as np
+import scipy.sparse as sp
+from bm25s.scoring import (
+    _build_idf_array, _build_scores_and_indices_for_matrix,
+    _select_idf_scorer,
+)
+from .metadata import ChunkMetadata
+from .models import MinimalSource
+from .retriever import BM25Retriever
+from .stemmer import get_stemmer
+from .tracing import span
+
+SHARDS_NAME = "shards.json"
+SHARD_BY = ("chunks", "directory")
+
+
+class ShardBM25(bm25s.BM25):
+    """
+    BM25 over one shard, scored with collection-wide statistics (document
+    count, average length and document frequencies) so that the scores of
+    different shards are comparable and can be merged directly.
+    doc_frequencies is aligned with the token ids passed to index().
+    """
+
+    def __init__(self, doc_frequencies: np.ndarray, n_docs: int,
+                 avg_doc_len: float, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        if self.method in self.methods_requiring_nonoccurrence:
+            raise ValueError(
+                f"Sharded indexes do not support the {self.method} method."
+            )
+        self.global_doc_frequencies = doc_frequencies
+        self.global_n_docs = n_docs
+        self.global_avg_doc_len = avg_doc_len
+
+    def build_index_from_ids(
+        self, unique_token_ids: Any, corpus_token_ids: Any,
+        show_progress: bool = True, leave_progress: bool = False,
+    ) -> Dict[str, Any]:
+        idf_array = _build_idf_array(
+            doc_frequencies={
+                token_id: int(self.global_doc_frequencies[token_id])
+                for token_id in unique_token_ids
+            },
+            n_docs=self.global_n_docs,
+            compute_idf_fn=_select_idf_scorer(self.idf_method),
+            dtype=self.dtype,
+        )
+        # Only the IDF uses collection-wide frequencies; bm25s sizes its
+        # buffers from the shard's own
+        lengths = [len(ids) for ids in corpus_token_ids]
+        doc_ids = np.repeat(np.arange(len(corpus_token_ids), dtype=np.int64),
+                            lengths)
+        flat = np.zeros(0, dtype=np.int64)
+        if corpus_token_ids:
+            flat = np.concatenate(corpus_token_ids).astype(np.int64)
+        n_tokens = len(unique_token_ids)
+        pairs = np.unique(doc_ids * n_tokens + flat)
+        local_frequencies = np.bincount(pairs % n_tokens, minlength=n_tokens)
+        (scores_flat, doc_idx,
+         vocab_idx) = _build_scores_and_indices_for_matrix(
+            corpus_token_ids=corpus_token_ids,
+            idf_array=idf_array,
+            avg_doc_len=self.global_avg_doc_len,
+            doc_frequencies={token_id: int(local_frequencies[token_id])
+                             for token_id in unique_token_ids},
+            k1=self.k1,
+            b=self.b,
+            delta=self.delta,
+            show_progress=show_progress,
+            leave_progress=leave_progress,
+            dtype=self.dtype,
+            int_dtype=self.int_dtype,
+            method=self.method,
+            nonoccurrence_array=None,
+        )
+        matrix = sp.csc_matrix(
+            (scores_flat, (doc_idx, vocab_idx)),
+            shape=(len(corpus_token_ids), len(unique_token_ids)),
+            dtype=self.dtype,
+        )
+        self.nonoccurrence_array = None
+        return {"data": matrix.data, "indices": matrix.indices,
+                "indptr": matrix.indptr, "num_docs": len(corpus_token_ids)}
+
+
+def _build_shard_model(token_ids: np.ndarray, offsets: np.ndarray,
+                       tokens: np.ndarray, doc_frequencies: np.ndarray,
+                       n_docs: int, avg_doc_len: float, k1: float,
+                       b: float) -> ShardBM25:
+    """
+    BM25 over the documents token_ids[offsets[i]:offsets[i + 1]], with a
+    vocabulary of the tokens they use.
+    """
+    used, local_ids = np.unique(token_ids, return_inverse=True)
+    local_ids = local_ids.astype(np.int32).reshape(-1)
+    model = ShardBM25(doc_frequencies[used], n_docs, avg_doc_len, k1=k1, b=b)
+    vocab = {token: i for i, token in enumerate(tokens[used])}
+    model.index((np.split(local_ids, offsets[1:-1]), vocab),
+                show_progress=False)
+    return model
+
+
+@lru_cache(maxsize=None)
+def check_shard_scoring(k1: float = 1.5, b: float = 0.75) -> None:
+    """
+    ShardBM25 relies on private bm25s helpers: build a tiny corpus as one
+    index and as two shards and check that every document gets the same
+    score, so that a bm25s upgrade which changes those helpers fails here
+    instead of scoring shards wrongly. Runs once per (k1, b) and process.
+    """
+    corpus = [
+        "the scheduler batches requests",
+        "requests are batched by the scheduler before decoding",
+        "the tokenizer splits text into tokens",
+        "decoding streams tokens to the client",
+        "batched decoding shares the kv cache",
+    ]
+    queries = [
+        ["scheduler", "batches"], ["tokens", "decoding", "cache"],
+        ["missing"],
+    ]
+    tokenized = bm25s.tokenize(corpus, stopwords=None, show_progress=False)
+    single = bm25s.BM25(k1=k1, b=b)
+    single.index(tokenized, show_progress=False)
+
+    tokens = np.empty(len(tokenized.vocab), dtype=object)
+    for token, token_id in tokenized.vocab.items():
+        tokens[token_id] = token
+    doc_frequencies = np.zeros(len(tokens), dtype=np.int64)
+    for ids in tokenized.ids:
+        doc_frequencies[np.unique(ids)] += 1
+    lengths = [len(ids) for ids in tokenized.ids]
+    avg_doc_len = sum(lengths) / len(lengths)
+
+    for shard in (range(0, 2), range(2, len(corpus))):
+        ids = [np.asarray(tokenized.ids[i], dtype=np.int64) for i in shard]
+        offsets = np.concatenate(
+            [[0], np.cumsum([len(i) for i in ids])]
+        ).astype(np.int64)
+        model = _build_shard_model(np.concatenate(ids), offsets, tokens,
+                                   doc_frequencies, len(corpus), avg_doc_len,
+                                   k1, b)
+        for query in queries:
+            expected = single.get_scores(query)[shard.start:shard.stop]
+            if not np.allclose(_shard_scores(model, query), expected,
+                               rtol=1e-4, atol=1e-6):
+                raise RuntimeError(
+                    f"bm25s {bm25s.__version__} scores a sharded index "
+                    f"differently from a single index; install a bm25s "
+                    f"version within the range pinned in pyproject.toml."
+                )
+
+
+def _shard_scores(model: bm25s.BM25,
+                  query_tokens: List[str]) -> np.ndarray:
+    """
+    Score of every document of the shard; zeros when no query token is in
+    its vocabulary.
+    """
+    ids = model.get_tokens_ids(query_tokens)
+    if not ids:
+        return np.zeros(model.scores["num_docs"], dtype=np.float32)
+    scores: np.ndarray = model.get_scores_from_ids(ids)
+    return scores
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, ties broken by the lower index."""
+    if k < len(scores):
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    top: np.ndarray = candidates[
+        np.lexsort((candidates, -scores[candidates]))
+    ][:k]
+    return top
+
+
+class ShardedIndexBuilder:
+    """
+    Builds a sharded index in two passes so memory is bounded by one shard:
+    1. chunks are tokenized shard by shard into a shared vocabulary; each
+       shard's token ids, texts and metadata go to disk while the document
+       frequencies, document count and total length of the whole collection
+       are accumulated,
+    2. each shard's BM25 matrix is built from its token ids with those global
+       statistics.
+    Shards hold shard_size chunks ("chunks"), or one top-level directory of a
+    repository each ("directory").
+    """
+
+    def __init__(self, directory: str, shard_by: str = "chunks",
+                 shard_size: int = 50000, k1: float = 1.5,
+                 b: float = 0.75) -> None:
+        if shard_by not in SHARD_BY:
+            raise ValueError(f"shard_by must be one of {SHARD_BY}.")
+        if shard_size < 1:
+            raise ValueError("shard_size must be >= 1.")
+        self.directory = Path(directory)
+        self.shard_by = shard_by
+        self.shard_size = shard_size
+        self.k1 = k1
+        self.b = b
+        check_shard_scoring(k1, b)
+        # Only the tokenizer and its growing vocabulary are used
+        self.tokenizer = BM25Retriever()
+        self.doc_frequencies: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.n_docs = 0
+        self.total_length = 0
+        self.shards: List[dict] = []
+        self._pending: List[dict] = []
+        self._pending_key: Optional[str] = None
+        # Shards of a previous build would otherwise outlive a smaller rebuild
+        for old_shard in self.directory.glob("shard_*"):
+            shutil.rmtree(old_shard)
+
+    def add(self, chunks: Iterable[dict], key: str = "") -> None:
+        """
+        Adds the chunks of one file; key is its shard key in "directory"
+        mode.
+        """
+        if (self.shard_by == "directory" and self._pending
+                and key != self._pending_key):
+            self._flush()
+        self._pending_key = key
+        self._pending.extend(chunks)
+        if (self.shard_by == "chunks"
+                and len(self._pending) >= self.shard_size):
+            self._flush()
+
+    def _flush(self) -> None:
+        """
+        Pass 1 for the pending chunks: tokenize, update the global statistics
+        and stage them on disk.
+        """
+        if not self._pending:
+            return
+        chunks, self._pending = self._pending, []
+        token_ids, lengths = self.tokenizer._tokenize(
+            [c["content"] for c in chunks]
+        )
+
+        vocab_size = len(self.tokenizer.vocab)
+        if len(self.doc_frequencies) < vocab_size:
+            missing = vocab_size - len(self.doc_frequencies)
+            self.doc_frequencies = np.concatenate(
+                [self.doc_frequencies, np.zeros(missing, dtype=np.int64)]
+            )
+        # Each (document, token) pair counts once towards the document
+        # frequency
+        doc_ids = np.repeat(np.arange(len(chunks), dtype=np.int64), lengths)
+        pairs = np.unique(doc_ids * vocab_size + token_ids)
+        self.doc_frequencies += np.bincount(pairs % vocab_size,
+                                            minlength=vocab_size)
+        self.n_docs += len(chunks)
+        self.total_length += int(lengths.sum())
+
+        name = f"shard_{len(self.shards):04d}"
+        shard_dir = self.directory / name
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        # Same layout as bm25s writes, so the shard can be read by
+        # JsonlCorpus / ChunkStore
+        with open(shard_dir / "corpus.jsonl", "w", encoding="utf-8") as f:
+            for i, chunk in enumerate(chunks):
+                record = {"id": i, "text": chunk["content"]}
+                f.write(json.dumps(record) + "\n")
+        metadata = ChunkMetadata.from_sources([c["metadata"] for c in chunks])
+        metadata.save(str(shard_dir))
+        np.save(shard_dir / "token_ids.npy", token_ids)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        np.save(shard_dir / "token_offsets.npy", offsets)
+        self.shards.append({"name": name, "key": self._pending_key or "",
+                            "chunks": len(chunks)})
+
+    def finish(self) -> dict:
+        """
+        Pass 2: builds and saves every shard's BM25 matrix, then writes the
+        shard list.
+        """
+        self._flush()
+        avg_doc_len = self.total_length / self.n_docs if self.n_docs else 0.0
+        tokens = np.empty(len(self.tokenizer.vocab), dtype=object)
+        for token, token_id in self.tokenizer.vocab.items():
+            tokens[token_id] = token
+
+        for shard in self.shards:
+            shard_dir = self.directory / shard["name"]
+            token_ids = np.load(shard_dir / "token_ids.npy")
+            offsets = np.load(shard_dir / "token_offsets.npy")
+            # Shard-local vocabulary: only the tokens this shard contains
+            model = _build_shard_model(token_ids, offsets, tokens,
+                                       self.doc_frequencies, self.n_docs,
+                                       avg_doc_len, self.k1, self.b)
+            model.save(str(shard_dir))
+            # The token ids were only needed to build the matrix
+            (shard_dir / "token_ids.npy").unlink()
+            (shard_dir / "token_offsets.npy").unlink()
+
+        layout = {
+            "k1": self.k1,
+            "b": self.b,
+            "shard_by": self.shard_by,
+            "n_docs": self.n_docs,
+            "avg_doc_len": avg_doc_len,
+            "vocab_size": len(self.tokenizer.vocab),
+            "shards": self.shards,
+        }
+        with open(self.directory / SHARDS_NAME, "w", encoding="utf-8") as f:
+            json.dump(layout, f, indent=4)
+        return layout
+
+
+class ShardedRetriever:
+    """
+    Searches every shard in parallel and merges the per-shard top-k into a
+    global top-k. Shard scores share the same statistics, so they are merged
+    as is. Same search/search_batch contract as BM25Retriever.
+    """
+
+    def __init__(self, n_threads: int = 0) -> None:
+        self.n_threads = n_threads
+        self.shards: List[Tuple[bm25s.BM25, ChunkMetadata]] = []
+
+    def load(self, directory: str, mmap: bool = True) -> None:
+        with open(Path(directory) / SHARDS_NAME, "r", encoding="utf-8") as f:
+            layout = json.load(f)
+        self.shards = []
+        for shard in layout["shards"]:
+            shard_dir = str(Path(directory) / shard["name"])
+            self.shards.append((
+                bm25s.BM25.load(shard_dir, load_corpus=False, mmap=mmap),
+                ChunkMetadata.load(shard_dir, mmap=mmap),
+            ))
+
+    def __len__(self) -> int:
+        return sum(len(metadata) for _, metadata in self.shards)
+
+    @staticmethod
+    def _search_shard(
+        shard: Tuple[bm25s.BM25, ChunkMetadata],
+        query_tokens: List[List[str]], k: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per-query top-k local ids and scores of one shard, ties broken by
+        chunk id.
+        """
+        model, metadata = shard
+        k = min(k, len(metadata))
+        ids = np.empty((len(query_tokens), k), dtype=np.int64)
+        scores = np.empty((len(query_tokens), k), dtype=np.float32)
+        with span("bm25.retrieve", queries=len(query_tokens),
+                  chunks=len(metadata)):
+            for row, tokens in enumerate(query_tokens):
+                shard_scores = _shard_scores(model, tokens)
+                ids[row] = _top_k(shard_scores, k)
+                scores[row] = shard_scores[ids[row]]
+        return ids, scores
+
+    def search(self, query: str, k: int = 5) -> List[MinimalSource]:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(
+        self, queries: List[str], k: int = 5, batch_size: int = 1024,
+        n_threads: int = 0,
+    ) -> List[List[MinimalSource]]:
+        if not self.shards:
+            raise ValueError("Sharded index not loaded. Call load() first.")
+        workers = (n_threads or self.n_threads
+                   or min(len(self.shards), os.cpu_count() or 1))
+        first_ids = np.cumsum(
+            [0] + [len(metadata) for _, metadata in self.shards]
+        )
+        sources: List[List[MinimalSource]] = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for start in range(0, len(queries), batch_size):
+                query_tokens = bm25s.tokenize(
+                    queries[start:start + batch_size], stemmer=get_stemmer(),
+                    return_ids=False, show_progress=False,
+                )
+                per_shard = list(executor.map(
+                    lambda shard: self._search_shard(shard, query_tokens, k),
+                    self.shards,
+                ))
+                # (query, candidate) matrices over all shards, candidates in
+                # shard order
+                scores = np.concatenate([s for _, s in per_shard], axis=1)
+                shard_of = np.concatenate([
+                    np.full(ids.shape[1], i)
+                    for i, (ids, _) in enumerate(per_shard)
+                ])
+                local_ids = np.concatenate([ids for ids, _ in per_shard],
+                                           axis=1)
+                # Highest score first, equal scores by global chunk id, as a
+                # single index would order them
+                global_ids = local_ids + first_ids[shard_of]
+                top = np.lexsort((global_ids, -scores), axis=1)[:, :k]
+                for row, candidates in enumerate(top):
+                    sources.append([
+                        self.shards[shard_of[c]][1][local_ids[row, c]]
+                        for c in candidates
+                    ])
+        return sources
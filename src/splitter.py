@@ -0,0 +1,117 @@
+import re
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
+
+Span = Tuple[int, int]
+
+
+class SpanSplitter:
+    """
+    Recursive character splitter following the rules of LangChain's
+    RecursiveCharacterTextSplitter (separators kept at the start of each
+    piece, whitespace stripped), but working on (start, end) spans of the
+    original text. Offsets come out of the splitting itself, so they are
+    exact and no search over the content is needed.
+    """
+
+    def __init__(self, separators: List[str], chunk_size: int,
+                 chunk_overlap: int, is_separator_regex: bool = False):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                "chunk_overlap must not be larger than chunk_size."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators
+        self._patterns = [
+            re.compile(s if is_separator_regex else re.escape(s))
+            for s in separators
+        ]
+
+    @classmethod
+    def from_language(cls, language: Language, chunk_size: int,
+                      chunk_overlap: int) -> "SpanSplitter":
+        splitter = RecursiveCharacterTextSplitter
+        separators = splitter.get_separators_for_language(language)
+        return cls(separators, chunk_size, chunk_overlap,
+                   is_separator_regex=True)
+
+    def split_spans(self, text: str) -> List[Span]:
+        """Returns the (start, end) character offsets of every chunk."""
+        return self._split(text, 0, len(text), 0)
+
+    def _split(self, text: str, start: int, end: int,
+               level: int) -> List[Span]:
+        # Pick the first separator present in text[start:end]
+        sep_index = len(self.separators) - 1
+        has_next = False
+        for i in range(level, len(self.separators)):
+            if not self.separators[i]:
+                sep_index = i
+                break
+            if self._patterns[i].search(text, start, end):
+                sep_index = i
+                has_next = i + 1 < len(self.separators)
+                break
+
+        if self.separators[sep_index]:
+            cuts = [start]
+            pattern = self._patterns[sep_index]
+            cuts.extend(m.start() for m in pattern.finditer(text, start, end))
+            cuts.append(end)
+            pieces = [(a, b) for a, b in zip(cuts, cuts[1:]) if b > a]
+        else:
+            pieces = [(p, p + 1) for p in range(start, end)]
+
+        # Merge small pieces, recursively splitting pieces that are too long
+        final_spans: List[Span] = []
+        good_pieces: List[Span] = []
+        for a, b in pieces:
+            if b - a < self.chunk_size:
+                good_pieces.append((a, b))
+                continue
+            if good_pieces:
+                final_spans.extend(self._merge(text, good_pieces))
+                good_pieces = []
+            if has_next:
+                final_spans.extend(self._split(text, a, b, sep_index + 1))
+            else:
+                final_spans.append((a, b))
+        if good_pieces:
+            final_spans.extend(self._merge(text, good_pieces))
+        return final_spans
+
+    def _merge(self, text: str, pieces: List[Span]) -> List[Span]:
+        """Combines contiguous pieces into chunks of up to chunk_size,
+        with overlap."""
+        spans: List[Span] = []
+        current: Deque[Span] = deque()
+        total = 0
+        for a, b in pieces:
+            length = b - a
+            if total + length > self.chunk_size and current:
+                stripped = self._strip(text, current[0][0], current[-1][1])
+                if stripped is not None:
+                    spans.append(stripped)
+                # Drop pieces from the front until only the overlap is left
+                while total > self.chunk_overlap or (
+                    total + length > self.chunk_size and total > 0
+                ):
+                    first_a, first_b = current.popleft()
+                    total -= first_b - first_a
+            current.append((a, b))
+            total += length
+        if current:
+            stripped = self._strip(text, current[0][0], current[-1][1])
+            if stripped is not None:
+                spans.append(stripped)
+        return spans
+
+    @staticmethod
+    def _strip(text: str, start: int, end: int) -> Optional[Span]:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return (start, end) if end > start else None
@@ -0,0 +1,137 @@
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+# "import time: self [us] | cumulative | imported package", indented by
+# nesting depth
+IMPORTTIME_LINE = re.compile(
+    r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$"
+)
+# Slow dependencies that only the commands using them may import
+HEAVY_MODULES = ("langchain_text_splitters", "ollama", "httpx")
+# Must run without them: () is a bare `import src.main`, anything else a CLI
+# command line
+LIGHT_COMMANDS = ((), ("search", "--help"), ("search_dataset", "--help"))
+MODULES_MARKER = "loaded modules: "
+
+# Runs in a fresh interpreter: argv[1] is the command line (JSON), argv[2] the
+# modules to look for
+_PROBE = f"""
+import json, runpy, sys
+args, modules = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+if args:
+    sys.argv = ["src", *args]
+    try:
+        runpy.run_module("src", run_name="__main__", alter_sys=True)
+    except SystemExit:
+        pass
+else:
+    import src.main
+loaded = [m for m in modules if m in sys.modules]
+sys.stderr.write({MODULES_MARKER!r} + json.dumps(loaded) + "\\n")
+"""
+
+
+class ImportRow(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportRow]:
+    """
+    Rows of `python -X importtime` output, in the order Python reports them
+    (children first).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append(ImportRow(module, int(self_us), int(cumulative_us),
+                                  (len(indent) - 1) // 2))
+    return rows
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # The package may not be installed: make `-m src` importable from its
+    # checkout
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package_root, env.get("PYTHONPATH")])
+    )
+    return env
+
+
+def loaded_modules(args: Sequence[str],
+                   modules: Sequence[str] = HEAVY_MODULES) -> List[str]:
+    """
+    Which of `modules` a fresh interpreter has imported after
+    `python -m src <args>` (or a bare `import src.main` when args is empty).
+    Needs no index or data.
+    """
+    process = subprocess.run(
+        [sys.executable, "-c", _PROBE,
+         json.dumps(list(args)), json.dumps(list(modules))],
+        env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True,
+    )
+    for line in process.stderr.splitlines():
+        if line.startswith(MODULES_MARKER):
+            loaded: List[str] = json.loads(line[len(MODULES_MARKER):])
+            return loaded
+    command = shlex.join(args) or "import src.main"
+    raise RuntimeError(f"Could not run {command}:\n{process.stderr}")
+
+
+def run_command(
+    args: Sequence[str],
+) -> Tuple[float, List[ImportRow], int, str]:
+    """
+    Runs `python -X importtime -m src <args>` in a fresh interpreter.
+    Returns the wall time in seconds, the import rows, the exit code and the
+    command's stderr without the import lines.
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "src", *args],
+        env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    rows = parse_importtime(process.stderr)
+    errors = "\n".join(line for line in process.stderr.splitlines()
+                       if not IMPORTTIME_LINE.match(line))
+    return wall, rows, process.returncode, errors
+
+
+def top_imports(rows: List[ImportRow], top: int = 15) -> List[ImportRow]:
+    """
+    The slowest top-level imports (those not imported by another module), by
+    cumulative time.
+    """
+    return sorted((row for row in rows if row.depth == 0),
+                  key=lambda row: -row.cumulative_us)[:top]
+
+
+def format_report(args: Sequence[str], wall: float, rows: List[ImportRow],
+                  top: int = 15) -> str:
+    total_us = sum(row.cumulative_us for row in rows if row.depth == 0)
+    lines = [
+        f"Command: python -m src {shlex.join(args)}",
+        f"Wall time: {wall * 1000:.0f} ms | imports: "
+        f"{total_us / 1000:.0f} ms over {len(rows)} modules",
+        f"{'cumulative ms':>14} {'self ms':>8}  module",
+    ]
+    for row in top_imports(rows, top):
+        lines.append(f"{row.cumulative_us / 1000:>14.1f} "
+                     f"{row.self_us / 1000:>8.1f}  {row.module}")
+    return "\n".join(lines)
@@ -0,0 +1,22 @@
+import threading
+import Stemmer
+
+# Stems memoised per stemmer; large enough for the vocabulary
+# of a big repository
+STEM_CACHE_SIZE = 100_000
+
+_local = threading.local()
+
+
+def get_stemmer() -> Stemmer.Stemmer:
+    """
+    The English stemmer shared by the tokenizer, the context packer and
+    the reranker. One instance per thread (stemmer objects are not
+    thread-safe), each with a memo cache so repeated tokens are only
+    stemmed once.
+    """
+    stemmer = getattr(_local, "stemmer", None)
+    if stemmer is None:
+        stemmer = Stemmer.Stemmer("english", STEM_CACHE_SIZE)
+        _local.stemmer = stemmer
+    return stemmer
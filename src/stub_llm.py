@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from typing import Any, Dict, Tuple
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST /api/generate like Ollama would, with a canned response
+    (streamed if asked).
+    """
+    server: "StubOllamaServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.server.should_fail():
+            self._send_json(503, {"error": "stub failure"})
+            return
+
+        start = time.perf_counter()
+        # Prefill: the fixed delay stands for prompt processing
+        time.sleep(self.server.delay)
+        prefill_ns = int((time.perf_counter() - start) * 1e9)
+        prompt_tokens = len(request.get("prompt", "").split())
+        tokens = [token + " " for token in self.server.answer.split()]
+        model = request.get("model", "stub")
+
+        if not request.get("stream", False):
+            decode_start = time.perf_counter()
+            time.sleep(self.server.token_delay * len(tokens))
+            decode_ns = int((time.perf_counter() - decode_start) * 1e9)
+            self._send_json(200, self._final(
+                model, "".join(tokens), prompt_tokens, len(tokens),
+                prefill_ns, decode_ns, start,
+            ))
+            return
+
+        # Streaming: one JSON object per line, the connection closes after
+        # the last one
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        decode_start = time.perf_counter()
+        for token in tokens:
+            self._write_line({"model": model, "created_at": self._now(),
+                              "response": token, "done": False})
+            time.sleep(self.server.token_delay)
+        decode_ns = int((time.perf_counter() - decode_start) * 1e9)
+        self._write_line(self._final(model, "", prompt_tokens, len(tokens),
+                                     prefill_ns, decode_ns, start))
+
+    def _write_line(self, payload: Dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(payload).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def _final(self, model: str, response: str, prompt_tokens: int,
+               eval_count: int, prefill_ns: int, decode_ns: int,
+               start: float) -> Dict[str, Any]:
+        return {
+            "model": model,
+            "created_at": self._now(),
+            "response": response,
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((time.perf_counter() - start) * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": prefill_ns,
+            "eval_count": eval_count,
+            "eval_duration": decode_ns,
+        }
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    """
+    Local stand-in for an Ollama server: every generate request sleeps delay_ms
+    (prefill), then produces the words of `answer` token_delay_ms apart.
+    The first fail_first requests get a 503, to exercise retries.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+        delay_ms: float = 100.0,
+        answer: str = "Stub answer.",
+        fail_first: int = 0,
+        token_delay_ms: float = 0.0,
+    ) -> None:
+        super().__init__(address, StubOllamaHandler)
+        self.delay = delay_ms / 1000
+        self.token_delay = token_delay_ms / 1000
+        self.answer = answer
+        self._failures_left = fail_first
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            if self._failures_left > 0:
+                self._failures_left -= 1
+                return True
+            return False
+
+    def start(self) -> "StubOllamaServer":
+        """Serves from a background thread; returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,206 @@
+import contextlib
+import io
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from .chunker import RepositoryChunker
+from .ingest import IngestionPipeline
+from .retriever import BM25Retriever
+
+# Gate used by the moulinette to accept search results
+MIN_RECALL_AT_5 = 0.75
+
+# Shared by the worker processes, set once by the pool initializer
+_worker_files: List[Tuple[str, str]] = []
+_worker_questions: List[dict] = []
+
+
+class SweepRow(NamedTuple):
+    chunk_size: int
+    chunk_overlap: int
+    k1: float
+    b: float
+    chunks: int
+    index_mb: float
+    chunk_s: float
+    build_s: float
+    query_ms: float
+    recall: Dict[str, float]
+
+
+def read_repository(repo_path: str) -> List[Tuple[str, str]]:
+    """
+    Reads every indexable file once, so all configurations chunk the same
+    contents.
+    """
+    files = []
+    pipeline = IngestionPipeline(RepositoryChunker())
+    for file_path, _, _ in pipeline.discover(Path(repo_path)):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                files.append((file_path, f.read()))
+        except Exception as e:
+            print(f"Skipping {file_path}: {e}")
+    return files
+
+
+def _init_worker(files: List[Tuple[str, str]], questions: List[dict]) -> None:
+    global _worker_files, _worker_questions
+    _worker_files = files
+    _worker_questions = questions
+
+
+def _directory_size(directory: str) -> int:
+    return sum(entry.stat().st_size for entry in Path(directory).iterdir()
+               if entry.is_file())
+
+
+def _recall(retriever: BM25Retriever,
+            k_values: Sequence[int]) -> Tuple[Dict[str, float], float]:
+    """
+    Searches every dataset question, returns the moulinette recall@k and the
+    ms per query.
+    """
+    from moulinette.evaluate_retrieval import calculate_recall_at_k_on_dataset
+    from moulinette.models import RagDataset, StudentSearchResults
+
+    k = max(k_values)
+    start = time.perf_counter()
+    results = retriever.search_batch(
+        [q["question"] for q in _worker_questions], k=k
+    )
+    query_ms = ((time.perf_counter() - start) * 1000
+                / max(1, len(_worker_questions)))
+
+    student = StudentSearchResults.model_validate({
+        "k": k,
+        "search_results": [
+            {
+                "question_id": q["question_id"],
+                "question": q["question"],
+                "retrieved_sources": [source.model_dump()
+                                      for source in sources],
+            }
+            for q, sources in zip(_worker_questions, results)
+        ],
+    })
+    dataset = RagDataset.model_validate({"rag_questions": _worker_questions})
+    # The evaluation prints a full report per call; keep the sweep output to
+    # the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Annotated as float by the moulinette, but it returns
+        # {"recall@k": value}
+        recall: Any = calculate_recall_at_k_on_dataset(
+            student,
+            dataset,
+            minimal_iou_threshold=0.01,
+            k_values=list(k_values),
+        )
+    return recall, query_ms
+
+
+def _sweep_chunking(chunk_size: int, chunk_overlap: int,
+                    bm25_grid: List[Tuple[float, float]],
+                    k_values: Sequence[int]) -> List[SweepRow]:
+    """
+    Evaluates one chunking configuration: the files are chunked and
+    tokenized once, then only the BM25 matrices are rebuilt for each (k1, b).
+    """
+    chunker = RepositoryChunker(chunk_size=chunk_size,
+                                chunk_overlap=chunk_overlap)
+    start = time.perf_counter()
+    chunks = [chunk for file_path, content in _worker_files
+              for chunk in chunker.chunk_file(file_path, content)]
+    chunk_s = time.perf_counter() - start
+
+    retriever = BM25Retriever(k1=bm25_grid[0][0], b=bm25_grid[0][1])
+    rows = []
+    for i, (k1, b) in enumerate(bm25_grid):
+        start = time.perf_counter()
+        if i == 0:
+            retriever.build_index(chunks)
+        else:
+            retriever.reindex(k1, b)
+        build_s = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            retriever.save(directory)
+            index_mb = _directory_size(directory) / 1e6
+
+        recall, query_ms = _recall(retriever, k_values)
+        rows.append(SweepRow(chunk_size, chunk_overlap, k1, b, len(chunks),
+                             index_mb, chunk_s, build_s, query_ms, recall))
+    return rows
+
+
+def run_sweep(
+    repo_path: str,
+    questions: List[dict],
+    chunk_sizes: Sequence[int],
+    overlaps: Sequence[float],
+    k1s: Sequence[float],
+    bs: Sequence[float],
+    k_values: Sequence[int] = (1, 3, 5, 10),
+    workers: int = 0,
+) -> List[SweepRow]:
+    """
+    Builds and evaluates an index for every combination of the grid.
+    Overlaps are fractions of the chunk size. Each chunking configuration
+    runs in its own process; the repository is read only once, in this
+    process.
+    """
+    files = read_repository(repo_path)
+    print(f"Read {len(files)} files, {len(questions)} questions with "
+          f"sources")
+
+    chunk_grid = [(size, int(size * overlap)) for size, overlap
+                  in itertools.product(chunk_sizes, overlaps)]
+    bm25_grid = list(itertools.product(k1s, bs))
+    workers = workers or min(len(chunk_grid), os.cpu_count() or 1)
+
+    rows: List[SweepRow] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(files, questions)) as executor:
+        futures = [executor.submit(_sweep_chunking, size, overlap, bm25_grid,
+                                   tuple(k_values))
+                   for size, overlap in chunk_grid]
+        for future in futures:
+            rows.extend(future.result())
+    return rows
+
+
+def pick_fastest(rows: List[SweepRow],
+                 min_recall: float = MIN_RECALL_AT_5) -> Optional[SweepRow]:
+    """
+    The configuration with the lowest query latency among those clearing
+    recall@5 >= min_recall.
+    """
+    passing = [row for row in rows
+               if row.recall.get("recall@5", 0.0) >= min_recall]
+    if not passing:
+        return None
+    return min(passing, key=lambda row: (row.query_ms, row.index_mb))
+
+
+def format_table(rows: List[SweepRow],
+                 best: Optional[SweepRow] = None) -> str:
+    recall_keys = list(rows[0].recall) if rows else []
+    header = (f"  {'size':>5} {'overlap':>7} {'k1':>5} {'b':>5} "
+              f"{'chunks':>7} {'index MB':>9} "
+              f"{'chunk s':>8} {'build s':>8} {'ms/query':>9} "
+              + " ".join(f"{key:>9}" for key in recall_keys))
+    lines = [header]
+    for row in rows:
+        marker = "*" if row is best else " "
+        lines.append(f"{marker} {row.chunk_size:>5} {row.chunk_overlap:>7} "
+                     f"{row.k1:>5.2f} {row.b:>5.2f} "
+                     f"{row.chunks:>7} {row.index_mb:>9.2f} "
+                     f"{row.chunk_s:>8.2f} {row.build_s:>8.2f} "
+                     f"{row.query_ms:>9.3f} "
+                     + " ".join(f"{row.recall[key]:>9.3f}"
+                                for key in recall_keys))
+    return "\n".join(lines)
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# Events beyond this are only aggregated, so long runs keep a bounded trace
+MAX_EVENTS = 1_000_000
+
+_enabled = False
+_lock = threading.Lock()
+_events: List[dict] = []
+# name -> [count, total ns, max ns]
+_stats: Dict[str, List[int]] = {}
+_origin_ns = 0
+
+
+class _NullSpan:
+    """
+    Returned by span() while tracing is off: entering and leaving it does
+    nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: dict) -> None:
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        end = time.perf_counter_ns()
+        duration = end - self.start
+        with _lock:
+            stats = _stats.get(self.name)
+            if stats is None:
+                _stats[self.name] = [1, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                if duration > stats[2]:
+                    stats[2] = duration
+            if len(_events) < MAX_EVENTS:
+                event = {
+                    "name": self.name,
+                    "ph": "X",
+                    "ts": (self.start - _origin_ns) / 1000,
+                    "dur": duration / 1000,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                }
+                if self.args:
+                    event["args"] = self.args
+                _events.append(event)
+
+
+def span(name: str, **args: Any) -> Union[_NullSpan, _Span]:
+    """
+    Context manager timing a named stage. While tracing is disabled this is
+    one global check and a shared no-op object, so it can stay on hot paths.
+    Spans inside worker processes are not collected.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def enable() -> None:
+    """Starts recording spans, discarding anything recorded before."""
+    global _enabled, _origin_ns
+    with _lock:
+        _events.clear()
+        _stats.clear()
+        _origin_ns = time.perf_counter_ns()
+        _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def save_chrome_trace(path: str) -> None:
+    """
+    Writes the recorded spans in the Chrome trace event format
+    (chrome://tracing, Perfetto).
+    """
+    save_path = Path(path)
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        trace = {"traceEvents": list(_events), "displayTimeUnit": "ms"}
+    with open(save_path, "w", encoding="utf-8") as f:
+        json.dump(trace, f)
+
+
+def stage_table(wall_s: Optional[float] = None) -> str:
+    """
+    Per-span count, total, mean and max time, slowest total first; share of
+    wall_s when given.
+    """
+    with _lock:
+        rows = sorted(_stats.items(), key=lambda item: -item[1][1])
+    header = (f"{'span':<24} {'count':>8} {'total ms':>10} {'mean ms':>9} "
+              f"{'max ms':>9}")
+    lines = [header + (f" {'% wall':>7}" if wall_s else "")]
+    for name, (count, total_ns, max_ns) in rows:
+        line = (f"{name:<24} {count:>8} {total_ns / 1e6:>10.1f} "
+                f"{total_ns / count / 1e6:>9.3f} {max_ns / 1e6:>9.3f}")
+        if wall_s:
+            line += f" {total_ns / 1e9 / wall_s * 100:>6.1f}%"
+        lines.append(line)
+    if wall_s and any(total_ns / 1e9 > wall_s
+                      for _, (_, total_ns, _) in rows):
+        lines.append("(spans running on several threads at once can add up "
+                     "to more than 100% of the wall time)")
+    if len(_events) >= MAX_EVENTS:
+        lines.append(f"(trace file truncated to the first {MAX_EVENTS} "
+                     f"spans; the table counts all of them)")
+    return "\n".join(lines)